@@ -1,89 +1,252 @@
+import importlib
 import sys
 import os
+import tarfile
+import time
+import zipfile
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Flask, send_from_directory, request, jsonify
+# First, so the startup report's import phase covers everything below
+from backend.startup import STARTUP_MODE, STARTUP_MODES, StartupReport, startup_report, warm_up
+from flask import Blueprint, Flask, current_app, send_from_directory, request, jsonify
 from flask_cors import CORS
-from backend.routes import register_routes, training_progress
+from backend import instrumentation
+from backend.routes import register_routes
+from backend.lifecycle import lifecycle
+from backend.static_assets import StaticAssets
+from backend.uploads import StreamingRequest, as_incoming, UPLOAD_DIR, MAX_UPLOAD_SIZE
+from backend.dataset_store import dataset_store, DEFAULT_PAGE_SIZE
+from backend.dicom_metadata import read_dicom_header, InvalidDicomError, FILTER_FIELDS
+from backend.ingest import ingest, iter_upload_entries
+from backend.npy_inspect import cached_inspect, InspectError, DEFAULT_PREVIEW_SIZE
+from backend.explanations import explanation_service
+from backend.model_config_store import model_config_store
+from backend.script_generator import load_template
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-import pydicom
 
 # Load environment variables from .env file
 load_dotenv()
 
+startup_report.record('import', time.perf_counter() - startup_report.started)
+
 # Example: Accessing a variable
 secret_key = os.getenv("SECRET_KEY")
 
 ALLOWED_EXTENSIONS = {'npy', 'png', 'dcm'}
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '../uploads')
+UPLOAD_FOLDER = UPLOAD_DIR
+STATIC_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '../frontend/build'))
+
+# Dataset upload and frontend routes, registered on each app by create_app
+main = Blueprint('main', __name__)
+
+
+def create_app(config=None):
+    """
+    Application factory: a configured app with every route registered.
+    Production servers load it through ``backend.wsgi``; see gunicorn.conf.py.
+    The first app's phases go into the process's startup report.
+    """
+    if STARTUP_MODE not in STARTUP_MODES:
+        raise ValueError(f"STARTUP_MODE must be one of {', '.join(STARTUP_MODES)}")
+    report = startup_report if not startup_report.finished else StartupReport(time.perf_counter())
+    # The React build is served by the routes below rather than Flask's static view
+    app = Flask(__name__, static_folder=None, template_folder="templates")
+    CORS(app)
+    # Stream multipart file parts straight to disk instead of spooling them first
+    app.request_class = StreamingRequest
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_UPLOAD_SIZE'] = MAX_UPLOAD_SIZE
+    # Reject oversized requests from their Content-Length before reading the body
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+    app.config['STATIC_FOLDER'] = STATIC_FOLDER
+    if config:
+        app.config.update(config)
+    assets = StaticAssets(app.config['STATIC_FOLDER'])
+    with report.phase('static_assets'):
+        assets.scan()
+    app.extensions['static_assets'] = assets
+    # Before the lifecycle hooks, so refused requests are counted too
+    with report.phase('instrumentation'):
+        instrumentation.init_app(app)
+    with report.phase('routes'):
+        register_routes(app)
+        app.register_blueprint(main)
+    # Refuse new uploads and jobs while shutting down, and wait for those in flight
+    lifecycle.init_app(app)
+    if STARTUP_MODE == 'eager':
+        # What lazy mode leaves to the first request that needs it
+        warm_up([
+            ('model_config_store', model_config_store.warm_up),
+            ('dataset_store', dataset_store.get_all),
+            ('script_template', load_template),
+            ('pydicom', lambda: importlib.import_module('pydicom')),
+            ('requests', lambda: explanation_service.session),
+        ], report)
+    if not report.finished:
+        report.finished = True
+        app.logger.info("Startup in %.3f s:\n%s", report.as_dict()['total'], report.format())
+        for name, seconds in report.phases:
+            instrumentation.startup_seconds.set(seconds, phase=name)
+    app.extensions['startup_report'] = report
+    return app
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), '../frontend/build'), template_folder="templates")
-CORS(app)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-register_routes(app)
 
-# In-memory training progress (for demo; in production, use a better store)
-# from backend.routes import training_progress
+def static_assets():
+    """Manifest of the React build, scanned when the app was created."""
+    return current_app.extensions['static_assets']
 
 # Serve favicon.ico from React build or public directory
-@app.route('/favicon.ico')
+@main.route('/favicon.ico')
 def favicon():
-    build_favicon = os.path.join(app.static_folder, 'favicon.ico')
+    response = static_assets().response('favicon.ico')
+    if response is not None:
+        return response
     public_favicon = os.path.join(os.path.dirname(__file__), '../../frontend/public/favicon.ico')
-    if os.path.exists(build_favicon):
-        return send_from_directory(app.static_folder, 'favicon.ico')
-    elif os.path.exists(public_favicon):
+    if os.path.exists(public_favicon):
         return send_from_directory(os.path.dirname(public_favicon), 'favicon.ico')
-    else:
-        return '', 404
+    return '', 404
 
 # Serve static files and manifest from React build
-@app.route('/static/<path:filename>')
+@main.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(os.path.join(app.static_folder, 'static'), filename)
+    return static_assets().response(f'static/{filename}') or ('', 404)
 
-@app.route('/manifest.json')
+@main.route('/manifest.json')
 def serve_manifest():
-    return send_from_directory(app.static_folder, 'manifest.json')
+    return static_assets().response('manifest.json') or ('', 404)
 
-@app.route('/robots.txt')
+@main.route('/robots.txt')
 def serve_robots():
-    return send_from_directory(app.static_folder, 'robots.txt')
+    return static_assets().response('robots.txt') or ('', 404)
 
 # Serve React frontend (index.html) for all other routes
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+@main.route('/', defaults={'path': ''})
+@main.route('/<path:path>')
 def serve_react(path):
-    static_file = os.path.normpath(os.path.join(app.static_folder, path))
-    if path != "" and static_file.startswith(app.static_folder) and os.path.exists(static_file):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, 'index.html')
+    # Only names in the manifest are served, so paths can't escape the build directory
+    assets = static_assets()
+    response = (assets.response(path) if path else None) or assets.index_response()
+    return response or ('', 404)
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/api/upload-dataset', methods=['POST'])
+def dataset_response(saved):
+    body = {key: saved[key] for key in ('size', 'sha256', 'deduplicated')}
+    for key in ('previous_sha256', 'metadata'):
+        if key in saved:
+            body[key] = saved[key]
+    return body
+
+@main.route('/api/upload-dataset', methods=['POST'])
 def upload_dataset():
     if 'file' not in request.files:
         return jsonify({'message': 'No file part'}), 400
     file = request.files['file']
     if file.filename == '':
+        file.close()
         return jsonify({'message': 'No selected file'}), 400
-    if not allowed_file(file.filename):
-        return jsonify({'message': 'Invalid file type'}), 400
+    # Checked on the name that is stored (e.g. '../.npy' is stored as 'npy')
     filename = secure_filename(file.filename)
-    save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(save_path)
-    # Optionally, validate DICOM file
+    if not filename or dataset_store.is_reserved(filename):
+        file.close()
+        return jsonify({'message': 'Invalid file name'}), 400
+    if not allowed_file(filename):
+        file.close()
+        return jsonify({'message': 'Invalid file type'}), 400
+    incoming = as_incoming(file)
+    incoming.flush()
+    # Validate DICOM headers (pixel data is not read) before the file enters the dataset store
+    metadata = None
     if filename.lower().endswith('.dcm'):
         try:
-            pydicom.dcmread(save_path)
-        except Exception:
-            os.remove(save_path)
+            metadata = read_dicom_header(incoming.path)
+        except InvalidDicomError:
+            incoming.close()
             return jsonify({'message': 'Invalid DICOM file'}), 400
-    return jsonify({'message': 'File uploaded successfully'}), 200
+    info = incoming.detach()
+    saved = dataset_store.add_file(info['path'], filename, info['size'], info['sha256'], metadata)
+    return jsonify({'message': 'File uploaded successfully', **dataset_response(saved)}), 200
+
+@main.route('/api/upload-dataset/bulk', methods=['POST'])
+def upload_dataset_bulk():
+    """
+    Ingest many files at once: several multipart parts named ``files`` (or
+    ``file``) and/or zip/tar archives of them, e.g. a whole DICOM series.
+    Returns per-file results and the stored files grouped by series.
+    """
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'message': 'No file part'}), 400
+    try:
+        report = ingest(iter_upload_entries(files), dataset_store, allowed_file)
+    except (zipfile.BadZipFile, tarfile.TarError, ValueError):
+        return jsonify({'message': 'Invalid archive'}), 400
+    return jsonify({'message': 'Files processed', **report}), 200
+
+@main.route('/api/datasets/by-hash', methods=['POST'])
+def upload_dataset_by_hash():
+    """
+    Pre-upload check: if content with this SHA-256 is already stored, record it
+    under ``filename`` so the client can skip the transfer.
+    JSON body: { filename: string, sha256: string }
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not isinstance(data.get('sha256'), str):
+        return jsonify({'message': 'filename and sha256 are required'}), 400
+    if not allowed_file(filename):
+        return jsonify({'message': 'Invalid file type'}), 400
+    saved = dataset_store.link_existing(filename, data['sha256'])
+    if saved is None:
+        return jsonify({'message': 'Unknown content, upload required'}), 404
+    return jsonify({'message': 'File uploaded successfully', **dataset_response(saved)}), 200
+
+@main.route('/api/datasets', methods=['GET'])
+def list_datasets():
+    """
+    Query params: patient_id, study_instance_uid, series_instance_uid, modality
+    (exact-match filters on indexed DICOM metadata), cursor (last name of the
+    previous page), limit.
+    Returns: { items: [{name, sha256, size, uploaded_at, metadata?}], next_cursor }
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    filters = {field: request.args.get(field) for field in FILTER_FIELDS}
+    items, next_cursor = dataset_store.query(cursor=request.args.get('cursor'), limit=limit, **filters)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@main.route('/api/datasets/<name>/inspect', methods=['GET'])
+def inspect_dataset(name):
+    """
+    Shape, dtype, per-channel min/max/mean/std and a downsampled slice preview
+    of a stored .npy dataset, computed without loading it into memory.
+    Query params: channel_axis, slice_axis, slice_index, preview_size (ints).
+    """
+    record = dataset_store.get(name)
+    if record is None:
+        return jsonify({'message': 'Dataset not found'}), 404
+    if not name.lower().endswith('.npy'):
+        return jsonify({'message': 'Only .npy datasets can be inspected'}), 400
+    try:
+        params = {
+            'channel_axis': request.args.get('channel_axis', type=int),
+            'slice_axis': request.args.get('slice_axis', 0, type=int),
+            'slice_index': request.args.get('slice_index', type=int),
+            'preview_size': request.args.get('preview_size', DEFAULT_PREVIEW_SIZE, type=int),
+        }
+        result = cached_inspect(dataset_store.blob_path(record['sha256']), **params)
+    except InspectError as e:
+        return jsonify({'message': str(e)}), 422
+    return jsonify({'name': name, 'sha256': record['sha256'], **result})
+
+app = create_app()
 
 if __name__ == "__main__":
+    # Development server; see gunicorn.conf.py for production serving
+    lifecycle.install_signal_handlers()
     app.run()
@@ -0,0 +1,148 @@
+# benchmarks
+"""
+Offline benchmarks for the backend hot paths.
+
+    python -m backend.benchmarks [--scale quick|default|full] [--only PATTERN]
+                                 [--output results.json] [--baseline baseline.json]
+
+Each suite module registers generator functions with ``@benchmark``; they
+yield ``measurement(...)`` dicts. A run is written as JSON (``meta`` plus
+``results`` keyed by measurement name), and ``--baseline`` compares it with an
+earlier run's file, exiting with status 1 if any measurement got worse by
+more than ``--threshold``. Everything runs locally in temporary directories;
+the explanation upstream is a stub HTTP server on localhost.
+"""
+import fnmatch
+import importlib
+import os
+import platform
+import sys
+import time
+
+SUITES = ('store', 'uploads', 'dicom', 'explanations', 'startup')
+
+# Scale -> data sizes the suites use
+SCALES = {
+    'quick': {'config_counts': (1000,), 'upload_mb': (16,), 'dicom_files': 50, 'terms': 50},
+    'default': {'config_counts': (1000, 10000, 100000), 'upload_mb': (100,), 'dicom_files': 200, 'terms': 200},
+    'full': {'config_counts': (1000, 10000, 100000), 'upload_mb': (100, 500, 2048), 'dicom_files': 1000,
+             'terms': 500},
+}
+
+DEFAULT_THRESHOLD = 0.15
+
+HIGHER = 'higher'
+LOWER = 'lower'
+
+BENCHMARKS = []
+
+
+def benchmark(function):
+    """Register a suite function ``function(params)`` that yields measurements."""
+    BENCHMARKS.append(function)
+    return function
+
+
+def measurement(name, value, unit, better=HIGHER, min_delta=0):
+    """One result; changes smaller than ``min_delta`` (in ``unit``) are never flagged."""
+    return {'name': name, 'value': value, 'unit': unit, 'better': better, 'min_delta': min_delta}
+
+
+def rate(count, seconds):
+    return count / seconds if seconds > 0 else float('inf')
+
+
+class Timer:
+    """``with Timer() as t: ...`` then ``t.seconds``."""
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+
+
+def load_suites():
+    for suite in SUITES:
+        importlib.import_module(f'backend.benchmarks.{suite}')
+
+
+def run(patterns=None, scale='default', log=None):
+    """
+    Run the registered benchmarks whose measurement names match any of the
+    glob ``patterns`` (all if empty). Returns ``{'meta', 'results'}``.
+    """
+    load_suites()
+    params = SCALES[scale]
+    results = {}
+    for function in BENCHMARKS:
+        for result in function(params, patterns or ()):
+            if patterns and not matches(result['name'], patterns):
+                continue
+            results[result['name']] = {key: result[key] for key in ('value', 'unit', 'better', 'min_delta')}
+            if log is not None:
+                log(f"{result['name']}: {result['value']:.6g} {result['unit']}")
+    meta = {
+        'scale': scale,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started_at': time.time(),
+        'argv': sys.argv[1:],
+    }
+    return {'meta': meta, 'results': results}
+
+
+def matches(name, patterns):
+    # Exact names too, since their brackets would be read as glob character sets
+    return any(name == pattern or fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def wanted(patterns, *names):
+    """Whether a suite should run the part producing ``names`` (saves setup for filtered runs)."""
+    return not patterns or any(matches(name, patterns) for name in names)
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Rows of ``(name, baseline, current, change, status)`` for every measurement
+    in either run. ``change`` is the relative improvement (negative when
+    worse); status is ``regressed``, ``improved``, ``ok``, ``new`` or ``missing``.
+    """
+    rows = []
+    current, previous = results['results'], baseline['results']
+    for name in sorted(set(current) | set(previous)):
+        if name not in previous:
+            rows.append((name, None, current[name]['value'], None, 'new'))
+            continue
+        if name not in current:
+            rows.append((name, previous[name]['value'], None, None, 'missing'))
+            continue
+        before, after = previous[name]['value'], current[name]['value']
+        if before == 0:
+            change = 0.0 if after == 0 else float('inf')
+        else:
+            change = (after - before) / abs(before)
+        if current[name]['better'] == LOWER:
+            change = -change
+        if abs(after - before) <= current[name].get('min_delta', 0):
+            status = 'ok'
+        elif change < -threshold:
+            status = 'regressed'
+        elif change > threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, before, after, change, status))
+    return rows
+
+
+def format_rows(rows):
+    lines = [f"{'benchmark':48} {'baseline':>12} {'current':>12} {'change':>8}  status"]
+    for name, before, after, change, status in rows:
+        before = '-' if before is None else f'{before:.4g}'
+        after = '-' if after is None else f'{after:.4g}'
+        change = '-' if change is None else f'{change:+.1%}'
+        lines.append(f"{name:48} {before:>12} {after:>12} {change:>8}  {status}")
+    return '\n'.join(lines)
@@ -0,0 +1,38 @@
+import argparse
+import json
+import sys
+
+from backend.benchmarks import DEFAULT_THRESHOLD, SCALES, compare, format_rows, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backend.benchmarks', description="Run the offline backend benchmarks.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='default',
+                        help="data sizes: quick for a smoke run, full adds 500 MB and 2 GB uploads")
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help="run measurements matching this glob, e.g. 'config_add*' (repeatable)")
+    parser.add_argument('--output', help="write results JSON here instead of stdout")
+    parser.add_argument('--baseline', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change counted as a regression (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.scale, log=lambda line: print(line, file=sys.stderr))
+    body = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(body + '\n')
+    else:
+        print(body)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(results, json.load(f), args.threshold)
+        print(format_rows(rows), file=sys.stderr)
+        if any(status == 'regressed' for *_, status in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# dicom.py
+"""DICOM header validation, per file and through bulk ingestion."""
+import os
+import shutil
+import tempfile
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from backend.benchmarks import LOWER, Timer, benchmark, measurement, rate, wanted
+from backend.dataset_store import DatasetStore
+from backend.dicom_metadata import read_dicom_header
+from backend.ingest import ingest
+from backend.uploads import IncomingFile
+
+SLICE_SIZE = 256
+
+
+def write_slice(path, series_uid, instance_number):
+    """A CT slice of ``SLICE_SIZE``² 16-bit pixels, like a typical upload."""
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.PatientID = 'BENCH'
+    ds.StudyInstanceUID = '1.2.3'
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = 'CT'
+    ds.InstanceNumber = instance_number
+    ds.Rows = ds.Columns = SLICE_SIZE
+    ds.PixelSpacing = [0.5, 0.5]
+    ds.SliceThickness = 1.0
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.PixelRepresentation = 0
+    ds.PixelData = b'\0\1' * SLICE_SIZE * SLICE_SIZE
+    ds.save_as(path, enforce_file_format=True)
+
+
+@benchmark
+def dicom(params, patterns):
+    count = params['dicom_files']
+    header_name, ingest_name = 'dicom_header', f'dicom_ingest[{count} files]'
+    if not wanted(patterns, header_name, ingest_name):
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        series_uid = generate_uid()
+        paths = [os.path.join(tmp, f'IM{i:05d}.dcm') for i in range(count)]
+        for i, path in enumerate(paths):
+            write_slice(path, series_uid, i)
+
+        with Timer() as t:
+            for path in paths:
+                read_dicom_header(path)
+        yield measurement(header_name, t.seconds / count, 's/file', LOWER)
+
+        store = DatasetStore(os.path.join(tmp, 'store'))
+        partial = os.path.join(tmp, 'store', '.partial')
+        entries = []
+        for path in paths:
+            incoming = IncomingFile(partial)
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, incoming)
+            entries.append((os.path.basename(path), incoming))
+        with Timer() as t:
+            report = ingest(entries, store, lambda name: name.endswith('.dcm'))
+        assert report['summary']['ok'] == count, report['summary']
+        yield measurement(ingest_name, rate(count, t.seconds), 'files/s')
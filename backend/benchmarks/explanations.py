@@ -0,0 +1,82 @@
+# explanations.py
+"""Explanation lookups against a stub upstream served on localhost."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.benchmarks import LOWER, Timer, benchmark, measurement, rate, wanted
+from backend.explanations import MAX_BULK_TERMS, ExplanationService
+
+# Simulated upstream response time
+UPSTREAM_DELAY = 0.005
+HOT_LOOKUPS = 10000
+GLOSSARY_TERMS = ('Adam', 'SGD', 'CrossEntropy', 'UNet', 'learning rate', 'batch size', 'epochs', 'dropout')
+
+
+class StubUpstream(BaseHTTPRequestHandler):
+    """Summary API stand-in: ``missing_*`` terms are 404s, everything else a summary."""
+
+    def do_GET(self):
+        time.sleep(UPSTREAM_DELAY)
+        term = self.path.rsplit('/', 1)[-1]
+        if term.startswith('missing_'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({'extract': f'Summary of {term}.'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@benchmark
+def explanations(params, patterns):
+    count = params['terms']
+    names = ('explanation_cold', 'explanation_hot', 'explanation_negative', 'explanation_bulk',
+             'explanation_glossary')
+    if not wanted(patterns, *names):
+        return
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/summary/{{term}}'
+    try:
+        service = ExplanationService(url=url, cache_db=None, use_bundled_glossary=False)
+        terms = [f'term_{i}' for i in range(count)]
+
+        with Timer() as t:
+            for term in terms:
+                service.lookup(term)
+        yield measurement('explanation_cold', rate(count, t.seconds), 'lookups/s')
+
+        with Timer() as t:
+            for i in range(HOT_LOOKUPS):
+                service.lookup(terms[i % count])
+        yield measurement('explanation_hot', rate(HOT_LOOKUPS, t.seconds), 'lookups/s')
+
+        missing = [f'missing_{i}' for i in range(count)]
+        for term in missing:
+            service.lookup(term)
+        with Timer() as t:
+            for i in range(HOT_LOOKUPS):
+                service.lookup(missing[i % count])
+        yield measurement('explanation_negative', rate(HOT_LOOKUPS, t.seconds), 'lookups/s')
+
+        bulk = [f'bulk_{i}' for i in range(MAX_BULK_TERMS)]
+        with Timer() as t:
+            service.lookup_many(bulk)
+        yield measurement(f'explanation_bulk[{MAX_BULK_TERMS} terms]', t.seconds, 's', LOWER)
+
+        glossary = ExplanationService(url=url, cache_db=None)
+        with Timer() as t:
+            for i in range(HOT_LOOKUPS):
+                glossary.lookup(GLOSSARY_TERMS[i % len(GLOSSARY_TERMS)])
+        yield measurement('explanation_glossary', rate(HOT_LOOKUPS, t.seconds), 'lookups/s')
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,39 @@
+# startup.py
+"""Cold start: importing and creating the app in a fresh interpreter, lazy and eager."""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from backend.benchmarks import LOWER, benchmark, measurement, wanted
+
+# Interpreter start-up jitter, not a regression
+NOISE_SECONDS = 0.05
+RUNS = 3
+
+
+def cold_start(mode, root):
+    """Fastest of ``RUNS`` reports of ``python -m backend.startup`` in ``mode``."""
+    env = dict(os.environ, STARTUP_MODE=mode, UPLOAD_DIR=os.path.join(root, 'uploads'),
+               JOBS_DIR=os.path.join(root, 'jobs'), METRICS_MULTIPROC_DIR='')
+    reports = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, '-m', 'backend.startup', '--json'], env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        reports.append(json.loads(output.splitlines()[-1]))
+    return min(reports, key=lambda report: report['wall'])
+
+
+@benchmark
+def startup(params, patterns):
+    for mode in ('lazy', 'eager'):
+        name = f'startup[{mode}]'
+        if not wanted(patterns, name, f'{name}.import'):
+            continue
+        with tempfile.TemporaryDirectory() as root:
+            report = cold_start(mode, root)
+        yield measurement(name, report['wall'], 's', LOWER, min_delta=NOISE_SECONDS)
+        phases = {phase['name']: phase['seconds'] for phase in report['phases']}
+        yield measurement(f'{name}.import', phases['import'], 's', LOWER, min_delta=NOISE_SECONDS)
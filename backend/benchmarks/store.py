@@ -0,0 +1,189 @@
+# store.py
+"""Model config store: submission throughput by store size, and concurrent writers."""
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from backend.benchmarks import LOWER, Timer, benchmark, measurement, rate, wanted
+from backend.model_config_store import ModelConfigStore
+from backend.parameter_options import MODEL_TYPES, OPTIMIZERS
+from backend.script_generator import config_key
+
+PREFILL_BATCH = 1000
+OPERATIONS = 500
+WRITER_THREADS = 8
+WRITER_PROCESSES = 4
+WRITES_PER_WRITER = 250
+BATCH_CONFIGS = 5000
+
+
+def make_config(i):
+    """The ``i``-th of an endless supply of distinct, valid configs."""
+    return {
+        'model_type': MODEL_TYPES[i % len(MODEL_TYPES)],
+        'hyperparameters': {
+            'seed': i,
+            'batch_size': 16 * (1 + i % 4),
+            'optimizer': OPTIMIZERS[i % len(OPTIMIZERS)],
+        },
+    }
+
+
+def open_store(path):
+    # Deduplicating, like the app's store
+    store = ModelConfigStore(file_path=path, dedupe_key=config_key)
+    store.load_from_file()
+    return store
+
+
+def prefill(store, count):
+    for start in range(0, count, PREFILL_BATCH):
+        store.add_many([make_config(i) for i in range(start, min(count, start + PREFILL_BATCH))])
+
+
+@benchmark
+def store_size(params, patterns):
+    for count in params['config_counts']:
+        names = [f'{kind}[{count}]' for kind in (
+            'config_add', 'config_add_duplicate', 'config_get', 'config_query', 'config_open', 'config_submit_http',
+            'config_submit_batch_http',
+        )]
+        if not wanted(patterns, *names):
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'configs.jsonl')
+            store = open_store(path)
+            prefill(store, count)
+            rng = random.Random(count)
+
+            with Timer() as t:
+                for i in range(count, count + OPERATIONS):
+                    store.add(make_config(i))
+            yield measurement(f'config_add[{count}]', rate(OPERATIONS, t.seconds), 'ops/s')
+
+            with Timer() as t:
+                for _ in range(OPERATIONS):
+                    store.add(make_config(rng.randrange(count)))
+            yield measurement(f'config_add_duplicate[{count}]', rate(OPERATIONS, t.seconds), 'ops/s')
+
+            with Timer() as t:
+                for _ in range(OPERATIONS):
+                    store.get(rng.randrange(1, count + 1))
+            yield measurement(f'config_get[{count}]', rate(OPERATIONS, t.seconds), 'ops/s')
+
+            store.query(model_type=MODEL_TYPES[0], limit=1)  # builds the field index
+            with Timer() as t:
+                for _ in range(OPERATIONS // 5):
+                    store.query(model_type=rng.choice(MODEL_TYPES), cursor=rng.randrange(count), limit=50)
+            yield measurement(f'config_query[{count}]', rate(OPERATIONS // 5, t.seconds), 'ops/s')
+
+            store.close()
+            with Timer() as t:
+                store = open_store(path)
+                store.add(make_config(count + OPERATIONS))
+            yield measurement(f'config_open[{count}]', t.seconds, 's', LOWER)
+
+            if wanted(patterns, f'config_submit_http[{count}]'):
+                yield measurement(
+                    f'config_submit_http[{count}]', submit_over_http(store, count + OPERATIONS + 1), 'req/s',
+                )
+            if wanted(patterns, f'config_submit_batch_http[{count}]'):
+                yield measurement(
+                    f'config_submit_batch_http[{count}]', submit_batch_over_http(store, count + 2 * OPERATIONS + 1),
+                    'configs/s',
+                )
+            store.close()
+
+
+@contextmanager
+def app_client(store):
+    """Test client of the app with its routes using ``store``."""
+    import backend.routes
+    from backend.app import create_app
+
+    app = create_app({'TESTING': True})
+    saved = backend.routes.model_config_store
+    backend.routes.model_config_store = store
+    try:
+        with app.test_client() as client:
+            yield client
+    finally:
+        backend.routes.model_config_store = saved
+
+
+def submit_over_http(store, first):
+    """POST /api/modelconfig throughput (validation, JSON and the store), against ``store``."""
+    with app_client(store) as client:
+        with Timer() as t:
+            for i in range(first, first + OPERATIONS):
+                response = client.post('/api/modelconfig', json=make_config(i))
+                assert response.status_code == 201, response.get_data(as_text=True)
+    return rate(OPERATIONS, t.seconds)
+
+
+def submit_batch_over_http(store, first):
+    """Configs per second stored by one POST /api/modelconfig/batch of ``BATCH_CONFIGS``."""
+    configs = [make_config(i) for i in range(first, first + BATCH_CONFIGS)]
+    with app_client(store) as client:
+        with Timer() as t:
+            response = client.post('/api/modelconfig/batch', json={'configs': configs})
+        assert response.status_code == 201 and response.json['created'] == BATCH_CONFIGS, response.get_data(as_text=True)
+    return rate(BATCH_CONFIGS, t.seconds)
+
+
+def _write_batch(path, first, count):
+    store = open_store(path)
+    try:
+        for i in range(first, first + count):
+            store.add(make_config(i))
+    finally:
+        store.close()
+
+
+@benchmark
+def concurrent_writers(params, patterns):
+    threads_name = f'config_add_concurrent[threads={WRITER_THREADS}]'
+    processes_name = f'config_add_concurrent[processes={WRITER_PROCESSES}]'
+    if wanted(patterns, threads_name):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = open_store(os.path.join(tmp, 'configs.jsonl'))
+
+            def write(first):
+                for i in range(first, first + WRITES_PER_WRITER):
+                    store.add(make_config(i))
+
+            threads = [
+                threading.Thread(target=write, args=(n * WRITES_PER_WRITER,)) for n in range(WRITER_THREADS)
+            ]
+            with Timer() as t:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            assert store.count() == WRITER_THREADS * WRITES_PER_WRITER
+            store.close()
+        yield measurement(threads_name, rate(WRITER_THREADS * WRITES_PER_WRITER, t.seconds), 'ops/s')
+
+    if wanted(patterns, processes_name):
+        # Separate stores on one log, as with several server workers
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'configs.jsonl')
+            open_store(path).close()
+            context = multiprocessing.get_context('spawn')
+            workers = [
+                context.Process(target=_write_batch, args=(path, n * WRITES_PER_WRITER, WRITES_PER_WRITER))
+                for n in range(WRITER_PROCESSES)
+            ]
+            with Timer() as t:
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            store = open_store(path)
+            assert store.count() == WRITER_PROCESSES * WRITES_PER_WRITER
+            store.close()
+        # Includes interpreter start-up of the workers, so compare only against itself
+        yield measurement(processes_name, rate(WRITER_PROCESSES * WRITES_PER_WRITER, t.seconds), 'ops/s')
@@ -0,0 +1,143 @@
+# uploads.py
+"""
+Upload throughput and peak memory, multipart and resumable.
+
+Each upload runs in a fresh (spawned) interpreter so its peak RSS isn't
+masked by earlier benchmarks; upload data is generated on the fly.
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import traceback
+
+from backend.benchmarks import LOWER, Timer, benchmark, measurement, rate, wanted
+
+MB = 1024 * 1024
+RESUMABLE_CHUNK = 8 * MB
+BOUNDARY = 'deepbuilder-benchmark-boundary'
+# RSS differences below this are allocator noise, not regressions
+RSS_NOISE_MB = 16
+
+
+class PatternStream:
+    """Seekable stream of ``size`` generated bytes between ``prefix`` and ``suffix``, never all in memory."""
+
+    _BLOCK = bytes(range(256)) * (MB // 256)
+
+    def __init__(self, size, prefix=b'', suffix=b''):
+        self._prefix, self._suffix = prefix, suffix
+        self._body_end = len(prefix) + size
+        self.length = self._body_end + len(suffix)
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self.length}[whence]
+        self._position = max(0, min(self.length, base + offset))
+        return self._position
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = MB
+        position = self._position
+        if position < len(self._prefix):
+            data = self._prefix[position:position + n]
+        elif position < self._body_end:
+            start = (position - len(self._prefix)) % len(self._BLOCK)
+            data = self._BLOCK[start:start + min(n, self._body_end - position)]
+        else:
+            data = self._suffix[position - self._body_end:position - self._body_end + n]
+        self._position += len(data)
+        return data
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (MB if sys.platform == 'darwin' else 1024)
+
+
+def _upload(kind, size, root, results):
+    """Child process: upload ``size`` bytes one way, report MB/s and memory."""
+    try:
+        results.put(_measure_upload(kind, size, root))
+    except BaseException:
+        results.put(traceback.format_exc())
+        raise
+
+
+def _measure_upload(kind, size, root):
+    os.environ['UPLOAD_DIR'] = root
+    from flask import Flask, jsonify, request
+    from backend.dataset_store import DatasetStore
+    from backend.uploads import ResumableUploads, StreamingRequest, as_incoming
+
+    store = DatasetStore(root)
+    app = Flask(__name__)
+    app.request_class = StreamingRequest
+    app.config['MAX_UPLOAD_SIZE'] = app.config['MAX_CONTENT_LENGTH'] = size + MB
+    uploads = ResumableUploads(os.path.join(root, '.partial'), max_size=size + MB)
+
+    @app.post('/multipart')
+    def multipart():
+        info = as_incoming(request.files['file']).detach()
+        return jsonify(store.add_file(info['path'], 'data.npy', info['size'], info['sha256']))
+
+    @app.patch('/resumable/<upload_id>')
+    def append(upload_id):
+        offset = int(request.headers['Upload-Offset'])
+        return jsonify({'offset': uploads.append(upload_id, offset, request.stream)})
+
+    client = app.test_client()
+    baseline = _peak_rss_mb()
+    with Timer() as t:
+        if kind == 'multipart':
+            prefix = (
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="data.npy"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n'
+            ).encode()
+            body = PatternStream(size, prefix, f'\r\n--{BOUNDARY}--\r\n'.encode())
+            response = client.post(
+                '/multipart', input_stream=body, content_length=body.length,
+                content_type=f'multipart/form-data; boundary={BOUNDARY}',
+            )
+            assert response.status_code == 200, response.get_data(as_text=True)
+        else:
+            upload_id = uploads.create('data.npy', size)['upload_id']
+            offset = 0
+            while offset < size:
+                chunk = min(RESUMABLE_CHUNK, size - offset)
+                response = client.patch(
+                    f'/resumable/{upload_id}', input_stream=PatternStream(chunk), content_length=chunk,
+                    headers={'Upload-Offset': str(offset)},
+                )
+                offset = response.get_json()['offset']
+            uploads.complete(upload_id, store.add_file)
+    return rate(size / MB, t.seconds), _peak_rss_mb(), _peak_rss_mb() - baseline
+
+
+@benchmark
+def uploads(params, patterns):
+    context = multiprocessing.get_context('spawn')
+    for size_mb in params['upload_mb']:
+        for kind in ('multipart', 'resumable'):
+            name = f'upload_{kind}[{size_mb}MB]'
+            if not wanted(patterns, *(f'{name}.{metric}' for metric in ('throughput', 'peak_rss', 'rss_growth'))):
+                continue
+            with tempfile.TemporaryDirectory() as root:
+                results = context.Queue()
+                child = context.Process(target=_upload, args=(kind, size_mb * MB, root, results))
+                child.start()
+                result = results.get()
+                child.join()
+            if isinstance(result, str):
+                raise RuntimeError(f"{name} failed:\n{result}")
+            throughput, peak, growth = result
+            yield measurement(f'{name}.throughput', throughput, 'MB/s')
+            yield measurement(f'{name}.peak_rss', peak, 'MB', LOWER, min_delta=RSS_NOISE_MB)
+            # Memory the upload itself added; should stay flat as files grow
+            yield measurement(f'{name}.rss_growth', growth, 'MB', LOWER, min_delta=RSS_NOISE_MB)
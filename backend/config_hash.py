@@ -0,0 +1,15 @@
+# config_hash.py
+"""
+Canonical form and content hash of a model configuration, so equal configs
+share one key regardless of key order or whitespace.
+"""
+import hashlib
+import json
+
+
+def canonical_json(config):
+    return json.dumps(config, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def config_hash(config):
+    return hashlib.sha256(canonical_json(config).encode('utf-8')).hexdigest()
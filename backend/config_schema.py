@@ -0,0 +1,105 @@
+# config_schema.py
+"""
+Schema of a submitted model config, compiled once at import.
+
+``SCHEMA`` describes the fields: their types, whether they are required,
+allowed values (the ``/api/parameter-options`` lists) and numeric ranges
+(the script generator's hyperparameter bounds). ``compile_schema`` turns it
+into a flat list of check functions, so validating a batch of thousands of
+configs does no per-item setup. Errors are ``{'field', 'message'}`` dicts
+with dotted field paths.
+"""
+import os
+
+from backend.parameter_options import LOSS_FUNCTIONS, MODEL_TYPES, OPTIMIZERS
+from backend.preprocessing import validate_dataset
+from backend.script_generator import HYPERPARAMETER_ALIASES, HYPERPARAMETERS, validate_hyperparameters
+
+MAX_BATCH_CONFIGS = int(os.getenv("MAX_BATCH_CONFIGS", 10000))
+
+_TYPE_NAMES = {dict: 'an object', str: 'a string', int: 'an integer', float: 'a number'}
+
+
+def _hyperparameter_fields():
+    fields = {
+        'optimizer': {'type': str, 'enum': OPTIMIZERS},
+        'loss_function': {'type': str, 'enum': LOSS_FUNCTIONS},
+    }
+    for name, (kind, _, minimum, maximum) in HYPERPARAMETERS.items():
+        fields[name] = {'type': kind, 'minimum': minimum, 'maximum': maximum}
+    for alias, name in HYPERPARAMETER_ALIASES.items():
+        fields[alias] = fields[name]
+    return fields
+
+
+SCHEMA = {
+    'model_type': {'type': str, 'required': True, 'enum': MODEL_TYPES},
+    'hyperparameters': {'type': dict, 'required': True, 'fields': _hyperparameter_fields()},
+    'dataset': {'type': dict},
+}
+
+
+def _is_type(value, kind):
+    if isinstance(value, bool):
+        return False
+    if kind is float:
+        return isinstance(value, (int, float))
+    if kind is int:
+        return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+    return isinstance(value, kind)
+
+
+def _field_check(path, name, spec):
+    """Check of one field of the object at ``path``."""
+    field = f'{path}.{name}' if path else name
+    kind, required = spec['type'], spec.get('required', False)
+    allowed = frozenset(spec['enum']) if 'enum' in spec else None
+    minimum, maximum = spec.get('minimum'), spec.get('maximum')
+    nested = [_field_check(field, child, child_spec) for child, child_spec in spec.get('fields', {}).items()]
+    type_message = f"must be {_TYPE_NAMES[kind]}"
+    enum_message = f"must be one of {', '.join(spec.get('enum', ()))}"
+    range_message = (
+        f"must be at least {minimum}" if maximum is None else f"must be from {minimum} to {maximum}"
+    )
+
+    def check(obj, errors):
+        if name not in obj:
+            if required:
+                errors.append({'field': field, 'message': "is required"})
+            return
+        value = obj[name]
+        if not _is_type(value, kind):
+            errors.append({'field': field, 'message': type_message})
+            return
+        if allowed is not None and value not in allowed:
+            errors.append({'field': field, 'message': enum_message})
+        elif (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            errors.append({'field': field, 'message': range_message})
+        for child in nested:
+            child(value, errors)
+
+    return check
+
+
+def compile_schema(schema=SCHEMA):
+    """A ``validate(config)`` function returning the list of errors for ``config``."""
+    checks = [_field_check('', name, spec) for name, spec in schema.items()]
+
+    def validate(config):
+        if not isinstance(config, dict):
+            return [{'field': '', 'message': "must be an object"}]
+        errors = []
+        for check in checks:
+            check(config, errors)
+        hyperparameters = config.get('hyperparameters')
+        if isinstance(hyperparameters, dict):
+            errors.extend({'field': 'hyperparameters', 'message': message}
+                          for message in validate_hyperparameters(hyperparameters))
+        if isinstance(config.get('dataset'), dict):
+            errors.extend({'field': 'dataset', 'message': message} for message in validate_dataset(config))
+        return errors
+
+    return validate
+
+
+validate_config = compile_schema()
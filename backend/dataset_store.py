@@ -0,0 +1,231 @@
+# dataset_store.py
+"""
+Content-addressed storage for uploaded datasets.
+
+File contents are stored once as blobs keyed by their SHA-256
+(``<UPLOAD_DIR>/blobs/ab/abcdef...``), and an append-only manifest maps
+upload names to hashes. Each name is also exposed as ``<UPLOAD_DIR>/<name>``,
+a hard link to its blob, so existing path-based consumers keep working.
+Names that would shadow the store's own files (``blobs``, ``manifest.jsonl``,
+hidden names) are rejected.
+Re-uploading known content only records the name, and uploading different
+content under an existing name keeps the earlier blob.
+
+Records can carry file metadata (e.g. DICOM headers read at validation
+time); it is kept in the manifest and indexed in memory so datasets can be
+browsed and filtered without opening the files again.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import threading
+import time
+
+from backend.dicom_metadata import FILTER_FIELDS
+from backend.instrumentation import file_write
+from backend.uploads import UPLOAD_DIR, as_incoming
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+# ``_materialize`` links to ``<name>.<pid>.link`` before renaming into place
+TEMP_LINK_RE = re.compile(r'\.\d+\.link$')
+
+# The store's own entries in UPLOAD_DIR, which uploads must not replace
+RESERVED_NAMES = frozenset({'blobs', 'manifest.jsonl'})
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class DatasetStore:
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.manifest_path = os.path.join(root, 'manifest.jsonl')
+        self._lock = threading.Lock()
+        self._names = None
+        # Bytes of the manifest already applied; other processes may append past it.
+        self._manifest_end = 0
+        # sha256 -> metadata, and metadata field -> value -> set of names
+        self._metadata = None
+        self._by_field = None
+
+    def blob_path(self, sha256):
+        sha256 = sha256.lower()
+        if not SHA256_RE.match(sha256):
+            raise ValueError("Invalid SHA-256 digest")
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def has_blob(self, sha256):
+        try:
+            return os.path.exists(self.blob_path(sha256))
+        except ValueError:
+            return False
+
+    @staticmethod
+    def is_reserved(name):
+        """Whether ``name`` would collide with the store's files or temporary links."""
+        return name in RESERVED_NAMES or name.startswith('.') or bool(TEMP_LINK_RE.search(name))
+
+    def _check_name(self, name):
+        if not name or os.path.basename(name) != name or self.is_reserved(name):
+            raise ValueError(f"Invalid file name: {name!r}")
+
+    def get(self, name):
+        """Return the manifest record for ``name`` or ``None``."""
+        with self._lock:
+            return self._manifest().get(name)
+
+    def get_all(self):
+        with self._lock:
+            return list(self._manifest().values())
+
+    def query(self, cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
+        """
+        Page through records in name order, filtered on ``FILTER_FIELDS`` metadata.
+        Returns ``(records, next_cursor)``; the cursor is the last name returned.
+        """
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot filter on: {', '.join(sorted(unknown))}")
+        filters = {field: value for field, value in filters.items() if value is not None}
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            names = self._manifest()
+            if filters:
+                matches = set.intersection(*(
+                    self._by_field[field].get(value, set()) for field, value in filters.items()
+                ))
+            else:
+                matches = names.keys()
+            selected = sorted(name for name in matches if cursor is None or name > cursor)
+            records = [names[name] for name in selected[:limit + 1]]
+        if len(records) > limit:
+            return records[:limit], records[limit - 1]['name']
+        return records, None
+
+    def add_file(self, path, name, size, sha256, metadata=None):
+        """
+        Take ownership of the finished file at ``path`` and record it as ``name``.
+        If the content is already stored the file is dropped instead of kept twice.
+        Raises ``ValueError`` for a reserved name, leaving ``path`` to the caller.
+        """
+        self._check_name(name)
+        blob = self.blob_path(sha256)
+        with self._lock:
+            deduplicated = os.path.exists(blob)
+            if deduplicated:
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(path, blob)
+            return self._record(name, sha256, size, deduplicated, metadata)
+
+    def add_upload(self, file_storage, name):
+        """Store an uploaded ``FileStorage`` as ``name``."""
+        self._check_name(name)
+        info = as_incoming(file_storage).detach()
+        return self.add_file(info['path'], name, info['size'], info['sha256'])
+
+    def link_existing(self, name, sha256):
+        """
+        Record ``name`` for content that is already stored, so the client can
+        skip the transfer. Returns ``None`` if the blob is unknown.
+        """
+        self._check_name(name)
+        if not self.has_blob(sha256):
+            return None
+        sha256 = sha256.lower()
+        with self._lock:
+            size = os.path.getsize(self.blob_path(sha256))
+            self._manifest()
+            return self._record(name, sha256, size, True, self._metadata.get(sha256))
+
+    def _record(self, name, sha256, size, deduplicated, metadata=None):
+        names = self._manifest()
+        previous = names.get(name)
+        record = {'name': name, 'sha256': sha256, 'size': size, 'uploaded_at': time.time()}
+        if metadata is not None:
+            record['metadata'] = metadata
+        self._materialize(name, sha256)
+        with file_write.time(store='dataset_manifest'), open(self.manifest_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        if previous:
+            self._unindex(previous)
+        names[name] = record
+        self._index(record)
+        result = dict(record, path=os.path.join(self.root, name), deduplicated=deduplicated)
+        if previous and previous['sha256'] != sha256:
+            result['previous_sha256'] = previous['sha256']
+        return result
+
+    def _materialize(self, name, sha256):
+        """Point ``<root>/<name>`` at the blob, replacing any earlier version atomically."""
+        dest = os.path.join(self.root, name)
+        blob = self.blob_path(sha256)
+        if os.path.exists(dest) and os.path.samefile(dest, blob):
+            return
+        tmp = f'{dest}.{os.getpid()}.link'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            # Filesystems without hard links get a copy instead.
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, dest)
+
+    def _index(self, record):
+        metadata = record.get('metadata')
+        if metadata is None:
+            return
+        self._metadata[record['sha256']] = metadata
+        for field in FILTER_FIELDS:
+            if field in metadata:
+                self._by_field[field].setdefault(metadata[field], set()).add(record['name'])
+
+    def _unindex(self, record):
+        metadata = record.get('metadata') or {}
+        for field in FILTER_FIELDS:
+            if field in metadata:
+                self._by_field[field].get(metadata[field], set()).discard(record['name'])
+
+    def _manifest(self):
+        """Name -> record, including lines other processes appended since the last call."""
+        if self._names is None:
+            self._names = {}
+            self._manifest_end = 0
+            self._metadata = {}
+            self._by_field = {field: {} for field in FILTER_FIELDS}
+        try:
+            size = os.path.getsize(self.manifest_path)
+        except OSError:
+            size = 0
+        if size > self._manifest_end:
+            with open(self.manifest_path, 'rb') as f:
+                f.seek(self._manifest_end)
+                data = f.read(size - self._manifest_end)
+            # Only whole lines; a record still being written is picked up next time.
+            complete = data.rfind(b'\n') + 1
+            for line in data[:complete].splitlines():
+                try:
+                    record = json.loads(line)
+                    previous = self._names.get(record['name'])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Skipping malformed dataset manifest line")
+                    continue
+                if previous:
+                    self._unindex(previous)
+                self._names[record['name']] = record
+                self._index(record)
+            self._manifest_end += complete
+        return self._names
+
+
+# Singleton instance shared by the upload endpoints
+dataset_store = DatasetStore()
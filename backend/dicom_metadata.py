@@ -0,0 +1,61 @@
+# dicom_metadata.py
+"""
+Header-only DICOM validation and metadata extraction.
+
+Files are parsed with ``stop_before_pixels`` and large elements deferred, so
+validating a slice costs roughly the size of its header rather than its
+pixel data. ``pydicom`` is imported on first use, keeping it out of startup.
+"""
+from collections.abc import MutableSequence
+
+# Indexed header attributes, mapped to their snake_case metadata keys.
+DICOM_FIELDS = {
+    'PatientID': 'patient_id',
+    'StudyInstanceUID': 'study_instance_uid',
+    'SeriesInstanceUID': 'series_instance_uid',
+    'SOPInstanceUID': 'sop_instance_uid',
+    'Modality': 'modality',
+    'InstanceNumber': 'instance_number',
+    'Rows': 'rows',
+    'Columns': 'columns',
+    'PixelSpacing': 'pixel_spacing',
+    'SliceThickness': 'slice_thickness',
+}
+
+# Metadata keys that can be used to filter datasets.
+FILTER_FIELDS = ('patient_id', 'study_instance_uid', 'series_instance_uid', 'modality')
+
+
+class InvalidDicomError(Exception):
+    pass
+
+
+def _to_json(value):
+    # Lists, tuples and pydicom's MultiValue
+    if isinstance(value, (tuple, MutableSequence)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, int):
+        return int(value)
+    return str(value)
+
+
+def read_dicom_header(path):
+    """
+    Validate ``path`` as DICOM without reading pixel data and return its
+    metadata as a JSON-serializable dict (missing attributes are omitted).
+    Raises ``InvalidDicomError`` if the file is not DICOM.
+    """
+    import pydicom
+
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, defer_size='1 KB')
+    except Exception as e:
+        raise InvalidDicomError(str(e)) from e
+    metadata = {}
+    for keyword, key in DICOM_FIELDS.items():
+        value = ds.get(keyword)
+        if value is not None and value != '':
+            metadata[key] = _to_json(value)
+    return metadata
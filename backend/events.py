@@ -0,0 +1,168 @@
+# events.py
+"""
+Server-sent event fan-out for training progress.
+
+Each job owns an ``EventBroadcaster``. Publishing formats an event as SSE
+bytes once and appends it to a bounded ring buffer; every subscriber reads
+from that same buffer, so N subscribers cost one serialization and one write.
+A subscriber that reconnects with ``Last-Event-ID`` is replayed whatever it
+missed that is still in the buffer.
+
+Each open stream holds a server thread, so ``streams`` caps them at
+``MAX_SSE_STREAMS`` per process (further subscribers get 503 and poll the job
+instead) and ends them all when the process shuts down.
+"""
+import itertools
+import json
+import os
+import threading
+import weakref
+from collections import deque
+
+PROGRESS_REPLAY_EVENTS = int(os.getenv("PROGRESS_REPLAY_EVENTS", 256))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))
+MAX_SSE_STREAMS = int(os.getenv("MAX_SSE_STREAMS", 4))
+
+HEARTBEAT = b": keep-alive\n\n"
+
+
+def format_sse(event_id, event, data):
+    payload = json.dumps(data, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+# Every live broadcaster, so ending the streams can wake their waiting subscribers
+_broadcasters = weakref.WeakSet()
+_broadcasters_lock = threading.Lock()
+
+
+class EventBroadcaster:
+    def __init__(self, replay=PROGRESS_REPLAY_EVENTS):
+        self._events = deque(maxlen=replay)
+        self._next_id = 1
+        self._closed = False
+        self._cond = threading.Condition()
+        with _broadcasters_lock:
+            _broadcasters.add(self)
+
+    def publish(self, event, data):
+        """Append an event for all subscribers; returns its id."""
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, format_sse(event_id, event, data)))
+            self._cond.notify_all()
+        return event_id
+
+    def close(self):
+        """No more events; subscribers finish once they have drained the buffer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def wake(self):
+        """Wake waiting subscribers so they check their ``stop`` event."""
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def last_id(self):
+        """Id of the latest event (0 before the first)."""
+        return self._next_id - 1
+
+    def _since(self, last_event_id):
+        if not self._events:
+            return []
+        # Ids are consecutive, so the first unseen event's position is known directly.
+        start = max(0, last_event_id - self._events[0][0] + 1)
+        return list(itertools.islice(self._events, start, None))
+
+    def subscribe(self, last_event_id=0, heartbeat=SSE_HEARTBEAT, stop=None):
+        """
+        Yield SSE messages after ``last_event_id`` as they are published, with a
+        comment line every ``heartbeat`` seconds of silence to keep proxies from
+        timing the connection out. Ends early once the ``stop`` event is set.
+        """
+        while stop is None or not stop.is_set():
+            with self._cond:
+                pending = self._since(last_event_id)
+                if not pending and not self._closed:
+                    self._cond.wait(heartbeat)
+                    pending = self._since(last_event_id)
+                closed = self._closed
+            if pending:
+                last_event_id = pending[-1][0]
+                for _, message in pending:
+                    yield message
+            elif closed or (stop is not None and stop.is_set()):
+                return
+            else:
+                yield HEARTBEAT
+
+
+class _Stream:
+    """Iterable SSE response body that gives its slot back when closed, even if never iterated."""
+
+    def __init__(self, streams, messages):
+        self._streams = streams
+        self._messages = messages
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._messages)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._messages.close()
+            self._streams._release()
+
+
+class StreamLimit:
+    """Open SSE streams of this process: at most ``limit`` at once, all ended by ``close``."""
+
+    def __init__(self, limit=MAX_SSE_STREAMS):
+        self.limit = limit
+        # Passed to subscribers as their ``stop`` event
+        self.stopping = threading.Event()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self._active
+
+    def open(self, subscribe):
+        """
+        Response body from ``subscribe(stop)``, or None if the limit is reached
+        or the process is shutting down.
+        """
+        with self._lock:
+            if self.stopping.is_set() or self._active >= self.limit:
+                return None
+            self._active += 1
+        return _Stream(self, subscribe(self.stopping))
+
+    def close(self):
+        """Refuse new streams and end the open ones."""
+        self.stopping.set()
+        # Subscribers waiting for an event would otherwise only notice at their next heartbeat
+        with _broadcasters_lock:
+            broadcasters = list(_broadcasters)
+        for broadcaster in broadcasters:
+            broadcaster.wake()
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+
+
+# Shared by the event stream endpoints
+streams = StreamLimit()
@@ -0,0 +1,335 @@
+# explanations.py
+"""
+Term explanations for the parameter tooltips.
+
+Lookups go, in order, to the glossary (the bundled ``glossary.json``, which
+covers every option offered by ``/api/parameter-options``, plus an optional
+extra file), an in-memory TTL+LRU cache, an optional on-disk SQLite cache,
+and finally the upstream summary API (Wikipedia by default, or any stand-in
+server configured with ``EXPLANATION_URL``). Misses are cached too (negative caching), concurrent
+lookups of the same term share a single upstream request, and expired
+summaries are served stale while being refreshed in the background.
+"""
+import difflib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from backend.instrumentation import cache_lookups, external_call
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION_URL = os.getenv("EXPLANATION_URL", "https://en.wikipedia.org/api/rest_v1/page/summary/{term}")
+EXPLANATION_TIMEOUT = float(os.getenv("EXPLANATION_TIMEOUT", 5))
+BUNDLED_GLOSSARY = os.path.join(os.path.dirname(__file__), 'glossary.json')
+EXPLANATION_GLOSSARY = os.getenv("EXPLANATION_GLOSSARY")
+EXPLANATION_CACHE_DB = os.getenv("EXPLANATION_CACHE_DB")
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", 1024))
+
+# Seconds a cached result is fresh, by lookup status.
+CACHE_TTL = {
+    'found': float(os.getenv("EXPLANATION_CACHE_TTL", 24 * 3600)),
+    'missing': float(os.getenv("EXPLANATION_NEGATIVE_TTL", 3600)),
+    'error': float(os.getenv("EXPLANATION_ERROR_TTL", 30)),
+}
+# How long past its TTL a found summary may still be served while it is refreshed.
+STALE_TTL = float(os.getenv("EXPLANATION_STALE_TTL", 7 * 24 * 3600))
+
+FOUND = 'found'
+MISSING = 'missing'
+ERROR = 'error'
+
+MAX_BULK_TERMS = 50
+
+
+class LRUCache:
+    """Thread-safe LRU mapping of term -> ``{'summary', 'status', 'fetched_at'}``."""
+
+    def __init__(self, maxsize=EXPLANATION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """On-disk cache tier with the same interface as ``LRUCache``."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS explanations "
+                "(term TEXT PRIMARY KEY, summary TEXT, status TEXT, fetched_at REAL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, status, fetched_at FROM explanations WHERE term = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'summary': row[0], 'status': row[1], 'fetched_at': row[2]}
+
+    def set(self, key, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?)",
+                (key, entry['summary'], entry['status'], entry['fetched_at']),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM explanations")
+
+
+def normalize_term(term):
+    """Case- and punctuation-insensitive key: "AdamW", "adamw" and "Adam W" all map to "adamw"."""
+    return re.sub(r'[\W_]+', '', term.casefold())
+
+
+class Glossary:
+    """
+    In-memory glossary index built once from JSON files. A file is either
+    ``{"entries": [{"term", "aliases", "summary"}]}`` or ``{term: summary}``.
+    Lookups try the normalized key, then an unambiguous prefix, then a close
+    fuzzy match.
+    """
+    MIN_PREFIX = 3
+    FUZZY_CUTOFF = 0.85
+
+    def __init__(self, paths=()):
+        self._summaries = {}
+        self._keys = []
+        for path in paths:
+            self.load(path)
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Could not load explanation glossary %s", path)
+            return
+        if isinstance(data, dict) and isinstance(data.get('entries'), list):
+            for entry in data['entries']:
+                for term in [entry['term'], *entry.get('aliases', [])]:
+                    self.add(term, entry['summary'])
+        elif isinstance(data, dict):
+            for term, summary in data.items():
+                self.add(term, summary)
+        self._keys = sorted(self._summaries)
+
+    def add(self, term, summary):
+        key = normalize_term(str(term))
+        if key:
+            self._summaries[key] = summary
+
+    def lookup(self, term):
+        key = normalize_term(term)
+        if not key:
+            return None
+        summary = self._summaries.get(key)
+        if summary is not None:
+            return summary
+        if len(key) >= self.MIN_PREFIX:
+            matches = set()
+            for i in range(bisect_left(self._keys, key), len(self._keys)):
+                if not self._keys[i].startswith(key):
+                    break
+                matches.add(self._summaries[self._keys[i]])
+            if len(matches) == 1:
+                return matches.pop()
+            if matches:
+                # Ambiguous prefix; don't guess.
+                return None
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=self.FUZZY_CUTOFF)
+        return self._summaries[close[0]] if close else None
+
+    def __len__(self):
+        return len(self._summaries)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ExplanationService:
+    def __init__(self, url=EXPLANATION_URL, timeout=EXPLANATION_TIMEOUT, glossary_path=EXPLANATION_GLOSSARY,
+                 cache_db=EXPLANATION_CACHE_DB, cache_size=EXPLANATION_CACHE_SIZE, pool_size=16,
+                 use_bundled_glossary=True):
+        self.url = url
+        self.timeout = timeout
+        glossary_paths = [BUNDLED_GLOSSARY] if use_bundled_glossary else []
+        if glossary_path:
+            glossary_paths.append(glossary_path)
+        self.glossary = Glossary(glossary_paths)
+        self.memory_cache = LRUCache(cache_size)
+        self.disk_cache = SQLiteCache(cache_db) if cache_db else None
+        self.pool_size = pool_size
+        self._session = None
+        self._in_flight = {}
+        # Keys with a background refresh queued or running
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='explanation-refresh')
+        self._fetchers = ThreadPoolExecutor(max_workers=8, thread_name_prefix='explanation-fetch')
+
+    @property
+    def session(self):
+        """HTTP session for the summary API, made (importing ``requests``) on the first fetch."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers['User-Agent'] = 'DeepBuilder/1.0'
+                    self._session = session
+        return self._session
+
+    def lookup(self, term):
+        """Return ``(summary, status)`` where status is ``found``, ``missing`` or ``error``."""
+        glossary_summary = self.glossary.lookup(term)
+        if glossary_summary:
+            cache_lookups.inc(cache='explanation', result='glossary')
+            return glossary_summary, FOUND
+
+        key = term.strip().replace(' ', '_')
+        entry = self._cached(key)
+        if entry is not None:
+            age = time.time() - entry['fetched_at']
+            if age < CACHE_TTL[entry['status']]:
+                cache_lookups.inc(cache='explanation', result='hit')
+                return entry['summary'], entry['status']
+            if entry['status'] == FOUND and age < CACHE_TTL[FOUND] + STALE_TTL:
+                cache_lookups.inc(cache='explanation', result='stale')
+                with self._lock:
+                    queued = key in self._refreshing
+                    self._refreshing.add(key)
+                if not queued:
+                    self._refresher.submit(self._refresh, key)
+                return entry['summary'], FOUND
+        cache_lookups.inc(cache='explanation', result='miss')
+        return self._coalesced_fetch(key)
+
+    def lookup_many(self, terms):
+        """
+        Look up several terms at once, fetching glossary misses in parallel.
+        Returns ``{term: (summary, status)}``.
+        """
+        results = {}
+        remote = []
+        for term in terms:
+            summary = self.glossary.lookup(term)
+            if summary:
+                results[term] = (summary, FOUND)
+            else:
+                remote.append(term)
+        for term, result in zip(remote, self._fetchers.map(self.lookup, remote)):
+            results[term] = result
+        return results
+
+    def clear_cache(self):
+        self.memory_cache.clear()
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+
+    def _cached(self, key):
+        entry = self.memory_cache.get(key)
+        if entry is None and self.disk_cache is not None:
+            entry = self.disk_cache.get(key)
+            if entry is not None:
+                self.memory_cache.set(key, entry)
+        return entry
+
+    def _refresh(self, key):
+        try:
+            self._coalesced_fetch(key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _coalesced_fetch(self, key):
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+        if not leader:
+            flight.event.wait(self.timeout + 1)
+            return flight.result or ("An error occurred while fetching the summary.", ERROR)
+        try:
+            flight.result = self._fetch(key)
+            if flight.result[1] == ERROR:
+                previous = self._cached(key)
+                if previous is not None and previous['status'] == FOUND:
+                    # Keep the last good summary; it is served stale until a fetch succeeds.
+                    return flight.result
+            entry = {'summary': flight.result[0], 'status': flight.result[1], 'fetched_at': time.time()}
+            self.memory_cache.set(key, entry)
+            if self.disk_cache is not None and entry['status'] != ERROR:
+                self.disk_cache.set(key, entry)
+            return flight.result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.event.set()
+
+    def _fetch(self, key):
+        session = self.session
+        from requests import RequestException
+
+        start = time.perf_counter()
+        try:
+            resp = session.get(self.url.format(term=quote(key, safe='')), timeout=self.timeout)
+        except RequestException as e:
+            external_call.observe(time.perf_counter() - start, service='explanation', outcome='error')
+            logger.warning("Explanation fetch for %r failed: %s", key, e)
+            return "An error occurred while fetching the summary.", ERROR
+        external_call.observe(time.perf_counter() - start, service='explanation', outcome=resp.status_code)
+        if resp.status_code == 200:
+            try:
+                return resp.json().get("extract") or "No summary found.", FOUND
+            except ValueError:
+                return "An error occurred while fetching the summary.", ERROR
+        if resp.status_code == 404:
+            return f"No summary found for '{key}'.", MISSING
+        return "An error occurred while fetching the summary.", ERROR
+
+
+# Singleton instance for app use
+explanation_service = ExplanationService()
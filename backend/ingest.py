@@ -0,0 +1,196 @@
+# ingest.py
+"""
+Bulk dataset ingestion.
+
+Accepts many files in one request, either as several multipart file parts
+or as a zip/tar archive. Archive members are streamed one at a time into the
+upload staging area (never extracted as a whole), DICOM headers are
+validated in a process pool while the next member is being copied, and valid
+files are added to the dataset store as soon as they pass. Results are
+reported per file and grouped by SeriesInstanceUID.
+"""
+import atexit
+import multiprocessing
+import os
+import tarfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+
+from werkzeug.utils import secure_filename
+
+from backend.dicom_metadata import read_dicom_header, InvalidDicomError
+from backend.uploads import CHUNK_SIZE, IncomingFile, PARTIAL_DIR, MAX_UPLOAD_SIZE, as_incoming
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_ARCHIVE_ENTRIES = int(os.getenv("MAX_ARCHIVE_ENTRIES", 10000))
+# Staged entries awaiting validation; reading further members waits beyond this
+MAX_PENDING_INGEST = int(os.getenv("MAX_PENDING_INGEST", 2 * max(INGEST_WORKERS, 1)))
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers avoid inheriting the server's threads and locks.
+            _pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _validate(path):
+    """Runs in a worker process; returns ``(metadata, error)``."""
+    try:
+        return read_dicom_header(path), None
+    except InvalidDicomError as e:
+        return None, str(e)
+
+
+class _InlineResult:
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+    def done(self):
+        return True
+
+    def cancel(self):
+        return False
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _copy_to_incoming(fileobj):
+    incoming = IncomingFile(PARTIAL_DIR, MAX_UPLOAD_SIZE)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+        incoming.write(chunk)
+    return incoming
+
+
+def iter_archive_entries(path, filename):
+    """Yield ``(member_name, IncomingFile)`` for each regular file in an archive."""
+    count = 0
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                count += 1
+                if count > MAX_ARCHIVE_ENTRIES:
+                    raise ValueError("Archive has too many entries")
+                with archive.open(info) as member:
+                    yield info.filename, _copy_to_incoming(member)
+    else:
+        # Streaming mode reads members sequentially without seeking back.
+        with tarfile.open(path, 'r|*') as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                count += 1
+                if count > MAX_ARCHIVE_ENTRIES:
+                    raise ValueError("Archive has too many entries")
+                yield info.name, _copy_to_incoming(archive.extractfile(info))
+
+
+def iter_upload_entries(file_storages):
+    """
+    Yield ``(name, IncomingFile)`` for uploaded parts, expanding archives into
+    their members.
+    """
+    for file in file_storages:
+        if not file.filename:
+            continue
+        incoming = as_incoming(file)
+        if is_archive(file.filename):
+            incoming.flush()
+            try:
+                yield from iter_archive_entries(incoming.path, file.filename)
+            finally:
+                incoming.close()
+        else:
+            yield file.filename, incoming
+
+
+def _store(store, result, info, future):
+    """Store one validated entry, filling in its ``result``."""
+    metadata, error = future.result()
+    if error is not None:
+        os.remove(info['path'])
+        result.update(status='invalid', error='Invalid DICOM file')
+        return
+    saved = store.add_file(info['path'], result['name'], info['size'], info['sha256'], metadata)
+    result.update(
+        status='ok',
+        sha256=saved['sha256'],
+        size=saved['size'],
+        deduplicated=saved['deduplicated'],
+    )
+    if metadata is not None and metadata.get('series_instance_uid'):
+        result['series_instance_uid'] = metadata['series_instance_uid']
+
+
+def ingest(entries, store, allowed):
+    """
+    Validate and store ``(name, IncomingFile)`` entries.
+    ``allowed(filename)`` decides which names are accepted.
+    Returns ``{'results': [...], 'series': {uid: [names]}, 'summary': {...}}``.
+    Each result has the stored ``name`` and the ``member`` name it came from.
+
+    Entries are stored in order as their validation finishes, and at most
+    ``MAX_PENDING_INGEST`` are held in staging at once.
+    """
+    pool = _get_pool() if INGEST_WORKERS > 0 else None
+    results = []
+    pending = deque()
+    try:
+        for member_name, incoming in entries:
+            # Flatten archive paths so slices from different folders keep distinct names
+            name = secure_filename(member_name.replace('/', '_'))
+            result = {'name': name, 'member': member_name}
+            results.append(result)
+            if not name or not allowed(name) or store.is_reserved(name):
+                incoming.close()
+                result.update(status='skipped', error='Invalid file type')
+                continue
+            info = incoming.detach()
+            if not name.lower().endswith('.dcm'):
+                future = _InlineResult((None, None))
+            elif pool is not None:
+                future = pool.submit(_validate, info['path'])
+            else:
+                future = _InlineResult(_validate(info['path']))
+            pending.append((result, info, future))
+            # In order, so a name repeated in the upload keeps its last content
+            while pending and (len(pending) > MAX_PENDING_INGEST or pending[0][2].done()):
+                _store(store, *pending[0])
+                pending.popleft()
+        while pending:
+            _store(store, *pending[0])
+            pending.popleft()
+    finally:
+        for _, info, future in pending:
+            future.cancel()
+            with suppress(FileNotFoundError):
+                os.remove(info['path'])
+
+    series = {}
+    summary = {'ok': 0, 'invalid': 0, 'skipped': 0}
+    for result in results:
+        summary[result['status']] += 1
+        if 'series_instance_uid' in result:
+            series.setdefault(result['series_instance_uid'], []).append(result['name'])
+    return {'results': results, 'series': series, 'summary': summary}
@@ -0,0 +1,405 @@
+# instrumentation.py
+"""
+Performance metrics in the Prometheus text format, served at ``/metrics``.
+
+Modules create metrics with ``counter``, ``gauge`` and ``histogram`` and
+update them inline. ``init_app`` adds per-route latency, request/response
+size and in-flight metrics to every request. Values live in process memory.
+When ``METRICS_MULTIPROC_DIR`` is set (gunicorn.conf.py sets it), each
+process also writes a snapshot there every ``METRICS_FLUSH_INTERVAL`` seconds,
+named ``<pid>-<token>.json`` so a reused pid doesn't overwrite an exited
+worker's counters. ``/metrics`` then merges all snapshots. Counters and histograms of exited
+workers keep counting, while gauges only include live processes.
+
+With ``PROFILER=1`` a background thread samples every thread's stack each
+``PROFILER_INTERVAL`` seconds. ``/metrics/profile`` returns the sampled stacks
+in the folded format that flame graph tools read.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+from backend.shared_state import new_owner, owner_alive
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+PROFILER = os.getenv("PROFILER", "0") == "1"
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", 0.01))
+
+# Seconds; from a cache hit to a slow upload or upstream call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Seconds; lock waits and single file writes are normally far below a millisecond
+FAST_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Copy in a running total counted elsewhere (see ``Registry.add_collector``)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket (not cumulative) counts, then sum and count
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), list(counts)] for key, counts in self._values.items()]
+
+
+class TimedLock:
+    """``threading.Lock`` that records how long each acquisition waited."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if not self._lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self._lock.acquire()
+            lock_wait.observe(time.perf_counter() - start, lock=self.name)
+            lock_contended.inc(lock=self.name)
+        lock_acquired.inc(lock=self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class Registry:
+    def __init__(self, multiproc_dir=METRICS_MULTIPROC_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._owner = None
+
+    @property
+    def owner(self):
+        """Owner token (see ``new_owner``) naming this process's snapshot, made again after a fork."""
+        if self._owner is None or not self._owner.startswith(f'{os.getpid()}-'):
+            self._owner = new_owner()
+        return self._owner
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def add_collector(self, collect):
+        """Call ``collect()`` before each snapshot, to copy in values kept elsewhere (e.g. cache stats)."""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        for collect in self._collectors:
+            collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {
+                'kind': metric.kind, 'help': metric.documentation, 'labels': list(metric.labels),
+                'buckets': list(getattr(metric, 'buckets', ())), 'samples': metric.samples(),
+            }
+            for metric in metrics
+        }
+
+    def flush(self):
+        """Write this process's snapshot for the other workers' ``/metrics``."""
+        if not self.multiproc_dir:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = os.path.join(self.multiproc_dir, f'{self.owner}.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def start_flushing(self):
+        with self._lock:
+            if not self.multiproc_dir or self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Snapshots of every process: this one's, fresh, plus the other workers' last flushed ones."""
+        if not self.multiproc_dir:
+            return [(True, self.snapshot())]
+        self.flush()
+        snapshots = []
+        for filename in os.listdir(self.multiproc_dir):
+            if not filename.endswith('.json'):
+                continue
+            owner = filename[:-len('.json')]
+            try:
+                with open(os.path.join(self.multiproc_dir, filename)) as f:
+                    snapshots.append((owner_alive(owner), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """Every metric, summed over processes, in the Prometheus text exposition format."""
+        merged = {}
+        for alive, snapshot in self.collect():
+            for name, metric in snapshot.items():
+                if metric['kind'] == 'gauge' and not alive:
+                    continue
+                target = merged.setdefault(name, dict(metric, samples={}))
+                for key, value in metric['samples']:
+                    key = tuple(key)
+                    if key not in target['samples']:
+                        target['samples'][key] = value
+                    elif isinstance(value, list):
+                        target['samples'][key] = [a + b for a, b in zip(target['samples'][key], value)]
+                    else:
+                        target['samples'][key] += value
+        lines = []
+        for name in sorted(merged):
+            metric = merged[name]
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for key, value in sorted(metric['samples'].items()):
+                labels = list(zip(metric['labels'], key))
+                if metric['kind'] != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric['buckets'], '+Inf'], value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(value[-1])}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class SamplingProfiler:
+    """Counts the stacks of all threads, sampled every ``interval`` seconds."""
+
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.stacks = _Tally()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='profiler', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                sampled.append(';'.join(reversed(names)))
+            with self._lock:
+                self.stacks.update(sampled)
+
+    def folded(self, reset=False):
+        """``stack count`` lines, most frequent first."""
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+            if reset:
+                self.stacks.clear()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labels=()):
+    return registry.register(Counter(name, documentation, labels))
+
+
+def gauge(name, documentation, labels=()):
+    return registry.register(Gauge(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Histogram(name, documentation, labels, buckets))
+
+
+request_latency = histogram(
+    'deepbuilder_request_duration_seconds', 'Time to produce a response (streams: until headers)',
+    ('method', 'route', 'status'),
+)
+request_bytes = counter('deepbuilder_request_bytes_total', 'Request body bytes received', ('method', 'route'))
+response_bytes = counter(
+    'deepbuilder_response_bytes_total', 'Response body bytes sent, where the length is known', ('method', 'route'),
+)
+requests_in_flight = gauge('deepbuilder_requests_in_flight', 'Requests being handled', ('method',))
+lock_wait = histogram(
+    'deepbuilder_lock_wait_seconds', 'Time spent waiting for a contended lock', ('lock',), FAST_BUCKETS,
+)
+lock_acquired = counter('deepbuilder_lock_acquisitions_total', 'Lock acquisitions', ('lock',))
+lock_contended = counter('deepbuilder_lock_contended_total', 'Lock acquisitions that had to wait', ('lock',))
+file_write = histogram(
+    'deepbuilder_file_write_seconds', 'Time to write (and flush) a store file', ('store',), FAST_BUCKETS,
+)
+external_call = histogram(
+    'deepbuilder_external_request_seconds', 'Outbound HTTP request time', ('service', 'outcome'),
+)
+startup_seconds = gauge('deepbuilder_startup_seconds', 'Seconds spent in each startup phase', ('phase',))
+cache_lookups = counter('deepbuilder_cache_lookups_total', 'Cache lookups by result', ('cache', 'result'))
+
+
+def init_app(app, profiler=PROFILER):
+    """Time every request and serve ``/metrics`` (and ``/metrics/profile`` with the profiler on)."""
+    if not METRICS_ENABLED:
+        return
+    sampler = SamplingProfiler() if profiler else None
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_in_flight = True
+        requests_in_flight.inc(method=request.method)
+
+    @app.after_request
+    def record(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        request_latency.observe(
+            time.perf_counter() - start, method=request.method, route=route, status=response.status_code,
+        )
+        if request.content_length:
+            request_bytes.inc(request.content_length, method=request.method, route=route)
+        if response.content_length is not None and not response.is_streamed:
+            response_bytes.inc(response.content_length, method=request.method, route=route)
+        return response
+
+    @app.teardown_request
+    def finish(exc):
+        if g.pop('metrics_in_flight', False):
+            requests_in_flight.dec(method=request.method)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    if sampler is not None:
+        sampler.start()
+
+        @app.route('/metrics/profile')
+        def profile():
+            reset = request.args.get('reset', '0') == '1'
+            return Response(sampler.folded(reset=reset), content_type='text/plain; charset=utf-8')
+
+    registry.start_flushing()
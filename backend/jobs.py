@@ -0,0 +1,537 @@
+# jobs.py
+"""
+Asynchronous training jobs.
+
+Submitting a stored config creates a job whose generated training script runs
+in its own subprocess. A bounded pool of supervisor threads caps how many
+scripts run at once; further jobs wait in the queue. Request threads only
+enqueue and read state, so they never block on training.
+
+Scripts report progress by printing lines of the form::
+
+    DEEPBUILDER_PROGRESS {"epoch": 3, "total_epochs": 10, "loss": 0.41}
+
+Everything else they print goes to the job's log file. Progress and state
+changes are also published to the job's ``EventBroadcaster`` for streaming,
+and numeric metrics are recorded in the job's metrics store: against
+``step`` when the line has one, otherwise against ``epoch``.
+
+Training runs that succeed and save checkpoints are recorded in a result
+cache keyed by config hash, script and dataset content. Submitting the same
+experiment again finishes at once: the earlier run's directory is hard-linked
+into the new job's and its final progress is reported.
+
+Configs whose dataset has a ``preprocess`` section get their images prepared
+by the shared ``Preprocessor`` cache before the script starts (see
+``backend.preprocessing``); the cached file's path is passed in the
+``DEEPBUILDER_PREPROCESSED_IMAGES`` environment variable, and that of
+segmentation masks transformed with them in ``DEEPBUILDER_PREPROCESSED_LABELS``.
+Cancelling the job stops a build in progress.
+
+Jobs run in the server process that accepted them. Their state is also
+published to a ``SharedState`` database, so other worker processes can report
+on them, stream their progress (by polling) and forward cancel requests.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+
+from backend.dataset_store import dataset_store
+from backend.events import EventBroadcaster, SSE_HEARTBEAT, HEARTBEAT, format_sse
+from backend.instrumentation import cache_lookups
+from backend.metrics_store import MetricsStore
+from backend.preprocessing import Preprocessor, labels_path, requested as preprocessing_requested
+from backend.result_cache import ResultCache, dataset_digest, has_checkpoints, result_key
+from backend.script_generator import config_key, generate_pytorch_script, PROGRESS_PREFIX
+from backend.shared_state import SharedState, owner_alive
+from backend.uploads import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.path.dirname(__file__), '../jobs'))
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", max(1, (os.cpu_count() or 2) // 2)))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 100))
+RESULT_CACHE = os.getenv("JOB_RESULT_CACHE", "1") != "0"
+# Finished jobs kept for reporting: the newest JOB_RETENTION, and none older than JOB_RETENTION_SECONDS
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", 1000))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+# Seconds between pruning passes
+PRUNE_INTERVAL = 60
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Script arguments per job mode; a benchmark only measures the data pipeline
+JOB_MODES = {
+    'train': [],
+    'benchmark': ['--benchmark-data'],
+}
+
+# Progress keys that position a report rather than being metrics
+AXIS_KEYS = ('epoch', 'total_epochs', 'step', 'total_steps')
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobsDraining(JobQueueFull):
+    """The server is shutting down and accepts no new jobs."""
+
+
+class Job:
+    def __init__(self, config_id, config, mode='train', job_id=None, on_progress=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.config_id = config_id
+        self.config = config
+        self.mode = mode
+        self.on_progress = on_progress
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.error = None
+        self.progress = {"current_epoch": 0, "total_epochs": 0, "loss": None}
+        self.log_tail = deque(maxlen=50)
+        self.cancel_requested = False
+        self.process = None
+        self.future = None
+        self.cache_key = None
+        self.cached_from = None
+        self.shared = None
+        self.events = EventBroadcaster()
+        self.lock = threading.Lock()
+
+    def set_state(self, state, **fields):
+        """Update state (with ``job.lock`` held) and notify subscribers."""
+        self.state = state
+        for name, value in fields.items():
+            setattr(self, name, value)
+        event = {"state": state}
+        event.update(fields)
+        self.events.publish('state', event)
+        if state in FINISHED_STATES:
+            self.events.close()
+        self.share()
+
+    def share(self):
+        """Publish the job's state to other worker processes (with ``job.lock`` held)."""
+        if self.shared is not None:
+            self.shared.put('job', self.id, self.events.last_id, self._as_dict())
+
+    def snapshot(self):
+        with self.lock:
+            return self.events.last_id, self._as_dict()
+
+    def to_dict(self):
+        with self.lock:
+            return self._as_dict()
+
+    def _as_dict(self):
+        return {
+            "id": self.id,
+            "config_id": self.config_id,
+            "mode": self.mode,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "returncode": self.returncode,
+            "error": self.error,
+            "progress": dict(self.progress),
+            "cached_from": self.cached_from,
+        }
+
+
+class RemoteJob:
+    """Read-only view of a job owned by another worker process, from its shared snapshot."""
+
+    def __init__(self, shared, record):
+        self._data = dict(record['data'])
+        if self._data['state'] not in FINISHED_STATES and not owner_alive(record['owner']):
+            self._data.update(state=FAILED, error="Worker process exited")
+        self.id = self._data['id']
+        self.state = self._data['state']
+        self.progress = self._data['progress']
+        self.cached_from = self._data.get('cached_from')
+        self.events = _RemoteEvents(shared, self.id)
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _RemoteEvents:
+    """``EventBroadcaster.subscribe`` for a remote job, by polling its shared snapshot."""
+
+    def __init__(self, shared, job_id):
+        self.shared = shared
+        self.job_id = job_id
+
+    def subscribe(self, last_event_id=0, heartbeat=SSE_HEARTBEAT, stop=None):
+        # Snapshot versions are the owner's event ids, so Last-Event-ID carries over between workers.
+        stop = stop or threading.Event()
+        state = None
+        quiet = 0.0
+        while not stop.is_set():
+            record = self.shared.get('job', self.job_id)
+            if record is None:
+                return
+            job = RemoteJob(self.shared, record)
+            if record['version'] > last_event_id or job.state != state:
+                last_event_id = max(last_event_id, record['version'])
+                quiet = 0.0
+                yield format_sse(last_event_id, 'progress', job.progress)
+                if job.state != state:
+                    state = job.state
+                    yield format_sse(last_event_id, 'state', {'state': state, 'error': job.to_dict().get('error')})
+            if state in FINISHED_STATES or stop.wait(self.shared.interval):
+                return
+            quiet += self.shared.interval
+            if quiet >= heartbeat:
+                quiet = 0.0
+                yield HEARTBEAT
+
+
+class JobManager:
+    def __init__(self, jobs_dir=JOBS_DIR, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS,
+                 script_generator=generate_pytorch_script, datasets=dataset_store, result_cache=RESULT_CACHE,
+                 shared=None, preprocessor=None, retention=JOB_RETENTION, retention_seconds=JOB_RETENTION_SECONDS):
+        self.jobs_dir = jobs_dir
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.script_generator = script_generator
+        self.datasets = datasets
+        self.preprocessor = preprocessor if preprocessor is not None else Preprocessor(datasets)
+        self.metrics = MetricsStore(jobs_dir)
+        self.results = ResultCache(os.path.join(jobs_dir, '.results')) if result_cache else None
+        self.shared = shared if shared is not None else SharedState(os.path.join(jobs_dir, 'state.sqlite3'))
+        self.shared.on_request('job', self._on_request)
+        self.retention = retention
+        self.retention_seconds = retention_seconds
+        self.draining = False
+        self._jobs = {}
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='job-supervisor')
+
+    def submit(self, config_id, config, mode='train', on_progress=None, use_cache=True):
+        """
+        Queue a job. ``on_progress(job, update)`` is called from the job's
+        supervisor thread after each progress report. A training run already
+        in the result cache finishes immediately unless ``use_cache`` is False.
+        """
+        if mode not in JOB_MODES:
+            raise ValueError(f"mode must be one of {', '.join(JOB_MODES)}")
+        if self.draining:
+            raise JobsDraining()
+        if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+        cache_key = self._result_key(config) if use_cache and mode == 'train' else None
+        entry = self.results.get(cache_key) if cache_key else None
+        if cache_key:
+            cache_lookups.inc(cache='training_results', result='miss' if entry is None else 'hit')
+        job = Job(config_id, config, mode, on_progress=on_progress)
+        job.cache_key = cache_key
+        job.shared = self.shared
+        if entry is not None and self._restore(job, entry):
+            with self._lock:
+                self._jobs[job.id] = job
+            return job
+        with self._lock:
+            queued = sum(1 for other in self._jobs.values() if other.state == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull()
+            self._jobs[job.id] = job
+        with job.lock:
+            job.share()
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """A job of this process, a ``RemoteJob`` of another worker's, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and isinstance(job_id, str):
+            record = self.shared.get('job', job_id)
+            if record is not None:
+                job = RemoteJob(self.shared, record)
+        return job
+
+    def list(self, state=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        local = {job.id for job in jobs}
+        jobs.extend(RemoteJob(self.shared, record) for record in self.shared.list('job') if record['id'] not in local)
+        if state is not None:
+            jobs = [job for job in jobs if job.state == state]
+        return sorted(jobs, key=lambda job: job.to_dict()['created_at'])
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it already finished."""
+        job = self.get(job_id)
+        if job is None or job.state in FINISHED_STATES:
+            return False
+        if isinstance(job, RemoteJob):
+            # The owning worker cancels it when it next polls
+            return self.shared.request('job', job_id, 'cancel')
+        with job.lock:
+            if job.state in FINISHED_STATES:
+                return False
+            job.cancel_requested = True
+            if job.state == QUEUED:
+                job.set_state(CANCELLED, finished_at=time.time())
+                if job.future is not None:
+                    job.future.cancel()
+            process = job.process
+        if process is not None:
+            self._terminate(process)
+        return True
+
+    def drain(self, timeout):
+        """
+        Stop accepting jobs, cancel queued ones and give running ones up to
+        ``timeout`` seconds to finish before cancelling them too. Returns
+        True if every running job finished on its own.
+        """
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        for job in self._local_jobs():
+            if job.state == QUEUED:
+                self.cancel(job.id)
+        running = [job for job in self._local_jobs() if job.state not in FINISHED_STATES]
+        wait_futures([job.future for job in running], timeout=max(0.0, deadline - time.monotonic()))
+        finished = all(job.state in FINISHED_STATES for job in running)
+        self.shutdown(wait=True)
+        return finished
+
+    def shutdown(self, wait=False):
+        for job in self._local_jobs():
+            if job.state not in FINISHED_STATES:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self.shared.close()
+
+    def prune(self):
+        """
+        Forget finished jobs beyond the newest ``retention`` or that finished
+        more than ``retention_seconds`` ago, with their shared snapshots, and
+        the old snapshots of workers that have exited. Their directories stay.
+        """
+        self._pruned_at = time.monotonic()
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.state in FINISHED_STATES),
+                              key=lambda job: job.finished_at or 0, reverse=True)
+            expired = [job.id for i, job in enumerate(finished)
+                       if i >= self.retention or (job.finished_at or 0) < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for record in self.shared.list('job'):
+            data = record['data']
+            if (data.get('finished_at') or data.get('created_at') or 0) < cutoff and not owner_alive(record['owner']):
+                expired.append(record['id'])
+        if expired:
+            self.shared.remove('job', expired)
+        return len(expired)
+
+    def close_streams(self):
+        """End the event streams of this process's jobs once they have sent what is buffered."""
+        for job in self._local_jobs():
+            job.events.close()
+
+    def _local_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _on_request(self, job_id, action):
+        if action == 'cancel':
+            self.cancel(job_id)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _result_key(self, config):
+        """Result cache key of a training run of ``config``, or None if it can't be cached."""
+        if self.results is None:
+            return None
+        if preprocessing_requested(config):
+            data = self.preprocessor.digest(config)
+        else:
+            data = dataset_digest(config, self.datasets)
+        if data is None:
+            return None
+        return result_key(config_key(config), self.script_generator(config), data)
+
+    def _restore(self, job, entry):
+        """Finish ``job`` with the cached run in ``entry``; False if its files can't be linked."""
+        try:
+            shutil.copytree(entry['run_dir'], self.job_dir(job.id), copy_function=_link_or_copy)
+        except (OSError, shutil.Error):
+            logger.exception("Could not reuse cached run %s for job %s", entry.get('job_id'), job.id)
+            shutil.rmtree(self.job_dir(job.id), ignore_errors=True)
+            return False
+        now = time.time()
+        with job.lock:
+            job.progress.update(entry.get('progress', {}))
+            job.events.publish('progress', dict(job.progress))
+            job.set_state(SUCCEEDED, started_at=now, finished_at=now, returncode=0, cached_from=entry['job_id'])
+        job.future = Future()
+        job.future.set_result(None)
+        return True
+
+    def _run(self, job):
+        with job.lock:
+            if job.cancel_requested:
+                return
+            job.set_state(RUNNING, started_at=time.time())
+        work_dir = self.job_dir(job.id)
+        process = None
+        try:
+            os.makedirs(work_dir, exist_ok=True)
+            script_path = os.path.join(work_dir, 'train.py')
+            with open(script_path, 'w') as f:
+                f.write(self.script_generator(job.config))
+            preprocessed = None
+            if preprocessing_requested(job.config):
+                preprocessed = self.preprocessor.prepare(job.config, cancelled=lambda: job.cancel_requested)
+            with job.lock:
+                if job.cancel_requested:
+                    job.set_state(CANCELLED, finished_at=time.time())
+                    return
+                process = job.process = subprocess.Popen(
+                    [sys.executable, '-u', script_path, *JOB_MODES[job.mode]],
+                    cwd=work_dir,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    env=self._job_env(preprocessed),
+                    text=True,
+                )
+            with open(os.path.join(work_dir, 'train.log'), 'w') as log:
+                for line in process.stdout:
+                    if line.startswith(PROGRESS_PREFIX):
+                        self._report(job, line[len(PROGRESS_PREFIX):])
+                    else:
+                        log.write(line)
+                        job.log_tail.append(line.rstrip('\n'))
+            returncode = process.wait()
+        except Exception as e:
+            if not job.cancel_requested:
+                logger.exception("Job %s failed to run", job.id)
+            if process is not None:
+                # Don't leave the script running unsupervised, or unreaped
+                if process.poll() is None:
+                    self._terminate(process)
+                process.wait()
+                process.stdout.close()
+            with job.lock:
+                job.process = None
+                if job.cancel_requested:
+                    job.set_state(CANCELLED, finished_at=time.time())
+                else:
+                    job.set_state(FAILED, error=str(e), finished_at=time.time())
+            return
+        finally:
+            self.metrics.close_run(job.id)
+        with job.lock:
+            job.process = None
+            finished = {'returncode': returncode, 'finished_at': time.time()}
+            if job.cancel_requested:
+                job.set_state(CANCELLED, **finished)
+            elif returncode == 0:
+                if job.cache_key and has_checkpoints(work_dir):
+                    self._remember(job, work_dir)
+                job.set_state(SUCCEEDED, **finished)
+            else:
+                error = job.log_tail[-1] if job.log_tail else f"Exited with status {returncode}"
+                job.set_state(FAILED, error=error, **finished)
+
+    def _remember(self, job, work_dir):
+        try:
+            self.results.put(job.cache_key, {
+                'job_id': job.id,
+                'config_id': job.config_id,
+                'run_dir': os.path.abspath(work_dir),
+                'progress': dict(job.progress),
+            })
+        except OSError:
+            logger.exception("Could not record job %s in the result cache", job.id)
+
+    def _report(self, job, payload):
+        try:
+            update = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(update, dict):
+            return
+        with job.lock:
+            if 'epoch' in update:
+                job.progress['current_epoch'] = update['epoch']
+            for key, value in update.items():
+                if key != 'epoch':
+                    job.progress[key] = value
+            job.events.publish('progress', dict(job.progress))
+        # Progress can arrive many times a second; other workers see it once per poll interval
+        self.shared.mark_dirty('job', job.id, job.snapshot)
+        if job.on_progress is not None:
+            try:
+                job.on_progress(job, update)
+            except Exception:
+                logger.exception("Progress listener for job %s failed", job.id)
+        axis = 'step' if 'step' in update else 'epoch'
+        position = update.get(axis)
+        if isinstance(position, int) and not isinstance(position, bool):
+            metrics = {key: value for key, value in update.items() if key not in AXIS_KEYS}
+            self.metrics.record(job.id, axis, position, metrics)
+
+    def _job_env(self, preprocessed=None):
+        env = dict(os.environ)
+        # CPU-only, and split the cores between concurrent jobs instead of oversubscribing them.
+        env.setdefault('CUDA_VISIBLE_DEVICES', '')
+        # Dataset names in generated scripts are resolved against the upload directory
+        env.setdefault('DEEPBUILDER_DATA_DIR', os.path.abspath(UPLOAD_DIR))
+        # Shared by all jobs so datasets cached on disk are reused between runs
+        env.setdefault('DEEPBUILDER_CACHE_DIR', os.path.abspath(os.path.join(self.jobs_dir, '.dataset_cache')))
+        threads = str(max(1, (os.cpu_count() or 1) // self.max_concurrent))
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            env.setdefault(name, threads)
+        if preprocessed is not None:
+            env['DEEPBUILDER_PREPROCESSED_IMAGES'] = os.path.abspath(preprocessed)
+            if os.path.exists(labels_path(preprocessed)):
+                env['DEEPBUILDER_PREPROCESSED_LABELS'] = os.path.abspath(labels_path(preprocessed))
+        return env
+
+    @staticmethod
+    def _terminate(process, grace=5):
+        process.terminate()
+        try:
+            process.wait(grace)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Filesystems without hard links get a copy instead.
+        shutil.copy2(src, dst)
+
+
+# Singleton instance for app use
+job_manager = JobManager()
+atexit.register(job_manager.shutdown)
@@ -0,0 +1,121 @@
+# lifecycle.py
+"""
+Graceful shutdown.
+
+``drain()`` puts the process into draining mode: requests that start new
+work (uploads, jobs, sweeps) are refused with 503 so a load balancer retries
+them on another worker, progress streams are ended (clients reconnect
+elsewhere), requests already writing data are waited for, and then the job
+manager lets running jobs finish (cancelling whatever is still running when
+``DRAIN_TIMEOUT`` runs out).
+
+Under gunicorn, the SIGTERM handler installed by ``post_worker_init`` drains
+in the background while the worker keeps serving, and stops the worker
+afterwards; ``worker_exit`` only waits for that drain. The development
+server's SIGTERM handler drains before exiting.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from backend.events import StreamLimit, streams
+from backend.jobs import job_manager
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+
+# Path prefixes of write requests that are tracked and refused while draining
+WRITE_PREFIXES = ('/api/upload', '/api/datasets', '/api/jobs', '/api/sweeps', '/api/modelconfig')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class Lifecycle:
+    def __init__(self, jobs, streams=None):
+        self.jobs = jobs
+        self.streams = streams if streams is not None else StreamLimit()
+        self.draining = False
+        self._active = 0
+        self._cond = threading.Condition()
+        self._drained = threading.Event()
+        self._result = None
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @property
+    def active_requests(self):
+        return self._active
+
+    def _before_request(self):
+        if request.method not in WRITE_METHODS or not request.path.startswith(WRITE_PREFIXES):
+            return None
+        with self._cond:
+            if self.draining:
+                response = jsonify({"error": "Server is shutting down"})
+                response.status_code = 503
+                response.headers['Retry-After'] = '5'
+                return response
+            self._active += 1
+        g.lifecycle_tracked = True
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('lifecycle_tracked', False):
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        """
+        Refuse new work, end streams, wait for in-flight writes, then drain
+        jobs; True if nothing was cut short. Later calls wait for the first.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            started = self.draining
+            self.draining = True
+        if started:
+            self._drained.wait(timeout)
+            return bool(self._result)
+        self.streams.close()
+        self.jobs.close_streams()
+        with self._cond:
+            while self._active and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            requests_done = not self._active
+        if not requests_done:
+            logger.warning("Shutting down with %d request(s) still writing", self._active)
+        jobs_done = self.jobs.drain(max(0.0, deadline - time.monotonic()))
+        if not jobs_done:
+            logger.warning("Cancelled jobs still running after %.0fs", timeout)
+        self._result = requests_done and jobs_done
+        self._drained.set()
+        return self._result
+
+    def drain_in_background(self, timeout=DRAIN_TIMEOUT, then=None):
+        """Start ``drain`` on its own thread and call ``then()`` when it is done."""
+        def run():
+            try:
+                self.drain(timeout)
+            finally:
+                if then is not None:
+                    then()
+        threading.Thread(target=run, name='drain', daemon=True).start()
+
+    def install_signal_handlers(self, timeout=DRAIN_TIMEOUT):
+        """Drain on SIGTERM before exiting (for servers without shutdown hooks, e.g. the dev server)."""
+        def handle(signum, frame):
+            self.drain(timeout)
+            sys.exit(0)
+        signal.signal(signal.SIGTERM, handle)
+
+
+# Singleton instance for app use
+lifecycle = Lifecycle(job_manager, streams)
@@ -0,0 +1,212 @@
+# metrics_store.py
+"""
+Persistent time series of training metrics.
+
+Each run keeps one series per metric and axis (``step`` for per-step values,
+``epoch`` for per-epoch ones) under ``<root>/<run_id>/metrics/<axis>/``. A
+series is two append-only column files: ``<name>.steps`` (int64) and
+``<name>.f32`` (float32), written in chunks of ``METRICS_CHUNK_POINTS``.
+Queries memory-map the columns, locate the step range by binary search and
+downsample it server-side (LTTB or min/max buckets), so plotting a long run
+sends a fixed number of points.
+"""
+import os
+import re
+import threading
+from array import array
+
+import numpy as np
+
+METRICS_CHUNK_POINTS = int(os.getenv("METRICS_CHUNK_POINTS", 1024))
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+
+AXES = ('step', 'epoch')
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+_NAME = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}$')
+
+
+def valid_name(name):
+    return bool(_NAME.match(name))
+
+
+class _Series:
+    def __init__(self, directory, name):
+        self.steps_path = os.path.join(directory, name + '.steps')
+        self.values_path = os.path.join(directory, name + '.f32')
+        self._steps = array('q')
+        self._values = array('f')
+        self.last_step = None
+        self.lock = threading.Lock()
+
+    def append(self, step, value):
+        with self.lock:
+            if self.last_step is not None and step < self.last_step:
+                # Steps must not go backwards, so range queries can binary search.
+                return
+            self.last_step = step
+            self._steps.append(step)
+            self._values.append(value)
+            if len(self._steps) >= METRICS_CHUNK_POINTS:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._steps:
+            return
+        os.makedirs(os.path.dirname(self.steps_path), exist_ok=True)
+        # Values first: a reader never sees a step without its value.
+        with open(self.values_path, 'ab') as f:
+            self._values.tofile(f)
+        with open(self.steps_path, 'ab') as f:
+            self._steps.tofile(f)
+        del self._steps[:]
+        del self._values[:]
+
+
+def _load_column(path, dtype, count=None):
+    size = os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+    if count is not None:
+        size = min(size, count)
+    if size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(size,))
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` points preserving the curve's shape."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    # Only used to rank points; NaN counts as 0 and infinities as extreme values.
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # The third triangle vertex is the average of the next bucket
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(y, buckets):
+    """Indices of the minimum and maximum of each of ``buckets`` equal slices, in order."""
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        chunk = y[start:end]
+        if np.isnan(chunk).all():
+            selected.append(start)
+            continue
+        low, high = start + int(np.nanargmin(chunk)), start + int(np.nanargmax(chunk))
+        selected.extend(sorted({low, high}))
+    return np.asarray(selected, dtype=np.int64)
+
+
+class MetricsStore:
+    def __init__(self, root):
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _directory(self, run_id, axis):
+        return os.path.join(self.root, run_id, 'metrics', axis)
+
+    def _get(self, run_id, axis, name):
+        key = (run_id, axis, name)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self._directory(run_id, axis), name)
+                steps = _load_column(series.steps_path, np.int64)
+                if len(steps):
+                    series.last_step = int(steps[-1])
+                if os.path.exists(series.values_path):
+                    # Drop values left without a step by an interrupted flush.
+                    os.truncate(series.values_path, min(os.path.getsize(series.values_path), len(steps) * 4))
+            return series
+
+    def record(self, run_id, axis, step, metrics):
+        """Append ``{name: value}`` at ``step``; non-numeric values and invalid names are ignored."""
+        for name, value in metrics.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not valid_name(name):
+                continue
+            self._get(run_id, axis, name).append(int(step), float(value))
+
+    def close_run(self, run_id):
+        """Flush and forget a finished run's open series."""
+        with self._lock:
+            keys = [key for key in self._series if key[0] == run_id]
+            series = [self._series.pop(key) for key in keys]
+        for s in series:
+            s.flush()
+
+    def list(self, run_id):
+        """``{axis: [metric names]}`` for a run, or None if it has no metrics."""
+        if not valid_name(run_id) or not os.path.isdir(os.path.join(self.root, run_id, 'metrics')):
+            return None
+        with self._lock:
+            for (run, _, _), series in self._series.items():
+                if run == run_id:
+                    series.flush()
+        result = {}
+        for axis in AXES:
+            directory = self._directory(run_id, axis)
+            if os.path.isdir(directory):
+                result[axis] = sorted(f[:-len('.f32')] for f in os.listdir(directory) if f.endswith('.f32'))
+        return result
+
+    def query(self, run_id, name, axis='step', start=None, end=None, points=DEFAULT_POINTS, method='lttb'):
+        """
+        Points of one series with ``start <= step <= end``, downsampled to about
+        ``points``. Returns ``{total, steps, values}`` or None if there is no
+        such series; non-finite values are returned as None.
+        """
+        if not valid_name(run_id) or not valid_name(name) or axis not in AXES:
+            return None
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+        with self._lock:
+            series = self._series.get((run_id, axis, name))
+        if series is not None:
+            series.flush()
+        else:
+            # Finished (or pre-restart) runs are read without keeping a writer around
+            series = _Series(self._directory(run_id, axis), name)
+        steps = _load_column(series.steps_path, np.int64)
+        if not len(steps):
+            return None
+        values = _load_column(series.values_path, np.float32, len(steps))
+        lo = 0 if start is None else int(np.searchsorted(steps, start, side='left'))
+        hi = len(steps) if end is None else int(np.searchsorted(steps, end, side='right'))
+        steps, values = steps[lo:hi], values[lo:hi]
+        points = max(3, min(points, MAX_POINTS))
+        if method == 'lttb':
+            index = lttb(steps, values, points)
+        else:
+            index = minmax(values, points // 2)
+        picked = np.asarray(values[index], dtype=np.float64)
+        return {
+            'total': len(steps),
+            'steps': np.asarray(steps[index]).tolist(),
+            'values': [v if np.isfinite(v) else None for v in picked.tolist()],
+        }
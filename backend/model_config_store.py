@@ -1,43 +1,809 @@
 # model_config_store.py
 """
-Utility for storing submitted model configs in-memory and/or in a local file for testing.
+Storage for submitted model configs.
+
+Configs are persisted through a pluggable storage engine:
+
+* ``jsonl`` (default): an append-only JSON-lines log with a binary sidecar
+  index of record offsets, so adds cost O(1) disk I/O and startup only reads
+  the (tiny) index instead of re-parsing every config ever submitted.
+* ``sqlite``: a SQLite database accessed through SQLAlchemy Core.
+
+The engine is chosen with the ``engine`` argument or the
+``MODEL_CONFIG_ENGINE`` environment variable.
+
+Given a ``dedupe_key`` (a function from config to hash), the store keeps one
+copy of equal configs: adding a config whose key is already stored returns
+the existing ID. The key -> ID map is loaded on first add from a snapshot
+(``<path>.keys``) and caught up with the configs stored after it, so only
+those are normalized and hashed again. The engine itself is opened on first
+use rather than at import.
 """
-import threading
+import functools
 import json
+import logging
 import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process only
+    fcntl = None
+
+from backend.instrumentation import TimedLock, file_write, lock_wait
+from backend.script_generator import config_key
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(__file__)
+LEGACY_FILE_PATH = os.path.join(BACKEND_DIR, 'model_configs.json')
+
+# Fields with secondary indexes, mapped to their location inside a config.
+INDEXED_FIELDS = {
+    'model_type': ('model_type',),
+    'optimizer': ('hyperparameters', 'optimizer'),
+    'loss_function': ('hyperparameters', 'loss_function'),
+}
+
+# Configs keyed since the last dedupe key snapshot before another is written
+KEY_SNAPSHOT_EVERY = 5000
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def indexed_values(config):
+    """Return ``{field: value}`` for the indexed fields a config sets to a string."""
+    values = {}
+    for field, path in INDEXED_FIELDS.items():
+        value = config
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, str):
+            values[field] = value
+    return values
+
+
+def _synchronized(method):
+    """Run an engine method under its cross-process lock, after catching up with other writers."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._locked():
+            self._refresh()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class JsonLinesEngine:
+    """
+    Append-only JSON-lines log of configs.
+
+    Each line is either ``{"id": n, "config": {...}}``, a tombstone
+    ``{"id": n, "deleted": true}`` or a ``{"meta": {...}}`` header written by
+    compaction. ``<path>.idx`` holds a 16-byte header (log size at the last
+    sync, number of garbage records) followed by one uint64 log offset per ID,
+    so lookups by ID are a single seek. If the index is missing or stale it is
+    rebuilt from the log; a log that is still a legacy JSON array is converted
+    in place.
+
+    Several processes (e.g. server workers) can share a log: operations hold
+    an exclusive ``flock`` on ``<path>.lock`` and first apply whatever other
+    processes appended since, reopening the files if the log was compacted.
+    """
+    TOMBSTONE = 0xFFFFFFFFFFFFFFFF
+    _HEADER = struct.Struct('<QQ')
+
+    def __init__(self, path, legacy_path=None, compact_min_garbage=1000, compact_ratio=0.5):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.legacy_path = legacy_path
+        self.compact_min_garbage = compact_min_garbage
+        self.compact_ratio = compact_ratio
+        self._offsets = array('Q')
+        self._garbage = 0
+        self._log_end = 0
+        self._log = None
+        self._idx = None
+        self._reader = None
+        self._lock_file = None
+        self._lock_depth = 0
+        # field -> value -> ascending array of IDs; built on first query.
+        self._secondary = None
+
+    # -- lifecycle -------------------------------------------------------
+
+    def open(self):
+        with self._locked():
+            self._open()
+
+    def _open(self):
+        self.close()
+        self._secondary = None
+        legacy = None
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            legacy = self._read_legacy(self.legacy_path)
+        elif self._looks_like_legacy():
+            legacy = self._read_legacy(self.path)
+        if legacy is not None:
+            self._rewrite(legacy)
+
+        log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if not self._load_index(log_size):
+            self._offsets = array('Q')
+            self._garbage = 0
+            self._log_end = 0
+            self._scan_tail(log_size)
+            self._write_index()
+        elif self._log_end < log_size:
+            # Records appended after the last index sync (e.g. a crash).
+            self._scan_tail(log_size)
+            self._write_index()
+
+        self._log = open(self.path, 'ab')
+        self._idx = open(self.index_path, 'r+b')
+        self._reader = open(self.path, 'rb')
+
+    def close(self):
+        for handle in (self._log, self._idx, self._reader):
+            if handle is not None:
+                handle.close()
+        self._log = self._idx = self._reader = None
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock against other processes sharing the log; re-entrant within this one."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_depth == 0:
+            if self._lock_file is None:
+                self._lock_file = open(self.path + '.lock', 'a')
+            with lock_wait.time(lock='model_config_log'):
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self):
+        """Hold the cross-process lock across several operations, e.g. a check and then an append."""
+        with self._locked():
+            self._refresh()
+            yield
+
+    def _refresh(self):
+        """Apply records other processes added since our last operation."""
+        if self._log is None:
+            return
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != os.fstat(self._log.fileno()).st_ino:
+            # Compacted (replaced) by another process
+            self._open()
+        elif stat.st_size > self._log_end:
+            known = len(self._offsets)
+            self._scan_tail(stat.st_size)
+            if self._secondary is not None:
+                for config_id in range(known + 1, len(self._offsets) + 1):
+                    config = self.get(config_id)
+                    if config is not None:
+                        self._index_config(config_id, config)
+
+    # -- engine API ------------------------------------------------------
+
+    def append(self, config):
+        return self.append_many([config])[0]
+
+    @_synchronized
+    def append_many(self, configs):
+        first_id = len(self._offsets) + 1
+        lines = []
+        offsets = []
+        position = self._log_end
+        for i, config in enumerate(configs):
+            line = self._encode({'id': first_id + i, 'config': config})
+            offsets.append(position)
+            position += len(line)
+            lines.append(line)
+        with file_write.time(store='model_config_log'):
+            self._log.write(b''.join(lines))
+            self._log.flush()
+        self._log_end = position
+        self._offsets.extend(offsets)
+        self._idx.seek(0, os.SEEK_END)
+        self._idx.write(array('Q', offsets).tobytes())
+        self._sync_header()
+        if self._secondary is not None:
+            for i, config in enumerate(configs):
+                self._index_config(first_id + i, config)
+        return list(range(first_id, first_id + len(lines)))
+
+    @_synchronized
+    def get(self, config_id):
+        offset = self._offset(config_id)
+        if offset is None:
+            return None
+        self._reader.seek(offset)
+        return json.loads(self._reader.readline())['config']
+
+    @_synchronized
+    def delete(self, config_id):
+        if self._offset(config_id) is None:
+            return False
+        line = self._encode({'id': config_id, 'deleted': True})
+        self._log.write(line)
+        self._log.flush()
+        self._log_end += len(line)
+        self._offsets[config_id - 1] = self.TOMBSTONE
+        self._idx.seek(self._HEADER.size + (config_id - 1) * 8)
+        self._idx.write(struct.pack('<Q', self.TOMBSTONE))
+        # The dead record and its tombstone are both garbage now.
+        self._garbage += 2
+        self._sync_header()
+        if self._garbage >= self.compact_min_garbage and self._garbage > self.compact_ratio * self.count():
+            self.compact()
+        return True
+
+    @_synchronized
+    def iter_configs(self):
+        return self._iter_configs(array('Q', self._offsets))
+
+    def _iter_configs(self, offsets):
+        with open(self.path, 'rb') as f:
+            for config_id, offset in enumerate(offsets, start=1):
+                if offset == self.TOMBSTONE:
+                    continue
+                f.seek(offset)
+                yield config_id, json.loads(f.readline())['config']
+
+    @_synchronized
+    def count(self):
+        return len(self._offsets) - self._offsets.count(self.TOMBSTONE)
+
+    @_synchronized
+    def query(self, filters, cursor, limit):
+        """Return up to ``limit`` ``(id, config)`` pairs with ID > ``cursor`` matching ``filters``."""
+        if filters:
+            if self._secondary is None:
+                self._secondary = {field: {} for field in INDEXED_FIELDS}
+                for config_id, config in self.iter_configs():
+                    self._index_config(config_id, config)
+            postings = sorted(
+                (self._secondary[field].get(value, array('Q')) for field, value in filters.items()),
+                key=len,
+            )
+            first = postings[0]
+            candidates = (first[i] for i in range(bisect_right(first, cursor), len(first)))
+            others = postings[1:]
+        else:
+            candidates = range(cursor + 1, len(self._offsets) + 1)
+            others = []
+        results = []
+        for config_id in candidates:
+            if len(results) >= limit:
+                break
+            if not all(_contains(ids, config_id) for ids in others):
+                continue
+            config = self.get(config_id)
+            if config is not None:
+                results.append((config_id, config))
+        return results
+
+    @_synchronized
+    def compact(self):
+        """Rewrite the log without garbage, keeping IDs stable."""
+        records = [(config_id, config) for config_id, config in self.iter_configs()]
+        next_id = len(self._offsets) + 1
+        self.close()
+        self._rewrite(records, next_id=next_id)
+        self._open()
+
+    # -- internals -------------------------------------------------------
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def _offset(self, config_id):
+        if not isinstance(config_id, int) or not 0 < config_id <= len(self._offsets):
+            return None
+        offset = self._offsets[config_id - 1]
+        return None if offset == self.TOMBSTONE else offset
+
+    def _index_config(self, config_id, config):
+        for field, value in indexed_values(config).items():
+            self._secondary[field].setdefault(value, array('Q')).append(config_id)
+
+    def _sync_header(self):
+        self._idx.seek(0)
+        self._idx.write(self._HEADER.pack(self._log_end, self._garbage))
+        self._idx.flush()
+
+    def _load_index(self, log_size):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) < self._HEADER.size or (len(data) - self._HEADER.size) % 8:
+            return False
+        log_end, garbage = self._HEADER.unpack_from(data)
+        if log_end > log_size or not _ends_with_newline(self.path, log_end):
+            return False
+        self._offsets = array('Q')
+        self._offsets.frombytes(data[self._HEADER.size:])
+        self._log_end = log_end
+        self._garbage = garbage
+        return True
+
+    def _write_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._HEADER.pack(self._log_end, self._garbage))
+            f.write(self._offsets.tobytes())
+        os.replace(tmp_path, self.index_path)
+
+    def _scan_tail(self, log_size):
+        """Apply log records between the last synced offset and ``log_size``."""
+        if not os.path.exists(self.path):
+            open(self.path, 'ab').close()
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._log_end)
+            position = self._log_end
+            for line in f:
+                offset = position
+                position += len(line)
+                try:
+                    record = json.loads(line)
+                    config_id = record.get('id')
+                except (ValueError, AttributeError):
+                    logger.warning("Skipping malformed record at offset %d in %s", offset, self.path)
+                    self._garbage += 1
+                    continue
+                if 'meta' in record:
+                    self._pad_to(record['meta'].get('next_id', 1) - 1)
+                    continue
+                if not isinstance(config_id, int) or config_id < 1:
+                    self._garbage += 1
+                    continue
+                self._pad_to(config_id)
+                if record.get('deleted'):
+                    if self._offsets[config_id - 1] != self.TOMBSTONE:
+                        self._garbage += 1
+                    self._offsets[config_id - 1] = self.TOMBSTONE
+                    self._garbage += 1
+                else:
+                    self._offsets[config_id - 1] = offset
+        if not _ends_with_newline(self.path, position):
+            # Terminate a torn final line so the next append starts cleanly.
+            with open(self.path, 'ab') as f:
+                f.write(b'\n')
+            position += 1
+        self._log_end = position
+
+    def _pad_to(self, size):
+        while len(self._offsets) < size:
+            self._offsets.append(self.TOMBSTONE)
+
+    def _looks_like_legacy(self):
+        try:
+            with open(self.path, 'rb') as f:
+                head = f.read(64).lstrip()
+        except OSError:
+            return False
+        return head.startswith(b'[')
+
+    @staticmethod
+    def _read_legacy(path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Could not read legacy config file %s", path)
+            return None
+        if not isinstance(data, list):
+            return None
+        return list(enumerate(data, start=1))
+
+    def _rewrite(self, records, next_id=None):
+        """Write ``records`` (``(id, config)`` pairs) as a fresh log and index."""
+        if next_id is None:
+            next_id = (records[-1][0] + 1) if records else 1
+        tmp_path = self.path + '.compact'
+        offsets = array('Q', [self.TOMBSTONE]) * (next_id - 1)
+        with open(tmp_path, 'wb') as f:
+            header = self._encode({'meta': {'next_id': next_id}})
+            f.write(header)
+            position = len(header)
+            for config_id, config in records:
+                line = self._encode({'id': config_id, 'config': config})
+                offsets[config_id - 1] = position
+                f.write(line)
+                position += len(line)
+        os.replace(tmp_path, self.path)
+        self._offsets = offsets
+        self._log_end = position
+        self._garbage = 0
+        self._write_index()
+
+
+def _contains(sorted_ids, config_id):
+    i = bisect_left(sorted_ids, config_id)
+    return i < len(sorted_ids) and sorted_ids[i] == config_id
 
-# In-memory store (thread-safe)
+
+def _ends_with_newline(path, size):
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+class SQLiteEngine:
+    """Configs stored in a SQLite database through SQLAlchemy Core."""
+
+    def __init__(self, path):
+        self.path = path
+        self._engine = None
+        self._table = None
+        self._lock_file = None
+
+    def open(self):
+        from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, event
+
+        self.close()
+        engine = create_engine(f"sqlite:///{self.path}")
+
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        metadata = MetaData()
+        self._table = Table(
+            'model_configs', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('model_type', String, index=True),
+            Column('optimizer', String, index=True),
+            Column('loss_function', String, index=True),
+            Column('config', Text, nullable=False),
+            # AUTOINCREMENT keeps IDs monotonic even after deletes.
+            sqlite_autoincrement=True,
+        )
+        metadata.create_all(engine)
+        self._engine = engine
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.dispose()
+        self._engine = None
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock against other processes, held across several operations."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.path + '.lock', 'a')
+        with lock_wait.time(lock='model_config_db'):
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def append(self, config):
+        return self.append_many([config])[0]
+
+    def append_many(self, configs):
+        ids = []
+        with self._engine.begin() as conn:
+            for config in configs:
+                result = conn.execute(self._table.insert().values(**self._row(config)))
+                ids.append(result.inserted_primary_key[0])
+        return ids
+
+    def get(self, config_id):
+        from sqlalchemy import select
+
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                select(self._table.c.config).where(self._table.c.id == config_id)
+            ).first()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, config_id):
+        with self._engine.begin() as conn:
+            result = conn.execute(self._table.delete().where(self._table.c.id == config_id))
+        return result.rowcount > 0
+
+    def iter_configs(self):
+        from sqlalchemy import select
+
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                select(self._table.c.id, self._table.c.config).order_by(self._table.c.id)
+            )
+            for config_id, body in rows:
+                yield config_id, json.loads(body)
+
+    def count(self):
+        from sqlalchemy import func, select
+
+        with self._engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self._table)).scalar()
+
+    def query(self, filters, cursor, limit):
+        from sqlalchemy import select
+
+        stmt = select(self._table.c.id, self._table.c.config).where(self._table.c.id > cursor)
+        for field, value in filters.items():
+            stmt = stmt.where(self._table.c[field] == value)
+        stmt = stmt.order_by(self._table.c.id).limit(limit)
+        with self._engine.connect() as conn:
+            return [(config_id, json.loads(body)) for config_id, body in conn.execute(stmt)]
+
+    def compact(self):
+        from sqlalchemy import text
+
+        with self._engine.connect() as conn:
+            conn.execute(text("VACUUM"))
+
+    @staticmethod
+    def _row(config):
+        row = dict.fromkeys(INDEXED_FIELDS)
+        row.update(indexed_values(config))
+        row['config'] = json.dumps(config)
+        return row
+
+
+ENGINES = {
+    'jsonl': JsonLinesEngine,
+    'sqlite': SQLiteEngine,
+}
+
+DEFAULT_FILE_NAMES = {
+    'jsonl': 'model_configs.jsonl',
+    'sqlite': 'model_configs.sqlite3',
+}
+
+
+# Thread-safe store front-end
 class ModelConfigStore:
-    def __init__(self, file_path=None):
-        self._configs = []
-        self._lock = threading.Lock()
-        self.file_path = file_path or os.path.join(os.path.dirname(__file__), 'model_configs.json')
+    def __init__(self, file_path=None, engine=None, dedupe_key=None):
+        self._lock = TimedLock('model_config_store')
+        self.dedupe_key = dedupe_key
+        # dedupe key -> ID, built on first add
+        self._keys = None
+        if engine is None or isinstance(engine, str):
+            name = engine or os.getenv('MODEL_CONFIG_ENGINE', 'jsonl')
+            if name not in ENGINES:
+                raise ValueError(f"Unknown model config engine '{name}'")
+            self.file_path = file_path or os.path.join(BACKEND_DIR, DEFAULT_FILE_NAMES[name])
+            if name == 'jsonl':
+                # Import configs saved by the old whole-file JSON store.
+                legacy_path = LEGACY_FILE_PATH if file_path is None else None
+                engine = JsonLinesEngine(self.file_path, legacy_path=legacy_path)
+            else:
+                engine = ENGINES[name](self.file_path)
+        else:
+            self.file_path = getattr(engine, 'path', file_path)
+        self._engine = engine
+        self._opened = False
+        self.keys_path = self.file_path + '.keys' if self.file_path else None
+
+    def _ensure_open(self):
+        if not self._opened:
+            self._engine.open()
+            self._opened = True
+
+    def warm_up(self):
+        """Open the engine and load the dedupe key map now rather than on first use."""
+        with self._lock:
+            self._ensure_open()
+            if self.dedupe_key is not None:
+                self._append_unique([])
 
     def add(self, config):
+        """Persist a config and return its ID (``None`` if it could not be written)."""
+        config_id, _ = self.add_or_get(config)
+        return config_id
+
+    def add_or_get(self, config):
+        """
+        Like ``add``, but returns ``(id, created)``; ``created`` is False when
+        an equal config was already stored and its ID is returned instead.
+        """
+        results = self.add_or_get_many([config])
+        return (None, False) if results is None else results[0]
+
+    def add_or_get_many(self, configs):
+        """
+        ``(id, created)`` for each of ``configs``, appending the new ones in a
+        single write; ``None`` if they could not be written.
+        """
         with self._lock:
-            self._configs.append(config)
-            self._save_to_file()
+            try:
+                self._ensure_open()
+                return self._append_unique(configs)
+            except OSError:
+                logger.exception("Failed to write model configs to %s", self.file_path)
+                return None
+
+    def add_many(self, configs):
+        """Persist several configs in one write; returns their IDs (``None`` if they could not be written)."""
+        results = self.add_or_get_many(configs)
+        return None if results is None else [config_id for config_id, _ in results]
+
+    def _append_unique(self, configs):
+        """Append the configs not stored yet; ``(id, created)`` for each."""
+        if self.dedupe_key is None:
+            return [(config_id, True) for config_id in self._engine.append_many(configs)]
+        # Other processes must not append between the catch-up, the check and the append
+        with self._engine.locked():
+            return self._append_unique_locked(configs)
+
+    def _append_unique_locked(self, configs):
+        if self._keys is None:
+            self._load_keys()
+        # Catch up with configs other processes added since the last call
+        while True:
+            page = self._engine.query({}, self._keyed_upto, MAX_PAGE_SIZE)
+            if not page:
+                break
+            for config_id, config in page:
+                key = self.dedupe_key(config)
+                known = self._keys.get(key)
+                # The first copy wins, unless the snapshot's copy was deleted since
+                if known is None or self._engine.get(known) is None:
+                    self._keys[key] = config_id
+            self._keyed_upto = page[-1][0]
+        keys = [self.dedupe_key(config) for config in configs]
+        new = {}
+        for key, config in zip(keys, configs):
+            if key in self._keys:
+                stored = self._engine.get(self._keys[key])
+                if stored is None or self.dedupe_key(stored) != key:
+                    # Deleted by another process, or a stale snapshot entry
+                    del self._keys[key]
+            if key not in self._keys:
+                new.setdefault(key, config)
+        if new:
+            ids = self._engine.append_many(list(new.values()))
+            self._keys.update(zip(new, ids))
+            self._keyed_upto = max(self._keyed_upto, ids[-1])
+        if self._keyed_upto - self._snapshot_upto >= KEY_SNAPSHOT_EVERY:
+            self._save_keys()
+        # Repeats within ``configs`` are duplicates of their first occurrence
+        results = []
+        for key in keys:
+            results.append((self._keys[key], key in new))
+            new.pop(key, None)
+        return results
+
+    def _load_keys(self):
+        """Start the key -> ID map from its snapshot, unless it was made with another key function."""
+        self._keys, self._keyed_upto, self._snapshot_upto = {}, 0, 0
+        if self.keys_path is None:
+            return
+        try:
+            with open(self.keys_path) as f:
+                snapshot = json.load(f)
+            keys, keyed_upto, sample = snapshot['keys'], snapshot['keyed_upto'], snapshot['sample']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unreadable dedupe key snapshot %s", self.keys_path)
+            return
+        if sample is not None:
+            # Re-key one stored config to catch a changed normalization or a replaced log
+            config = self._engine.get(sample[0])
+            if config is None or self.dedupe_key(config) != sample[1]:
+                return
+        self._keys, self._keyed_upto, self._snapshot_upto = keys, keyed_upto, keyed_upto
+
+    def _save_keys(self):
+        if self.keys_path is None:
+            return
+        newest = max(self._keys.items(), key=lambda item: item[1], default=None)
+        snapshot = {
+            'keyed_upto': self._keyed_upto,
+            'sample': None if newest is None else [newest[1], newest[0]],
+            'keys': self._keys,
+        }
+        tmp_path = f'{self.keys_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_path, self.keys_path)
+        except (OSError, TypeError):
+            # Only a startup speed-up; the map is rebuilt from the engine without it
+            logger.warning("Could not write dedupe key snapshot %s", self.keys_path, exc_info=True)
+            return
+        self._snapshot_upto = self._keyed_upto
+
+    def get(self, config_id):
+        with self._lock:
+            self._ensure_open()
+            return self._engine.get(config_id)
+
+    def delete(self, config_id):
+        with self._lock:
+            self._ensure_open()
+            if self._keys is not None:
+                config = self._engine.get(config_id)
+                if config is not None and self._keys.get(self.dedupe_key(config)) == config_id:
+                    del self._keys[self.dedupe_key(config)]
+            return self._engine.delete(config_id)
 
     def get_all(self):
         with self._lock:
-            return list(self._configs)
+            try:
+                self._ensure_open()
+            except OSError:
+                return []
+            return [config for _, config in self._engine.iter_configs()]
 
-    def _save_to_file(self):
-        try:
-            with open(self.file_path, 'w') as f:
-                json.dump(self._configs, f, indent=2)
-        except Exception as e:
-            # Log or handle file write error
-            pass
+    def count(self):
+        with self._lock:
+            self._ensure_open()
+            return self._engine.count()
+
+    def query(self, cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
+        """
+        Page through configs in ID order, optionally filtered on ``INDEXED_FIELDS``.
+        Returns ``(items, next_cursor)`` where items are ``(id, config)`` pairs and
+        ``next_cursor`` is ``None`` on the last page.
+        """
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot filter on: {', '.join(sorted(unknown))}")
+        filters = {field: value for field, value in filters.items() if value is not None}
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            self._ensure_open()
+            # Fetch one extra item to learn whether another page exists.
+            items = self._engine.query(filters, cursor or 0, limit + 1)
+        if len(items) > limit:
+            return items[:limit], items[limit - 1][0]
+        return items, None
+
+    def compact(self):
+        with self._lock:
+            self._ensure_open()
+            self._engine.compact()
 
     def load_from_file(self):
-        if os.path.exists(self.file_path):
+        """(Re)open the storage engine, picking up changes made on disk."""
+        with self._lock:
+            self._keys = None
             try:
-                with open(self.file_path, 'r') as f:
-                    self._configs = json.load(f)
-            except Exception:
-                self._configs = []
-
-# Singleton instance for app use
-model_config_store = ModelConfigStore()
-model_config_store.load_from_file()
+                self._engine.open()
+                self._opened = True
+            except OSError:
+                logger.exception("Failed to open model config store at %s", self.file_path)
+                self._opened = False
+
+    def close(self):
+        with self._lock:
+            if self._keys is not None and self._keyed_upto > self._snapshot_upto:
+                self._save_keys()
+            self._engine.close()
+            self._opened = False
+
+# Singleton instance for app use; equal configs are stored once. Opened on first use.
+model_config_store = ModelConfigStore(dedupe_key=config_key)
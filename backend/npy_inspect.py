@@ -0,0 +1,255 @@
+# npy_inspect.py
+"""
+Inspection of uploaded ``.npy`` arrays: shape, dtype, per-channel statistics
+and a downsampled 2D preview.
+
+Arrays are opened with ``mmap_mode='r'`` and statistics are computed in
+vectorized passes over blocks of about ``INSPECT_BLOCK_BYTES``, merging
+per-block means and variances (Chan et al.), so memory use does not depend on
+the array size. Statistics are cached per channel axis in a JSON file next
+to the array; previews only read the strided elements and are kept in a
+small in-memory LRU. Both are discarded when the file's size or mtime
+changes.
+"""
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.instrumentation import cache_lookups
+
+INSPECT_BLOCK_BYTES = int(os.getenv("INSPECT_BLOCK_BYTES", 64 * 1024 * 1024))
+DEFAULT_PREVIEW_SIZE = 64
+MAX_PREVIEW_SIZE = 512
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", 256))
+
+
+class InspectError(Exception):
+    pass
+
+
+def _open(path):
+    try:
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+    except (ValueError, OSError, EOFError) as e:
+        raise InspectError(f"Not a readable .npy array: {e}") from e
+
+
+def _normalize_axis(axis, ndim, name):
+    if axis is None:
+        return None
+    if not -ndim <= axis < ndim:
+        raise InspectError(f"{name} {axis} is out of range for a {ndim}-D array")
+    return axis % ndim
+
+
+def _blocks(shape, limit):
+    """
+    Index tuples that tile an array of ``shape`` with blocks of at most
+    ``limit`` elements: whole trailing axes where they fit, a range of the
+    next axis, and single indices of the leading ones.
+    """
+    axis, inner = len(shape) - 1, 1
+    while axis > 0 and inner * shape[axis] <= limit:
+        inner *= shape[axis]
+        axis -= 1
+    step = max(1, limit // inner)
+    for prefix in np.ndindex(*shape[:axis]):
+        for start in range(0, shape[axis], step):
+            yield prefix + (slice(start, start + step),)
+
+
+def _json_floats(values):
+    """``values`` as (nested) lists of floats, with ``None`` for NaN and infinities."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def channel_stats(array, channel_axis=None, block_bytes=INSPECT_BLOCK_BYTES):
+    """
+    Per-channel ``{min, max, mean, std}`` lists (one entry if ``channel_axis``
+    is None), computed block by block over the array. Values that are not
+    finite are ``None``.
+    """
+    if array.size == 0:
+        return None
+    # A view with the channels last, so every block is a (samples, channels) slab
+    if channel_axis is None:
+        view = array[..., np.newaxis]
+    else:
+        view = np.moveaxis(array, channel_axis, -1)
+    channels = view.shape[-1]
+
+    # Blocks are converted to float64, so size them by that width.
+    limit = max(1, block_bytes // 8)
+    count = np.zeros(channels)
+    mean = np.zeros(channels)
+    m2 = np.zeros(channels)
+    low = np.full(channels, np.inf)
+    high = np.full(channels, -np.inf)
+    # NaN and infinities propagate to the results (reported as None) without warnings
+    with np.errstate(invalid='ignore'):
+        for index in _blocks(view.shape, limit):
+            block = np.asarray(view[index], dtype=np.float64)
+            # The channels this block covers (all of them unless the channel axis was split)
+            part = index[-1] if len(index) == view.ndim else slice(None)
+            block = block.reshape(-1, block.shape[-1])
+            n = block.shape[0]
+            block_mean = block.mean(axis=0)
+            block_m2 = ((block - block_mean) ** 2).sum(axis=0)
+            delta = block_mean - mean[part]
+            total = count[part] + n
+            m2[part] += block_m2 + delta ** 2 * (count[part] * n / total)
+            mean[part] += delta * (n / total)
+            count[part] = total
+            np.minimum(low[part], block.min(axis=0), out=low[part])
+            np.maximum(high[part], block.max(axis=0), out=high[part])
+        std = np.sqrt(m2 / count)
+    return {
+        'min': _json_floats(low),
+        'max': _json_floats(high),
+        'mean': _json_floats(mean),
+        'std': _json_floats(std),
+    }
+
+
+def preview(array, slice_axis=0, slice_index=None, size=DEFAULT_PREVIEW_SIZE):
+    """
+    Downsampled slice as nested lists: the array is indexed at ``slice_index``
+    (default: the middle) along ``slice_axis``, then at the middle of leading
+    axes until at most two dimensions remain, then strided to at most ``size``
+    points per side. Only the strided elements are read from the mapping.
+    """
+    view = array
+    if view.ndim > 2:
+        length = view.shape[slice_axis]
+        if slice_index is None:
+            slice_index = length // 2
+        if not -length <= slice_index < length:
+            raise InspectError(f"slice_index {slice_index} is out of range for axis {slice_axis}")
+        view = view[(slice(None),) * slice_axis + (slice_index,)]
+    while view.ndim > 2:
+        view = view[view.shape[0] // 2]
+    steps = tuple(max(1, -(-dim // size)) for dim in view.shape)
+    sampled = view[tuple(slice(None, None, step) for step in steps)]
+    return {
+        'shape': list(sampled.shape),
+        'step': list(steps),
+        'data': _json_floats(sampled),
+    }
+
+
+def _inspectable(array):
+    if not (np.issubdtype(array.dtype, np.number) or array.dtype == np.bool_):
+        return False
+    if np.iscomplexobj(array):
+        raise InspectError("Complex arrays are not supported")
+    return True
+
+
+def _preview_params(array, slice_axis, preview_size):
+    if array.ndim > 2:
+        slice_axis = _normalize_axis(slice_axis, array.ndim, 'slice_axis')
+    return slice_axis, max(1, min(preview_size, MAX_PREVIEW_SIZE))
+
+
+def inspect_npy(path, channel_axis=None, slice_axis=0, slice_index=None, preview_size=DEFAULT_PREVIEW_SIZE):
+    array = _open(path)
+    channel_axis = _normalize_axis(channel_axis, array.ndim, 'channel_axis')
+    slice_axis, preview_size = _preview_params(array, slice_axis, preview_size)
+    result = {'shape': list(array.shape), 'dtype': str(array.dtype), 'stats': None, 'preview': None}
+    if _inspectable(array):
+        result['stats'] = channel_stats(array, channel_axis)
+        if array.size:
+            result['preview'] = preview(array, slice_axis, slice_index, preview_size)
+    return result
+
+
+class PreviewCache:
+    """Thread-safe LRU of recent previews, keyed by file, fingerprint and slice."""
+
+    def __init__(self, maxsize=PREVIEW_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_previews = PreviewCache()
+
+
+def _cached_stats(path, fingerprint, array, channel_axis):
+    """
+    ``channel_stats`` cached in ``<path>.inspect.json``, one entry per channel
+    axis, so the file holds at most ``ndim + 1`` results and is only
+    rewritten when a new axis is computed.
+    """
+    cache_path = path + '.inspect.json'
+    key = str(channel_axis)
+    cache = {}
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if cache.get('file') != fingerprint or not isinstance(cache.get('stats'), dict):
+        cache = {'file': fingerprint, 'stats': {}}
+    if key in cache['stats']:
+        cache_lookups.inc(cache='npy_inspect', result='hit')
+        return cache['stats'][key]
+    cache_lookups.inc(cache='npy_inspect', result='miss')
+    stats = cache['stats'][key] = channel_stats(array, channel_axis)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or '.',
+                                        prefix=os.path.basename(cache_path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        # Caching is best effort (e.g. a read-only blob directory)
+        pass
+    return stats
+
+
+def cached_inspect(path, channel_axis=None, slice_axis=0, slice_index=None, preview_size=DEFAULT_PREVIEW_SIZE):
+    """
+    ``inspect_npy`` with the statistics cached next to the file (see
+    ``_cached_stats``) and previews in a bounded in-memory LRU. Both are
+    discarded when the file's size or mtime changes.
+    """
+    st = os.stat(path)
+    fingerprint = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    array = _open(path)
+    channel_axis = _normalize_axis(channel_axis, array.ndim, 'channel_axis')
+    slice_axis, preview_size = _preview_params(array, slice_axis, preview_size)
+    result = {'shape': list(array.shape), 'dtype': str(array.dtype), 'stats': None, 'preview': None}
+    if not _inspectable(array):
+        return result
+    result['stats'] = _cached_stats(path, fingerprint, array, channel_axis)
+    if array.size:
+        key = (path, st.st_size, st.st_mtime_ns, slice_axis, slice_index, preview_size)
+        result['preview'] = _previews.get(key)
+        if result['preview'] is None:
+            result['preview'] = preview(array, slice_axis, slice_index, preview_size)
+            _previews.set(key, result['preview'])
+    return result
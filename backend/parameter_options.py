@@ -0,0 +1,15 @@
+# parameter_options.py
+"""
+Options offered by ``/api/parameter-options``. The script generator emits
+code for every one of them, so new options need a template branch too.
+"""
+
+MODEL_TYPES = ["CNN", "RNN", "UNet", "ResNet", "Transformer"]
+LOSS_FUNCTIONS = ["CrossEntropy", "MSE", "MAE", "Dice", "BCEWithLogits"]
+OPTIMIZERS = ["Adam", "SGD", "RMSprop", "Adagrad", "AdamW"]
+
+PARAMETER_OPTIONS = {
+    "modelTypes": MODEL_TYPES,
+    "lossFunctions": LOSS_FUNCTIONS,
+    "optimizers": OPTIMIZERS,
+}
@@ -0,0 +1,537 @@
+# preprocessing.py
+"""
+Server-side dataset preprocessing.
+
+A config can ask for its images to be prepared once on the server instead of
+decoded and normalized by every training run:
+
+    "dataset": {
+        "images": "series:<SeriesInstanceUID>",
+        "labels": "labels.npy",
+        "preprocess": {"spacing": [1.0, 1.0], "size": [128, 128],
+                       "clip": [-1000, 400], "normalize": "zscore"}
+    }
+
+``images`` is a stored ``.npy`` file, a list of stored ``.dcm``/``.png`` files
+(one sample each), or ``series:<uid>`` for every stored slice of a DICOM
+series in instance order. Each image is decoded (DICOM with its rescale
+slope and intercept applied; PNG needs Pillow), resampled from its pixel
+spacing to ``spacing``, center-cropped or padded to ``size``, clipped, and
+written into one contiguous float32 ``(N, C, H, W)`` ``.npy`` file. That file
+is then normalized with statistics of the whole dataset. Training scripts
+memory-map it (``DEEPBUILDER_PREPROCESSED_IMAGES``).
+
+For segmentation models the ``labels`` masks ((N, H, W) or (N, 1, H, W)
+``.npy``) go through the same geometry with nearest-neighbour resampling and
+background (0) padding, so they stay aligned with their images. They are
+written next to the images as int64 (N, H, W) ``labels.npy``
+(``DEEPBUILDER_PREPROCESSED_LABELS``).
+
+Results are cached under a hash of the source files' content and the
+transform parameters. Least recently used entries are evicted once the cache
+grows past ``PREPROCESS_CACHE_BYTES``. Builds are serialized per key across
+processes, so concurrent jobs on the same data preprocess it once. A build
+checks its ``cancelled()`` callback between samples, so cancelling the job
+waiting for it stops the build.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process only
+    fcntl = None
+
+from backend.dataset_store import MAX_PAGE_SIZE, dataset_store
+from backend.instrumentation import cache_lookups
+from backend.script_generator import SEGMENTATION_MODELS
+from backend.uploads import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_DIR = os.getenv("PREPROCESS_DIR") or os.path.join(UPLOAD_DIR, '.preprocessed')
+PREPROCESS_CACHE_BYTES = int(os.getenv("PREPROCESS_CACHE_BYTES", 20 * 1024 ** 3))
+
+# Bump when the output of a given source and parameters changes
+PREPROCESS_VERSION = 1
+
+SERIES_PREFIX = 'series:'
+NORMALIZATIONS = ('zscore', 'minmax', 'none')
+MAX_SIZE = 4096
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+# Samples normalized per step in the second pass
+NORMALIZE_BATCH = 64
+
+
+class PreprocessError(Exception):
+    pass
+
+
+class PreprocessCancelled(PreprocessError):
+    """The build was stopped because its ``cancelled()`` callback returned True."""
+
+
+def _pair(value, kind, name):
+    if (
+        not isinstance(value, (list, tuple)) or len(value) != 2
+        or any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in value)
+    ):
+        raise PreprocessError(f"{name} must be a list of two numbers")
+    return [kind(v) for v in value]
+
+
+def preprocess_params(spec):
+    """Validated, canonical transform parameters from a ``preprocess`` spec; raises ``PreprocessError``."""
+    if not isinstance(spec, dict):
+        raise PreprocessError("preprocess must be an object")
+    unknown = set(spec) - {'spacing', 'source_spacing', 'size', 'clip', 'normalize'}
+    if unknown:
+        raise PreprocessError(f"Unknown preprocess options: {', '.join(sorted(unknown))}")
+    params = {}
+    for name in ('spacing', 'source_spacing'):
+        if spec.get(name) is not None:
+            params[name] = _pair(spec[name], float, name)
+            if min(params[name]) <= 0:
+                raise PreprocessError(f"{name} must be positive")
+    if spec.get('size') is not None:
+        size = _pair(spec['size'], float, 'size')
+        if any(not v.is_integer() or not 1 <= v <= MAX_SIZE for v in size):
+            raise PreprocessError(f"size must be two integers from 1 to {MAX_SIZE}")
+        params['size'] = [int(v) for v in size]
+    if spec.get('clip') is not None:
+        params['clip'] = _pair(spec['clip'], float, 'clip')
+        if params['clip'][0] >= params['clip'][1]:
+            raise PreprocessError("clip must be [low, high] with low < high")
+    params['normalize'] = spec.get('normalize', 'zscore')
+    if params['normalize'] not in NORMALIZATIONS:
+        raise PreprocessError(f"normalize must be one of {', '.join(NORMALIZATIONS)}")
+    return params
+
+
+def requested(config):
+    """Whether ``config`` asks for server-side preprocessing."""
+    dataset = config.get('dataset')
+    return isinstance(dataset, dict) and 'preprocess' in dataset
+
+
+def transforms_labels(config):
+    """Whether ``config``'s labels are masks that must be transformed with its images."""
+    return config.get('model_type') in SEGMENTATION_MODELS
+
+
+def validate_dataset(config):
+    """Messages for an invalid preprocessing request in ``config``; empty if there is none or it is valid."""
+    if not requested(config):
+        return []
+    dataset = config['dataset']
+    errors = []
+    try:
+        preprocess_params(dataset['preprocess'])
+    except PreprocessError as e:
+        errors.append(str(e))
+    images = dataset.get('images')
+    if not (
+        (isinstance(images, str) and images)
+        or (isinstance(images, list) and images and all(isinstance(name, str) and name for name in images))
+    ):
+        errors.append("images must be a file name, a list of file names or series:<SeriesInstanceUID>")
+    if not isinstance(dataset.get('labels'), str) or not dataset['labels']:
+        errors.append("labels must be a file name")
+    return errors
+
+
+def resize(image, height, width):
+    """Bilinear resize of a ``(C, H, W)`` array (pixel centers aligned, like most imaging libraries)."""
+    _, h, w = image.shape
+    if (h, w) == (height, width):
+        return image
+
+    def axis(n_out, n_in):
+        positions = np.clip((np.arange(n_out) + 0.5) * n_in / n_out - 0.5, 0, n_in - 1)
+        low = np.floor(positions).astype(np.intp)
+        return low, np.minimum(low + 1, n_in - 1), (positions - low).astype(np.float32)
+
+    y0, y1, wy = axis(height, h)
+    x0, x1, wx = axis(width, w)
+    rows = image[:, y0] * (1 - wy)[None, :, None] + image[:, y1] * wy[None, :, None]
+    return rows[:, :, x0] * (1 - wx) + rows[:, :, x1] * wx
+
+
+def resize_nearest(image, height, width):
+    """Nearest-neighbour resize of a ``(C, H, W)`` array, for label masks."""
+    _, h, w = image.shape
+    if (h, w) == (height, width):
+        return image
+    rows = np.minimum(((np.arange(height) + 0.5) * h / height).astype(np.intp), h - 1)
+    cols = np.minimum(((np.arange(width) + 0.5) * w / width).astype(np.intp), w - 1)
+    return image[:, rows[:, None], cols]
+
+
+def fit(image, height, width, fill):
+    """Center-crop or pad a ``(C, H, W)`` array to ``height`` x ``width``."""
+    channels, h, w = image.shape
+    out = np.full((channels, height, width), fill, dtype=image.dtype)
+    top, left = (h - height) // 2, (w - width) // 2
+    src_y, dst_y = max(top, 0), max(-top, 0)
+    src_x, dst_x = max(left, 0), max(-left, 0)
+    rows, cols = min(h - src_y, height - dst_y), min(w - src_x, width - dst_x)
+    out[:, dst_y:dst_y + rows, dst_x:dst_x + cols] = image[:, src_y:src_y + rows, src_x:src_x + cols]
+    return out
+
+
+def transform(image, spacing, params, mask=False):
+    """
+    Resample, fit and clip one ``(C, H, W)`` float32 image with ``spacing`` =
+    its ``[row, column]`` mm. With ``mask``, resample an integer label mask
+    the same way, but nearest-neighbour, padded with 0 and not clipped.
+    """
+    _, h, w = image.shape
+    interpolate = resize_nearest if mask else resize
+    if 'spacing' in params:
+        target = params['spacing']
+        height = max(1, round(h * spacing[0] / target[0]))
+        width = max(1, round(w * spacing[1] / target[1]))
+        image = interpolate(image, height, width)
+        if 'size' in params:
+            image = fit(image, *params['size'], fill=0 if mask else float(image.min()))
+    elif 'size' in params:
+        image = interpolate(image, *params['size'])
+    if mask:
+        return image
+    if 'clip' in params:
+        image = np.clip(image, *params['clip'])
+    return image.astype(np.float32, copy=False)
+
+
+def _as_chw(pixels):
+    pixels = np.asarray(pixels, dtype=np.float32)
+    if pixels.ndim == 2:
+        return pixels[None]
+    if pixels.ndim == 3:
+        # Color images are (H, W, C); keep RGB, drop alpha
+        return np.moveaxis(pixels[..., :3], -1, 0)
+    raise PreprocessError(f"Unsupported image shape {pixels.shape}")
+
+
+def decode_dicom(path):
+    import pydicom
+
+    try:
+        ds = pydicom.dcmread(path)
+        pixels = ds.pixel_array.astype(np.float32)
+    except Exception as e:
+        raise PreprocessError(f"Cannot decode DICOM pixel data: {e}") from e
+    if pixels.ndim == 3 and int(ds.get('SamplesPerPixel', 1)) == 1:
+        raise PreprocessError("Multi-frame DICOM files are not supported; upload one slice per file")
+    pixels = pixels * float(ds.get('RescaleSlope', 1) or 1) + float(ds.get('RescaleIntercept', 0) or 0)
+    spacing = ds.get('PixelSpacing')
+    return _as_chw(pixels), [float(spacing[0]), float(spacing[1])] if spacing else None
+
+
+def decode_png(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PreprocessError("Decoding PNG images requires the Pillow package")
+    try:
+        with Image.open(path) as image:
+            return _as_chw(np.array(image)), None
+    except OSError as e:
+        raise PreprocessError(f"Cannot decode PNG: {e}") from e
+
+
+def iter_samples(sources, params):
+    """Yield each source sample as a decoded ``(C, H, W)`` float32 array and its ``[row, column]`` spacing."""
+    default_spacing = params.get('source_spacing', [1.0, 1.0])
+    for name, path in sources:
+        lower = name.lower()
+        if lower.endswith('.npy'):
+            array = np.load(path, mmap_mode='r')
+            if array.ndim not in (3, 4):
+                raise PreprocessError(f"{name}: expected (N, H, W) or (N, C, H, W), got shape {array.shape}")
+            for sample in array:
+                sample = np.asarray(sample, dtype=np.float32)
+                yield (sample[None] if sample.ndim == 2 else sample), default_spacing
+            continue
+        if lower.endswith('.dcm'):
+            image, spacing = decode_dicom(path)
+        elif lower.endswith('.png'):
+            image, spacing = decode_png(path)
+        else:
+            raise PreprocessError(f"{name}: only .npy, .dcm and .png files can be preprocessed")
+        yield image, spacing or default_spacing
+
+
+def _load_masks(labels, count):
+    name, path = labels
+    if not name.lower().endswith('.npy'):
+        raise PreprocessError(f"{name}: segmentation masks must be a .npy file")
+    try:
+        masks = np.load(path, mmap_mode='r', allow_pickle=False)
+    except (ValueError, OSError) as e:
+        raise PreprocessError(f"{name}: not a readable .npy array") from e
+    if masks.ndim == 4 and masks.shape[1] == 1:
+        masks = masks[:, 0]
+    if masks.ndim != 3 or masks.shape[0] != count:
+        raise PreprocessError(f"{name}: expected {count} masks of shape (N, H, W), got shape {list(masks.shape)}")
+    return masks
+
+
+def build(sources, params, out_path, labels=None, labels_path=None, cancelled=None):
+    """
+    Write the preprocessed dataset of ``sources`` (``(name, path)`` pairs) to
+    ``out_path``; returns its shape. Given ``labels`` (a ``(name, path)``
+    pair of masks), their transformed masks go to ``labels_path``. Raises
+    ``PreprocessCancelled`` once ``cancelled()`` returns True.
+    """
+    def check():
+        if cancelled is not None and cancelled():
+            raise PreprocessCancelled("Preprocessing was cancelled")
+
+    samples = iter_samples(sources, params)
+    first = next(samples, None)
+    if first is None:
+        raise PreprocessError("The dataset has no images")
+    count = sum(
+        np.load(path, mmap_mode='r').shape[0] if name.lower().endswith('.npy') else 1
+        for name, path in sources
+    )
+    masks = _load_masks(labels, count) if labels is not None else None
+    shape = transform(*first, params).shape
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(count, *shape))
+    if masks is not None:
+        masks_out = np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.int64, shape=(count, *shape[1:]))
+    for index, (raw, spacing) in enumerate(itertools.chain([first], samples)):
+        check()
+        image = transform(raw, spacing, params)
+        if image.shape != shape:
+            raise PreprocessError(
+                f"Image {index} has shape {list(image.shape)}, not {list(shape)}; set preprocess.size"
+            )
+        out[index] = image
+        if masks is not None:
+            if masks.shape[1:] != raw.shape[1:]:
+                raise PreprocessError(
+                    f"Mask {index} has shape {list(masks.shape[1:])}, not its image's {list(raw.shape[1:])}"
+                )
+            mask = np.asarray(masks[index], dtype=np.int64)[None]
+            masks_out[index] = transform(mask, spacing, params, mask=True)[0]
+    if masks is not None:
+        masks_out.flush()
+        del masks_out
+    # Second pass: dataset-wide statistics, then normalization in place
+    total = total_sq = 0.0
+    low, high = np.inf, -np.inf
+    for start in range(0, count, NORMALIZE_BATCH):
+        check()
+        chunk = np.asarray(out[start:start + NORMALIZE_BATCH], dtype=np.float64)
+        total += chunk.sum()
+        total_sq += np.square(chunk).sum()
+        low, high = min(low, chunk.min()), max(high, chunk.max())
+    size = out.size
+    if params['normalize'] == 'zscore':
+        mean = total / size
+        std = np.sqrt(max(total_sq / size - mean * mean, 0.0)) or 1.0
+        shift, scale = mean, std
+    elif params['normalize'] == 'minmax':
+        shift, scale = low, (high - low) or 1.0
+    else:
+        shift, scale = 0.0, 1.0
+    if (shift, scale) != (0.0, 1.0):
+        for start in range(0, count, NORMALIZE_BATCH):
+            check()
+            out[start:start + NORMALIZE_BATCH] = (out[start:start + NORMALIZE_BATCH] - shift) / scale
+    out.flush()
+    del out
+    return [count, *shape]
+
+
+class PreprocessCache:
+    """Directory of ``<key>/images.npy`` entries, evicted least recently used first to stay within ``budget`` bytes."""
+
+    def __init__(self, root=PREPROCESS_DIR, budget=PREPROCESS_CACHE_BYTES):
+        self.root = root
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key, IMAGES_FILE)
+
+    @contextmanager
+    def _locked(self, name):
+        """Exclusive lock on ``name`` against other threads and processes."""
+        with self._lock:
+            lock = self._key_locks.setdefault(name, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, f'.{name}.lock'), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def get_or_build(self, key, builder):
+        """
+        Path of the entry for ``key``, calling ``builder(path)`` to create it
+        on a miss. Only one thread or process builds a given key at a time.
+        """
+        path = self.entry_path(key)
+        with self._locked(key):
+            if os.path.exists(path):
+                cache_lookups.inc(cache='preprocessing', result='hit')
+                self._touch(key)
+                return path
+            cache_lookups.inc(cache='preprocessing', result='miss')
+            tmp = os.path.join(self.root, f'.{key}.{os.getpid()}.tmp')
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            try:
+                meta = builder(os.path.join(tmp, IMAGES_FILE))
+                with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                    json.dump(meta, f)
+                os.replace(tmp, os.path.dirname(path))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+        return path
+
+    def _touch(self, key):
+        try:
+            os.utime(os.path.join(self.root, key, 'meta.json'))
+        except OSError:
+            pass
+
+    def entries(self):
+        """``(last_used, size, key)`` of every complete entry."""
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return entries
+        for key in names:
+            directory = os.path.join(self.root, key)
+            if key.startswith('.') or not os.path.isdir(directory):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(directory))
+                last_used = os.stat(os.path.join(directory, 'meta.json')).st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, key))
+        return entries
+
+    def evict(self, keep=None):
+        """Remove least recently used entries (other than ``keep``) until the cache fits the budget."""
+        with self._locked('evict'):
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.budget:
+                    break
+                if key == keep:
+                    continue
+                # Running jobs keep reading an evicted entry: their memory map holds the file open.
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                total -= size
+                logger.info("Evicted preprocessed dataset %s", key)
+
+
+class Preprocessor:
+    def __init__(self, datasets=dataset_store, cache=None):
+        self.datasets = datasets
+        self.cache = cache if cache is not None else PreprocessCache()
+
+    def sources(self, images):
+        """Dataset records of the files ``images`` refers to, in sample order."""
+        if isinstance(images, str) and images.startswith(SERIES_PREFIX):
+            uid = images[len(SERIES_PREFIX):]
+            records, cursor = [], None
+            while True:
+                page, cursor = self.datasets.query(cursor=cursor, limit=MAX_PAGE_SIZE, series_instance_uid=uid)
+                records.extend(page)
+                if cursor is None:
+                    break
+            if not records:
+                raise PreprocessError(f"No stored slices of series {uid}")
+            return sorted(records, key=lambda r: (r.get('metadata', {}).get('instance_number', 0), r['name']))
+        records = []
+        for name in [images] if isinstance(images, str) else images:
+            record = self.datasets.get(name)
+            if record is None:
+                raise PreprocessError(f"Dataset '{name}' not found")
+            records.append(record)
+        return records
+
+    def masks(self, config):
+        """Dataset record of ``config``'s label masks if they are transformed too, else None."""
+        if not transforms_labels(config):
+            return None
+        name = config['dataset'].get('labels')
+        record = self.datasets.get(name) if isinstance(name, str) else None
+        if record is None:
+            raise PreprocessError(f"Dataset '{name}' not found")
+        return record
+
+    def key(self, config):
+        """Cache key of ``config``'s preprocessed images; raises ``PreprocessError`` if they can't be built."""
+        dataset = config['dataset']
+        params = preprocess_params(dataset['preprocess'])
+        records = self.sources(dataset.get('images'))
+        masks = self.masks(config)
+        payload = {
+            'version': PREPROCESS_VERSION,
+            'sources': [record['sha256'] for record in records],
+            'params': params,
+        }
+        if masks is not None:
+            payload['masks'] = masks['sha256']
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def digest(self, config):
+        """Content hash of a preprocessed config's training data, for the result cache; None if unavailable."""
+        try:
+            images = self.key(config)
+        except PreprocessError:
+            return None
+        labels = config['dataset'].get('labels')
+        record = self.datasets.get(labels) if isinstance(labels, str) else None
+        return None if record is None else f"{images}:{record['sha256']}"
+
+    def prepare(self, config, cancelled=None):
+        """
+        Path of ``config``'s preprocessed images ``.npy``, building it if it
+        isn't cached (see ``build`` for ``cancelled``). Transformed masks, if
+        any, are at ``labels_path`` of it.
+        """
+        dataset = config['dataset']
+        params = preprocess_params(dataset['preprocess'])
+        records = self.sources(dataset.get('images'))
+        sources = [(record['name'], self.datasets.blob_path(record['sha256'])) for record in records]
+        masks = self.masks(config)
+        labels = None if masks is None else (masks['name'], self.datasets.blob_path(masks['sha256']))
+
+        def builder(path):
+            start = time.perf_counter()
+            shape = build(sources, params, path, labels, labels_path(path), cancelled)
+            return {'shape': shape, 'params': params, 'sources': [name for name, _ in sources],
+                    'masks': None if labels is None else labels[0],
+                    'seconds': round(time.perf_counter() - start, 3)}
+
+        return self.cache.get_or_build(self.key(config), builder)
+
+
+def labels_path(images_path):
+    """Where the transformed masks of the preprocessed images at ``images_path`` are (if there are any)."""
+    return os.path.join(os.path.dirname(images_path), LABELS_FILE)
@@ -0,0 +1,89 @@
+# result_cache.py
+"""
+Cache of finished training runs.
+
+A training run is determined by its config, its generated script and the
+content of its dataset, so a run that succeeded and saved checkpoints is
+recorded under a key derived from the config hash, the script hash and the
+dataset's content hashes. Submitting the same experiment again reuses the
+recorded run instead of training from scratch. Entries are small JSON files,
+``<root>/<key>.json``, pointing at the directory of the run that produced
+them; an entry whose run directory is gone is dropped.
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Generated scripts save checkpoints here, relative to the job directory
+CHECKPOINT_DIR = 'checkpoints'
+
+# Stands in for the dataset hash of configs that train on synthetic data
+SYNTHETIC_DATA = 'synthetic'
+
+
+def dataset_digest(config, datasets):
+    """
+    Content hash of the uploaded files a config trains on, looked up in the
+    content-addressed ``datasets`` store. Returns ``SYNTHETIC_DATA`` if the
+    config names no dataset and ``None`` if a named file is not in the store.
+    """
+    dataset = config.get('dataset')
+    if not isinstance(dataset, dict) or not dataset.get('images') or not dataset.get('labels'):
+        return SYNTHETIC_DATA
+    hashes = []
+    for role in ('images', 'labels'):
+        name = dataset[role]
+        record = datasets.get(name) if isinstance(name, str) else None
+        if record is None:
+            return None
+        hashes.append(record['sha256'])
+    return ':'.join(hashes)
+
+
+def result_key(config_key, script, data_digest):
+    script_digest = hashlib.sha256(script.encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{config_key}:{script_digest}:{data_digest}".encode('utf-8')).hexdigest()
+
+
+def has_checkpoints(run_dir):
+    directory = os.path.join(run_dir, CHECKPOINT_DIR)
+    return os.path.isdir(directory) and any(name.endswith('.pt') for name in os.listdir(directory))
+
+
+class ResultCache:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.json')
+
+    def get(self, key):
+        """The entry recorded for ``key``, or None if there is none or its run is gone."""
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable result cache entry %s", key)
+            return None
+        if not has_checkpoints(entry.get('run_dir', '')):
+            self.discard(key)
+            return None
+        return entry
+
+    def put(self, key, entry):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self._path(key) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    def discard(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
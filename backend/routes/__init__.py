@@ -1,39 +1,40 @@
-from flask import Blueprint, jsonify, request
-from backend.model_config_store import model_config_store
+from flask import Blueprint, Response, jsonify, request
+from backend.model_config_store import model_config_store, INDEXED_FIELDS, DEFAULT_PAGE_SIZE
+from backend.uploads import ResumableUploads, UploadError, UPLOAD_DIR
+from backend.dataset_store import dataset_store
 import os
 from werkzeug.utils import secure_filename
-import requests
+from backend.events import streams
+from backend.explanations import explanation_service, FOUND, MISSING, MAX_BULK_TERMS
+from backend.jobs import job_manager, JobQueueFull, JobsDraining, JOB_MODES
+from backend.metrics_store import DEFAULT_POINTS
+from backend.sweeps import sweep_manager, SweepError
+from backend.config_schema import MAX_BATCH_CONFIGS, validate_config
+from backend.parameter_options import PARAMETER_OPTIONS
+from backend.preprocessing import validate_dataset
+from backend.script_generator import generate_script_artifact, validate_hyperparameters
 
-# In-memory training progress (for demo; in production, use a better store)
+# Progress reported when no job is selected; per-job progress lives in job_manager
 training_progress = {
     "current_epoch": 0,
     "total_epochs": 0,
     "loss": None
 }
 
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), '../../uploads'))
-
-# Ensure upload directory exists
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+resumable_uploads = ResumableUploads()
 
 def fetch_wikipedia_summary(term):
     """
-    Fetch a summary for a term from Wikipedia API.
-    Returns a string summary or an error message.
+    Fetch a summary for a term (glossary, cache, then the summary API).
+    Returns a (summary, is_error) tuple.
     """
-    try:
-        url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{term}"
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            return data.get("extract", "No summary found."), False
-        else:
-            return f"No summary found for '{term}'.", True
-    except Exception as e:
-        print(f"Exception occurred while fetching summary: {str(e)}")  # Log the exception
-        return "An error occurred while fetching the summary.", True
+    summary, status = explanation_service.lookup(term)
+    return summary, status != FOUND
 
 def register_routes(app):
+    # Ensure upload directory exists
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
     @app.route("/api/hello")
     def hello():
         return jsonify({"message": "Hello from Flask!"})
@@ -59,21 +60,273 @@ def register_routes(app):
             # Example validation for hyperparameters
             if not isinstance(data.get("hyperparameters"), dict):
                 return jsonify({"error": "Invalid type for hyperparameters, expected a dictionary"}), 422
+            errors = validate_hyperparameters(data["hyperparameters"])
+            if errors:
+                return jsonify({"error": "Invalid hyperparameters: " + "; ".join(errors)}), 422
+            errors = validate_dataset(data)
+            if errors:
+                return jsonify({"error": "Invalid dataset: " + "; ".join(errors)}), 422
 
-            # Store config in-memory and local file
-            model_config_store.add(data)
-            saved_id = len(model_config_store.get_all())
+            # Store config; the store assigns a stable, monotonic ID and returns
+            # the existing one for a config equal to one already saved
+            saved_id, created = model_config_store.add_or_get(data)
+            if saved_id is None:
+                return jsonify({"error": "Unable to save model configuration"}), 500
 
-            return jsonify({"message": "Model configuration saved successfully", "id": saved_id}), 201
+            return jsonify({
+                "message": "Model configuration saved successfully",
+                "id": saved_id,
+                "duplicate": not created,
+            }), 201
 
         except Exception as e:
             app.logger.error("An unexpected error occurred: %s", str(e))
             return jsonify({"error": "An unexpected error occurred"}), 500
 
+    @app.route("/api/modelconfig/batch", methods=["POST"])
+    def modelconfig_batch():
+        """
+        Body: { configs: [config, ...] } (or a bare list), at most MAX_BATCH_CONFIGS.
+        Every config is checked against the compiled schema; the valid ones are
+        stored in one write. Returns: { results: [{index, id, duplicate} |
+        {index, errors: [{field, message}]}], created, duplicates, invalid }
+        """
+        data = request.get_json(silent=True)
+        configs = data.get("configs") if isinstance(data, dict) else data
+        if not isinstance(configs, list):
+            return jsonify({"error": "Expected a JSON list of configs or {\"configs\": [...]}"}), 400
+        if len(configs) > MAX_BATCH_CONFIGS:
+            return jsonify({"error": f"At most {MAX_BATCH_CONFIGS} configs per batch"}), 413
+
+        results = [{"index": index} for index in range(len(configs))]
+        valid = []
+        for result, config in zip(results, configs):
+            errors = validate_config(config)
+            if errors:
+                result["errors"] = errors
+            else:
+                valid.append(result)
+        saved = model_config_store.add_or_get_many([configs[result["index"]] for result in valid]) if valid else []
+        if saved is None:
+            return jsonify({"error": "Unable to save model configurations"}), 500
+        for result, (config_id, created) in zip(valid, saved):
+            result.update(id=config_id, duplicate=not created)
+        created = sum(1 for _, was_created in saved if was_created)
+        return jsonify({
+            "results": results,
+            "created": created,
+            "duplicates": len(saved) - created,
+            "invalid": len(configs) - len(saved),
+        }), 201 if created else 200
+
+    @app.route("/api/modelconfig", methods=["GET"])
+    def list_modelconfigs():
+        """
+        Query params: model_type, optimizer, loss_function (exact-match filters),
+        cursor (last ID of the previous page), limit.
+        Returns: { items: [{id, config}], next_cursor: int|null }
+        """
+        try:
+            cursor = int(request.args.get("cursor", 0))
+            limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "cursor and limit must be integers"}), 400
+        filters = {field: request.args.get(field) for field in INDEXED_FIELDS}
+        items, next_cursor = model_config_store.query(cursor=cursor, limit=limit, **filters)
+        return jsonify({
+            "items": [{"id": config_id, "config": config} for config_id, config in items],
+            "next_cursor": next_cursor,
+        })
+
+    @app.route("/api/modelconfig/<int:config_id>", methods=["GET"])
+    def get_modelconfig(config_id):
+        config = model_config_store.get(config_id)
+        if config is None:
+            return jsonify({"error": "Model configuration not found"}), 404
+        return jsonify({"id": config_id, "config": config})
+
+    @app.route("/api/sweeps", methods=["POST"])
+    def create_sweep():
+        """
+        Expand a hyperparameter sweep into stored configs and run them as jobs.
+        JSON body: {
+            base: { model_type, hyperparameters },
+            parameters: { name: [values] | { values } | { min, max, log?, type? } },
+            method?: "grid" | "random" | "halving", num_trials?, seed?,
+            max_parallel?, metric? (default val_loss),
+            early_stopping?: { min_epochs?, reduction_factor? }
+        }
+        Returns: the sweep ({ id, state, trials: [{ config_id, params, state, job_id, metric }] }), 202
+        """
+        try:
+            sweep = sweep_manager.create(request.get_json(silent=True))
+        except SweepError as e:
+            return jsonify({"error": str(e)}), 400
+        except OSError:
+            return jsonify({"error": "Unable to save sweep configurations"}), 500
+        return jsonify(sweep.to_dict()), 202
+
+    @app.route("/api/sweeps/<sweep_id>", methods=["GET"])
+    def get_sweep(sweep_id):
+        sweep = sweep_manager.get(sweep_id)
+        if sweep is None:
+            return jsonify({"error": "Sweep not found"}), 404
+        return jsonify(sweep.to_dict())
+
+    @app.route("/api/sweeps/<sweep_id>/cancel", methods=["POST"])
+    def cancel_sweep(sweep_id):
+        sweep = sweep_manager.get(sweep_id)
+        if sweep is None:
+            return jsonify({"error": "Sweep not found"}), 404
+        if not sweep_manager.cancel(sweep_id):
+            return jsonify({"error": f"Sweep already {sweep.state}"}), 409
+        return jsonify(sweep.to_dict())
+
+    @app.route("/api/jobs", methods=["POST"])
+    def submit_job():
+        """
+        Queue a run of a stored config.
+        JSON body: { config_id: int, mode?: "train" | "benchmark", cache?: bool }
+        A benchmark only times the data pipeline and reports samples_per_sec.
+        A training run of a config and dataset that already trained is served
+        from the result cache unless cache is false.
+        Returns: the job ({ id, state, progress, cached_from, ... }), 202, or
+        200 if it finished from the cache
+        """
+        data = request.get_json(silent=True) or {}
+        config_id = data.get("config_id")
+        if not isinstance(config_id, int) or isinstance(config_id, bool):
+            return jsonify({"error": "config_id must be an integer"}), 400
+        config = model_config_store.get(config_id)
+        if config is None:
+            return jsonify({"error": "Model configuration not found"}), 404
+        mode = data.get("mode", "train")
+        if not isinstance(mode, str) or mode not in JOB_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(JOB_MODES)}"}), 400
+        use_cache = data.get("cache", True)
+        if not isinstance(use_cache, bool):
+            return jsonify({"error": "cache must be true or false"}), 400
+        try:
+            job = job_manager.submit(config_id, config, mode, use_cache=use_cache)
+        except JobsDraining:
+            return jsonify({"error": "Server is shutting down"}), 503
+        except JobQueueFull:
+            return jsonify({"error": "Too many queued jobs, try again later"}), 429
+        return jsonify(job.to_dict()), 200 if job.cached_from else 202
+
+    @app.route("/api/jobs", methods=["GET"])
+    def list_jobs():
+        """Query param: state (optional filter). Returns: { items: [job] }"""
+        jobs = job_manager.list(state=request.args.get("state"))
+        return jsonify({"items": [job.to_dict() for job in jobs]})
+
+    @app.route("/api/jobs/<job_id>", methods=["GET"])
+    def get_job(job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job.to_dict())
+
+    @app.route("/api/jobs/<job_id>/events", methods=["GET"])
+    def stream_job_events(job_id):
+        """
+        Server-sent events for a job: `progress` ({ current_epoch, total_epochs,
+        loss, ... }) and `state` ({ state, ... }). Recent events are replayed on
+        connect, or only those after the Last-Event-ID header (or last_event_id
+        query param) when reconnecting. The stream ends when the job finishes.
+        503 when this worker already serves MAX_SSE_STREAMS streams.
+        """
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        try:
+            last_event_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id", 0))
+        except ValueError:
+            return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+        body = streams.open(lambda stop: job.events.subscribe(last_event_id, stop=stop))
+        if body is None:
+            response = jsonify({"error": "Too many event streams"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+        return Response(
+            body,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/api/jobs/<job_id>/metrics", methods=["GET"])
+    def list_job_metrics(job_id):
+        """Returns: { step: [metric names], epoch: [metric names] }"""
+        series = job_manager.metrics.list(job_id)
+        if series is None:
+            return jsonify({"error": "No metrics recorded for this job"}), 404
+        return jsonify(series)
+
+    @app.route("/api/jobs/<job_id>/metrics/<name>", methods=["GET"])
+    def get_job_metric(job_id, name):
+        """
+        Query params: axis (step|epoch, default step), start, end (inclusive step
+        range), points (target point count), method (lttb|minmax).
+        Returns: { name, axis, total, steps: [...], values: [...] }
+        """
+        axis = request.args.get("axis", "step")
+        try:
+            start, end = (int(request.args[key]) if request.args.get(key) else None for key in ("start", "end"))
+            points = int(request.args.get("points", DEFAULT_POINTS))
+        except ValueError:
+            return jsonify({"error": "start, end and points must be integers"}), 400
+        try:
+            series = job_manager.metrics.query(
+                job_id, name, axis=axis, start=start, end=end, points=points,
+                method=request.args.get("method", "lttb"),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if series is None:
+            return jsonify({"error": "Metric not found"}), 404
+        return jsonify({"name": name, "axis": axis, **series})
+
+    @app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+    def cancel_job(job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        if not job_manager.cancel(job_id):
+            return jsonify({"error": f"Job already {job.state}"}), 409
+        return jsonify(job.to_dict())
+
+    @app.route("/api/modelconfig/<int:config_id>/script", methods=["GET"])
+    def get_modelconfig_script(config_id):
+        """
+        Returns the generated training script (text/x-python) with an ETag;
+        If-None-Match with the current ETag gets a 304.
+        """
+        config = model_config_store.get(config_id)
+        if config is None:
+            return jsonify({"error": "Model configuration not found"}), 404
+        script, etag = generate_script_artifact(config)
+        response = Response(script, mimetype="text/x-python")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Content-Disposition"] = f'inline; filename="train_{config_id}.py"'
+        return response.make_conditional(request)
+
     @app.route("/api/training_progress", methods=["GET"])
     def get_training_progress():
-        # Return current training progress (epoch, loss, etc.)
-        return jsonify(training_progress)
+        """
+        Query param: job_id (optional)
+        Returns: { current_epoch, total_epochs, loss, ... } for the job, plus its
+        state; without job_id, the idle defaults.
+        """
+        job_id = request.args.get("job_id")
+        if job_id is None:
+            return jsonify(training_progress)
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        job_info = job.to_dict()
+        return jsonify({**job_info["progress"], "job_id": job_id, "state": job_info["state"]})
 
     @app.route('/api/upload', methods=['POST'])
     def upload_file():
@@ -83,9 +336,10 @@ def register_routes(app):
             if file.filename == '':
                 return jsonify({'error': 'No selected file'}), 400
             sanitized_filename = secure_filename(file.filename)
-            save_path = os.path.join(UPLOAD_DIR, sanitized_filename)
-            file.save(save_path)
-            return jsonify({'message': 'File uploaded', 'path': save_path}), 201
+            if not sanitized_filename or dataset_store.is_reserved(sanitized_filename):
+                return jsonify({'error': 'Invalid file name'}), 400
+            saved = dataset_store.add_upload(file, sanitized_filename)
+            return jsonify({'message': 'File uploaded', **saved}), 201
         # Option 2: User provides a file path reference
         elif request.is_json:
             data = request.get_json()
@@ -105,28 +359,107 @@ def register_routes(app):
         else:
             return jsonify({'error': 'No file or file_path provided'}), 400
 
+    def upload_error_response(e):
+        body = {'error': e.message}
+        if e.offset is not None:
+            body['offset'] = e.offset
+        return jsonify(body), e.status
+
+    @app.route('/api/uploads', methods=['POST'])
+    def create_resumable_upload():
+        """
+        Start a resumable upload.
+        JSON body: { filename: string, size?: int, sha256?: string }
+        Returns: { upload_id, offset, ... }, or the stored file if content with
+        the given sha256 already exists (no transfer needed).
+        """
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        if not filename:
+            return jsonify({'error': 'Missing filename'}), 400
+        if dataset_store.is_reserved(filename):
+            return jsonify({'error': 'Invalid file name'}), 400
+        if isinstance(data.get('sha256'), str):
+            saved = dataset_store.link_existing(filename, data['sha256'])
+            if saved is not None:
+                return jsonify({'message': 'File uploaded', **saved}), 200
+        size = data.get('size')
+        if size is not None and (not isinstance(size, int) or size < 0):
+            return jsonify({'error': 'size must be a non-negative integer'}), 400
+        try:
+            return jsonify(resumable_uploads.create(filename, size, data.get('sha256'))), 201
+        except UploadError as e:
+            return upload_error_response(e)
+
+    @app.route('/api/uploads/<upload_id>', methods=['GET'])
+    def resumable_upload_status(upload_id):
+        try:
+            return jsonify(resumable_uploads.status(upload_id))
+        except UploadError as e:
+            return upload_error_response(e)
+
+    @app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+    def append_resumable_upload(upload_id):
+        """
+        Append the raw request body at the offset given in the Upload-Offset header.
+        Returns: { offset } (409 with the current offset if it does not match)
+        """
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'error': 'Missing or invalid Upload-Offset header'}), 400
+        try:
+            new_offset = resumable_uploads.append(upload_id, offset, request.stream)
+        except UploadError as e:
+            return upload_error_response(e)
+        return jsonify({'upload_id': upload_id, 'offset': new_offset})
+
+    @app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+    def complete_resumable_upload(upload_id):
+        try:
+            saved = resumable_uploads.complete(upload_id, dataset_store.add_file)
+        except UploadError as e:
+            return upload_error_response(e)
+        return jsonify({'message': 'File uploaded', **saved}), 201
+
+    @app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+    def abort_resumable_upload(upload_id):
+        try:
+            resumable_uploads.abort(upload_id)
+        except UploadError as e:
+            return upload_error_response(e)
+        return '', 204
+
     @app.route("/api/parameter-options", methods=["GET"])
     def parameter_options():
         """
         Returns available options for model types, loss functions, and optimizers.
-        In a real app, this could be loaded from a config file or database.
         """
-        return jsonify({
-            "modelTypes": ["CNN", "RNN", "UNet", "ResNet", "Transformer"],
-            "lossFunctions": ["CrossEntropy", "MSE", "MAE", "Dice", "BCEWithLogits"],
-            "optimizers": ["Adam", "SGD", "RMSprop", "Adagrad", "AdamW"]
-        })
+        return jsonify(PARAMETER_OPTIONS)
 
     @app.route("/api/explanation", methods=["GET"])
     def get_explanation():
         """
-        Query param: term (string)
-        Returns: { summary: string }
+        Query param: term (string), or terms (comma-separated, for a whole form at once)
+        Returns: { summary: string }, or for terms:
+        { explanations: { term: { summary } | { error } } }
         """
+        if "terms" in request.args:
+            terms = list(dict.fromkeys(t.strip() for t in request.args["terms"].split(",") if t.strip()))
+            if not terms:
+                return jsonify({"error": "Missing 'terms' query parameter."}), 400
+            if len(terms) > MAX_BULK_TERMS:
+                return jsonify({"error": f"At most {MAX_BULK_TERMS} terms per request."}), 400
+            explanations = {}
+            for term, (summary, status) in explanation_service.lookup_many(terms).items():
+                explanations[term] = {"summary": summary} if status == FOUND else {"error": summary}
+            return jsonify({"explanations": explanations})
         term = request.args.get("term", "")
         if not term:
             return jsonify({"error": "Missing 'term' query parameter."}), 400
-        summary, is_error = fetch_wikipedia_summary(term)
-        if is_error:
-            return jsonify({"error": "Unable to fetch the requested summary. Please try again later."}), 404
+        summary, status = explanation_service.lookup(term)
+        if status == MISSING:
+            return jsonify({"error": summary}), 404
+        if status != FOUND:
+            return jsonify({"error": "Unable to fetch the requested summary. Please try again later."}), 503
         return jsonify({"summary": summary})
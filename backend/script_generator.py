@@ -1,7 +1,240 @@
 # script_generator.py
 """
 Module to generate PyTorch/MONAI training scripts from a configuration dictionary.
+
+Scripts are rendered from ``script_templates/train.py.j2``, which is compiled
+on first use (see ``load_template``). Rendered scripts are cached by the
+canonical form of the config, so identical configs are only rendered once
+per process.
 """
+import hashlib
+import json
+import math
+import os
+from functools import lru_cache
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+from backend.config_hash import canonical_json, config_hash
+from backend.instrumentation import cache_lookups, registry
+from backend.parameter_options import MODEL_TYPES, LOSS_FUNCTIONS, OPTIMIZERS
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'script_templates')
+TEMPLATE_NAME = 'train.py.j2'
+SCRIPT_CACHE_SIZE = int(os.getenv("SCRIPT_CACHE_SIZE", 256))
+
+# Generated scripts report progress on stdout with this prefix (see backend.jobs)
+PROGRESS_PREFIX = "DEEPBUILDER_PROGRESS "
+
+DEFAULT_LOSS_FUNCTION = "CrossEntropy"
+DEFAULT_OPTIMIZER = "Adam"
+SEGMENTATION_MODELS = ("UNet",)
+
+# name: (type, default, minimum, maximum); out-of-range or unparsable values fall back to the default
+HYPERPARAMETERS = {
+    'epochs': (int, 10, 1, None),
+    'batch_size': (int, 16, 1, None),
+    'learning_rate': (float, 1e-3, 0.0, None),
+    'weight_decay': (float, 0.0, 0.0, None),
+    'momentum': (float, 0.9, 0.0, 1.0),
+    'val_split': (float, 0.2, 0.0, 0.9),
+    'seed': (int, 0, 0, None),
+    'log_every': (int, 10, 1, None),
+    'checkpoint_every': (int, 1, 1, None),
+}
+HYPERPARAMETER_ALIASES = {'lr': 'learning_rate'}
+
+# Data loading and throughput options. Unlike the settings above these are
+# validated when a config is saved (see validate_hyperparameters).
+THROUGHPUT_DEFAULTS = {
+    'num_workers': 'auto',
+    'pin_memory': True,
+    'persistent_workers': True,
+    'prefetch_factor': 2,
+    'dataset_cache': 'none',
+    'cache_rate': 1.0,
+    'mixed_precision': False,
+    'gradient_accumulation_steps': 1,
+}
+DATASET_CACHES = ('none', 'memory', 'disk')
+
+
+def _is_int(value, minimum, maximum):
+    return isinstance(value, int) and not isinstance(value, bool) and minimum <= value <= maximum
+
+
+_THROUGHPUT_CHECKS = {
+    'num_workers': (lambda v: v == 'auto' or _is_int(v, 0, 64), "must be 'auto' or an integer from 0 to 64"),
+    'pin_memory': (lambda v: isinstance(v, bool), "must be true or false"),
+    'persistent_workers': (lambda v: isinstance(v, bool), "must be true or false"),
+    'prefetch_factor': (lambda v: _is_int(v, 1, 64), "must be an integer from 1 to 64"),
+    'dataset_cache': (lambda v: v in DATASET_CACHES, f"must be one of {', '.join(DATASET_CACHES)}"),
+    'cache_rate': (
+        lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and 0 < v <= 1,
+        "must be a number greater than 0 and at most 1",
+    ),
+    'mixed_precision': (lambda v: isinstance(v, bool), "must be true or false"),
+    'gradient_accumulation_steps': (lambda v: _is_int(v, 1, 1024), "must be an integer from 1 to 1024"),
+}
+
+
+def validate_hyperparameters(hyperparams):
+    """Messages for throughput options that are present but invalid; empty if all are valid."""
+    return [
+        f"{name} {message}"
+        for name, (check, message) in _THROUGHPUT_CHECKS.items()
+        if name in hyperparams and not check(hyperparams[name])
+    ]
+
+
+def _comment(value):
+    """Keep interpolated text on one comment line."""
+    return ' '.join(str(value).splitlines())
+
+
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+    auto_reload=False,
+)
+_env.filters['py'] = repr
+_env.filters['comment'] = _comment
+TEMPLATE_VERSION = hashlib.sha256(
+    _env.loader.get_source(_env, TEMPLATE_NAME)[0].encode('utf-8')
+).hexdigest()
+
+
+def _coerce(value, kind, default, minimum, maximum):
+    if isinstance(value, bool):
+        return default
+    try:
+        value = kind(float(value)) if kind is int else kind(value)
+    except (TypeError, ValueError, OverflowError):
+        return default
+    if kind is float and not math.isfinite(value):
+        return default
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        return default
+    return value
+
+
+def normalize_config(config):
+    """
+    Canonical form of a config for deduplication: hyperparameter aliases
+    resolved, numbers converted to their declared type and defaults filled
+    in, so configs that generate the same training run compare equal.
+    Invalid values are kept as given rather than replaced by defaults.
+    """
+    config = dict(config)
+    hyperparams = config.get('hyperparameters')
+    if not isinstance(hyperparams, dict):
+        return config
+    values = {HYPERPARAMETER_ALIASES.get(key, key): value for key, value in hyperparams.items()}
+    for name, (kind, default, minimum, maximum) in HYPERPARAMETERS.items():
+        value = values.get(name, default)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            coerced = _coerce(value, kind, None, minimum, maximum)
+            if coerced is not None and coerced == value:
+                value = coerced
+        values[name] = value
+    for name, (check, _) in _THROUGHPUT_CHECKS.items():
+        default = THROUGHPUT_DEFAULTS[name]
+        value = values.get(name, default)
+        if isinstance(default, float) and check(value):
+            value = float(value)
+        values[name] = value
+    values.setdefault('loss_function', DEFAULT_LOSS_FUNCTION)
+    values.setdefault('optimizer', DEFAULT_OPTIMIZER)
+    config['hyperparameters'] = values
+    return config
+
+
+def config_key(config):
+    """Hash of a config's normalized form; equal for configs that only differ in spelling."""
+    return config_hash(normalize_config(config))
+
+
+def _dataset_name(value):
+    if isinstance(value, str) and value and os.path.basename(value) == value and value not in ('.', '..'):
+        return value
+    return None
+
+
+def _context(config):
+    hyperparams = config.get('hyperparameters', {})
+    if not isinstance(hyperparams, dict):
+        hyperparams = {}
+    values = {HYPERPARAMETER_ALIASES.get(key, key): value for key, value in hyperparams.items()}
+    settings = {
+        name: _coerce(values.get(name, default), kind, default, minimum, maximum)
+        for name, (kind, default, minimum, maximum) in HYPERPARAMETERS.items()
+    }
+    # Stored configs predate validation, so invalid throughput options fall back to defaults here
+    settings.update(
+        (name, hyperparams[name] if name in hyperparams and check(hyperparams[name]) else THROUGHPUT_DEFAULTS[name])
+        for name, (check, _) in _THROUGHPUT_CHECKS.items()
+    )
+    model_type = config.get('model_type', 'UnknownModel')
+    loss_function = hyperparams.get('loss_function', DEFAULT_LOSS_FUNCTION)
+    optimizer = hyperparams.get('optimizer', DEFAULT_OPTIMIZER)
+    dataset = config.get('dataset') if isinstance(config.get('dataset'), dict) else {}
+    images, labels = _dataset_name(dataset.get('images')), _dataset_name(dataset.get('labels'))
+    # Preprocessed images are prepared by the job runner, which passes their path in the environment
+    preprocessed = 'preprocess' in dataset and labels is not None
+    if preprocessed:
+        images = None
+    elif images is None or labels is None:
+        images = labels = None
+    return {
+        'model_type': model_type,
+        'hyperparameters_json': json.dumps(hyperparams, sort_keys=True),
+        # Unsupported names are never interpolated into code, only reported at run time.
+        'model': model_type if model_type in MODEL_TYPES else None,
+        'loss_function': loss_function,
+        'loss': loss_function if loss_function in LOSS_FUNCTIONS else None,
+        'optimizer_name': optimizer,
+        'optimizer': optimizer if optimizer in OPTIMIZERS else None,
+        'task': 'segmentation' if model_type in SEGMENTATION_MODELS else 'classification',
+        'dataset_images': images,
+        'dataset_labels': labels,
+        'preprocessed': preprocessed,
+        'progress_prefix': PROGRESS_PREFIX,
+        **settings,
+    }
+
+
+@lru_cache(maxsize=None)
+def load_template():
+    """The compiled training script template; compiled on first use rather than at import."""
+    return _env.get_template(TEMPLATE_NAME)
+
+
+@lru_cache(maxsize=SCRIPT_CACHE_SIZE)
+def _render(canonical):
+    script = load_template().render(**_context(json.loads(canonical)))
+    etag = hashlib.sha256((TEMPLATE_VERSION + canonical).encode('utf-8')).hexdigest()[:32]
+    return script, etag
+
+
+def _collect_render_stats():
+    info = _render.cache_info()
+    cache_lookups.set_total(info.hits, cache='training_script', result='hit')
+    cache_lookups.set_total(info.misses, cache='training_script', result='miss')
+
+
+registry.add_collector(_collect_render_stats)
+
+
+def generate_script_artifact(config):
+    """
+    Return ``(script, etag)`` for a config; the ETag changes whenever the
+    config's canonical form or the template does.
+    """
+    return _render(canonical_json(config))
+
 
 def generate_pytorch_script(config):
     """
@@ -11,8 +244,4 @@ def generate_pytorch_script(config):
     Returns:
         str: Python script as a string.
     """
-    # Minimal implementation for testing
-    model_type = config.get('model_type', 'UnknownModel')
-    hyperparams = config.get('hyperparameters', {})
-    script = f"""import torch\n\n# Model type: {model_type}\n# Hyperparameters: {hyperparams}\n\n# ... rest of the script ...\n"""
-    return script
+    return generate_script_artifact(config)[0]
@@ -0,0 +1,220 @@
+# shared_state.py
+"""
+State shared between server worker processes.
+
+Jobs and sweeps run in the worker process that accepted them, but any worker
+may be asked about them. Owners publish snapshots here, keyed by ``(kind,
+id)`` with a version that only grows, and other workers read them back.
+Actions on records owned by another process (e.g. ``cancel``) are queued as
+requests that the owner picks up on its next poll.
+
+A background thread, started when the process first publishes a record (so
+importing the app starts none), polls every ``SHARED_STATE_INTERVAL`` seconds:
+it writes snapshots that were marked dirty (so frequent progress reports
+cost one write per interval) and dispatches requests to the handlers
+registered with ``on_request``. Storage is a SQLite database in WAL mode.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_INTERVAL = float(os.getenv("SHARED_STATE_INTERVAL", 0.5))
+
+
+def process_started(pid):
+    """Start time of process ``pid`` in clock ticks since boot, or None where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22; the command name (field 2) may itself contain spaces or parentheses
+    return stat.rsplit(')', 1)[-1].split()[19]
+
+
+def new_owner():
+    """
+    ``<pid>-<start time>-<token>`` naming a publisher in this process (``<pid>-<token>``
+    where the start time is unknown). The start time tells a reused pid from the owner.
+    """
+    pid = os.getpid()
+    started = process_started(pid)
+    token = uuid.uuid4().hex[:8]
+    return f"{pid}-{started}-{token}" if started else f"{pid}-{token}"
+
+
+def owner_alive(owner):
+    """Whether the process that published a record (see ``new_owner``) is still running."""
+    parts = owner.split('-')
+    try:
+        pid = int(parts[0])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    if len(parts) == 3:
+        started = process_started(pid)
+        if started is not None and started != parts[1]:
+            # The pid now belongs to a later process
+            return False
+    return True
+
+
+class SharedState:
+    def __init__(self, path, interval=SHARED_STATE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        # Unique per instance, so several managers in one process don't take each other's requests
+        self.owner = new_owner()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self._handlers = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS records (kind TEXT, id TEXT, version INTEGER, owner TEXT, "
+                    "data TEXT, updated_at REAL, PRIMARY KEY (kind, id))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS requests (kind TEXT, id TEXT, action TEXT, owner TEXT, "
+                    "PRIMARY KEY (kind, id, action))"
+                )
+            self._conn = conn
+        return self._conn
+
+    def put(self, kind, record_id, version, data):
+        """Publish ``data`` as this process's snapshot of a record; older versions never overwrite newer ones."""
+        body = json.dumps(data, separators=(',', ':'))
+        with self._lock:
+            self._dirty.pop((kind, record_id), None)
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, id) DO UPDATE SET "
+                    "version = excluded.version, owner = excluded.owner, data = excluded.data, "
+                    "updated_at = excluded.updated_at WHERE excluded.version >= records.version",
+                    (kind, record_id, version, self.owner, body, time.time()),
+                )
+        # Requests can only target records this instance published
+        self._start()
+
+    def mark_dirty(self, kind, record_id, snapshot):
+        """Publish ``snapshot()`` (``(version, data)``) on the next poll instead of now."""
+        with self._lock:
+            self._dirty[(kind, record_id)] = snapshot
+        self._start()
+
+    def get(self, kind, record_id):
+        """``{'version', 'owner', 'data'}`` of a record, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT version, owner, data FROM records WHERE kind = ? AND id = ?", (kind, record_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'version': row[0], 'owner': row[1], 'data': json.loads(row[2])}
+
+    def list(self, kind):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, version, owner, data FROM records WHERE kind = ?", (kind,)
+            ).fetchall()
+        return [{'id': r[0], 'version': r[1], 'owner': r[2], 'data': json.loads(r[3])} for r in rows]
+
+    def remove(self, kind, record_ids):
+        """Delete the snapshots (and pending requests) of ``record_ids``."""
+        rows = [(kind, record_id) for record_id in record_ids]
+        with self._lock:
+            for key in rows:
+                self._dirty.pop(key, None)
+            conn = self._connection()
+            with conn:
+                conn.executemany("DELETE FROM records WHERE kind = ? AND id = ?", rows)
+                conn.executemany("DELETE FROM requests WHERE kind = ? AND id = ?", rows)
+
+    def request(self, kind, record_id, action):
+        """Ask the owner of a record to perform ``action``; False if there is no such record."""
+        record = self.get(kind, record_id)
+        if record is None:
+            return False
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO requests VALUES (?, ?, ?, ?)",
+                    (kind, record_id, action, record['owner']),
+                )
+        return True
+
+    def on_request(self, kind, handler):
+        """Call ``handler(record_id, action)`` for requests on records this instance published."""
+        with self._lock:
+            self._handlers[kind] = handler
+
+    def poll(self):
+        """Write dirty snapshots and dispatch pending requests once."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        for (kind, record_id), snapshot in dirty.items():
+            version, data = snapshot()
+            self.put(kind, record_id, version, data)
+        with self._lock:
+            if not self._handlers:
+                return
+            conn = self._connection()
+            with conn:
+                pending = conn.execute(
+                    "SELECT kind, id, action FROM requests WHERE owner = ?", (self.owner,)
+                ).fetchall()
+                conn.execute("DELETE FROM requests WHERE owner = ?", (self.owner,))
+            handlers = dict(self._handlers)
+        for kind, record_id, action in pending:
+            handler = handlers.get(kind)
+            if handler is not None:
+                handler(record_id, action)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None or self._stopped.is_set():
+                return
+            self._thread = threading.Thread(target=self._loop, name='shared-state', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Shared state poll failed")
+
+    def close(self):
+        """Stop polling after writing what is still dirty."""
+        self._stopped.set()
+        with self._lock:
+            # An instance that never published has nothing to write or answer
+            used = self._conn is not None or bool(self._dirty)
+        if used:
+            try:
+                self.poll()
+            except sqlite3.Error:
+                logger.exception("Could not flush shared state")
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,97 @@
+# startup.py
+"""
+Startup timing and optional warm-up.
+
+Importing the app only defines things: ``pydicom``, ``requests`` and the
+training script template load on first use, and the model config store
+opens on its first operation (its dedupe keys come from a snapshot). A
+worker therefore starts in a fraction of a second however much history is
+stored. With ``STARTUP_MODE=eager``, ``create_app`` does that work up front
+instead. This suits gunicorn's ``preload_app``, where workers fork from a
+warmed master.
+
+``startup_report`` times each phase; ``create_app`` logs it and publishes
+it as the ``deepbuilder_startup_seconds`` gauge.
+
+    python -m backend.startup [--json]
+
+imports and creates the app in a fresh interpreter and prints the report.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+# Before the app's other imports, so the 'import' phase covers them
+STARTED = time.perf_counter()
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+STARTUP_MODES = ('lazy', 'eager')
+
+
+class StartupReport:
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.phases = []
+        # Set once the app it describes has been created
+        self.finished = False
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def as_dict(self):
+        return {
+            'mode': STARTUP_MODE,
+            'phases': [{'name': name, 'seconds': round(seconds, 6)} for name, seconds in self.phases],
+            'total': round(time.perf_counter() - self.started, 6),
+        }
+
+    def format(self):
+        report = self.as_dict()
+        lines = [f"{phase['name']:32} {phase['seconds'] * 1000:9.1f} ms" for phase in report['phases']]
+        lines.append(f"{'total (' + report['mode'] + ')':32} {report['total'] * 1000:9.1f} ms")
+        return '\n'.join(lines)
+
+
+startup_report = StartupReport()
+
+
+def warm_up(steps, report=startup_report):
+    """Run each ``(name, function)`` of ``steps`` as a ``warm:<name>`` phase."""
+    for name, function in steps:
+        with report.phase(f'warm:{name}'):
+            function()
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(prog='python -m backend.startup',
+                                     description="Time importing and creating the app.")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    from backend.startup import startup_report as report  # the instance the app records into
+    import backend.app  # noqa: F401  (creates the app)
+    result = report.as_dict()
+    result['wall'] = round(time.perf_counter() - start, 6)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(report.format())
+    return 0 if report.phases else 1
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
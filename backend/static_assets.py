@@ -0,0 +1,172 @@
+# static_assets.py
+"""
+Serving the React build.
+
+The build directory is scanned once into an in-memory manifest (path ->
+size, content hash, MIME type and precompressed variants), so requests for
+assets don't touch the filesystem until the file is sent. Content-hashed
+files (``main.3f2a1b9c.js``) never change under their name and are served
+with an immutable one-year ``Cache-Control``; everything else, including
+``index.html`` (held in memory), must be revalidated, which strong ETags turn
+into a 304 without a body. Clients that accept them get the ``.br``/``.gz``
+files written next to the originals by ``python -m backend.static_assets``.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # Only gzip variants are written without it
+    brotli = None
+
+from flask import Response, request, send_file
+
+# Filenames with a content hash, as produced by the React (webpack) build
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{8,}\.(?:chunk\.)?\w+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 1024
+
+INDEX = 'index.html'
+
+
+class Asset:
+    def __init__(self, path, name):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.etag = _digest(path)
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE_CACHE if HASHED_NAME_RE.search(name) else REVALIDATE_CACHE
+        # Content-Encoding -> path of the precompressed file
+        self.variants = {
+            encoding: path + suffix for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)
+        }
+
+
+class StaticAssets:
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.index = None
+
+    def scan(self):
+        """(Re)build the manifest from the files under ``root``."""
+        assets = {}
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.endswith(suffixes) and os.path.isfile(os.path.splitext(path)[0]):
+                    continue  # A variant, served through its original
+                assets[name] = Asset(path, name)
+        index = assets.get(INDEX)
+        if index is not None:
+            with open(index.path, 'rb') as f:
+                self.index = (index, f.read())
+        else:
+            self.index = None
+        self.assets = assets
+
+    def __contains__(self, name):
+        return name in self.assets
+
+    def response(self, name):
+        """Response for the asset ``name`` (a manifest key), or None if there is none."""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        if name == INDEX and self.index is not None:
+            return self.index_response()
+        encoding = self._negotiate(asset)
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+        if request.if_none_match.contains(etag):
+            return self._not_modified(asset, etag)
+        response = send_file(
+            asset.variants[encoding] if encoding else asset.path,
+            mimetype=asset.mimetype, conditional=False, etag=False, max_age=None,
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return self._finish(response, asset, etag)
+
+    def index_response(self):
+        """``index.html`` from memory, or None if the build has none."""
+        if self.index is None:
+            return None
+        asset, body = self.index
+        if request.if_none_match.contains(asset.etag):
+            return self._not_modified(asset, asset.etag)
+        return self._finish(Response(body, mimetype=asset.mimetype), asset, asset.etag)
+
+    @staticmethod
+    def _negotiate(asset):
+        for encoding, _ in ENCODINGS:
+            if encoding in asset.variants and request.accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def _not_modified(self, asset, etag):
+        return self._finish(Response(status=304), asset, etag)
+
+    @staticmethod
+    def _finish(response, asset, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+def compress(root):
+    """Write ``.gz`` (and, with the brotli package, ``.br``) variants of the compressible files under ``root``."""
+    written = 0
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            mimetype = mimetypes.guess_type(filename)[0] or ''
+            if filename.endswith(suffixes) or not mimetype.startswith(COMPRESSIBLE_TYPES):
+                continue
+            if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data)
+            for suffix, body in variants.items():
+                # Not worth a variant if it barely saves anything
+                if len(body) < len(data) * 0.9:
+                    _write_atomic(path + suffix, body)
+                    written += 1
+    return written
+
+
+def _digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()[:32]
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    # Precompress the React build: python -m backend.static_assets [build dir]
+    build = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '../frontend/build')
+    print(f"Wrote {compress(build)} precompressed files")
@@ -0,0 +1,414 @@
+# sweeps.py
+"""
+Hyperparameter sweeps.
+
+A sweep expands a base config and a set of parameter choices/ranges into
+trial configs (``grid``: every combination; ``random``: ``num_trials`` samples;
+``halving``: random samples with successive-halving early stopping), stores
+them with one batched write, and runs them as training jobs with at most
+``max_parallel`` in flight. With early stopping, a trial is cancelled when
+the loss it reports at a rung epoch is not among the best of its rung.
+
+Like jobs, a sweep is scheduled by the worker process that created it and
+published to the job manager's ``SharedState`` for the others.
+"""
+import copy
+import itertools
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import insort
+
+from backend.config_schema import validate_config
+from backend.jobs import job_manager, JobQueueFull, JOB_RETENTION_SECONDS, PRUNE_INTERVAL, SUCCEEDED, CANCELLED
+from backend.model_config_store import model_config_store
+from backend.shared_state import owner_alive
+
+MAX_SWEEP_TRIALS = int(os.getenv("MAX_SWEEP_TRIALS", 256))
+DEFAULT_NUM_TRIALS = 10
+DEFAULT_MAX_PARALLEL = int(os.getenv("SWEEP_MAX_PARALLEL", 2))
+# Finished sweeps kept for reporting, as for jobs
+SWEEP_RETENTION = int(os.getenv("SWEEP_RETENTION", 100))
+SWEEP_RETENTION_SECONDS = float(os.getenv("SWEEP_RETENTION_SECONDS", JOB_RETENTION_SECONDS))
+
+METHODS = ('grid', 'random', 'halving')
+
+# Sweep states
+RUNNING = 'running'
+COMPLETED = 'completed'
+
+# Trial states, on top of the job states they mirror
+PENDING = 'pending'
+PRUNED = 'pruned'
+TRIAL_FINISHED = ('succeeded', 'failed', 'cancelled', PRUNED)
+
+
+class SweepError(ValueError):
+    pass
+
+
+class SuccessiveHalvingPruner:
+    """
+    Asynchronous successive halving. Rungs are at ``min_epochs *
+    reduction_factor ** k`` epochs; a trial reaching a rung continues only if
+    its metric is within the best ``1 / reduction_factor`` of the values
+    reported at that rung so far (lower is better).
+    """
+
+    def __init__(self, min_epochs=1, reduction_factor=3):
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        self._rungs = {}
+        self._lock = threading.Lock()
+
+    def is_rung(self, epoch):
+        rung = self.min_epochs
+        while rung < epoch:
+            rung *= self.reduction_factor
+        return rung == epoch
+
+    def should_continue(self, epoch, value):
+        if not self.is_rung(epoch):
+            return True
+        if value is None or math.isnan(value):
+            return False
+        with self._lock:
+            values = self._rungs.setdefault(epoch, [])
+            insort(values, value)
+            keep = math.ceil(len(values) / self.reduction_factor)
+            return value <= values[keep - 1]
+
+
+def _parse_parameter(name, spec):
+    """Normalize a parameter spec to ``('choice', values)`` or ``('range', low, high, log, is_int)``."""
+    if isinstance(spec, list):
+        spec = {'values': spec}
+    if not isinstance(spec, dict):
+        raise SweepError(f"Parameter '{name}' must be a list of values or an object")
+    if 'values' in spec:
+        if not isinstance(spec['values'], list) or not spec['values']:
+            raise SweepError(f"Parameter '{name}' needs a non-empty list of values")
+        return ('choice', spec['values'])
+    low, high = spec.get('min'), spec.get('max')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (low, high)) or low > high:
+        raise SweepError(f"Parameter '{name}' needs 'values' or numeric 'min' <= 'max'")
+    log = bool(spec.get('log', False))
+    if log and low <= 0:
+        raise SweepError(f"Parameter '{name}' needs 'min' > 0 for a log scale")
+    is_int = spec.get('type') == 'int' or (isinstance(low, int) and isinstance(high, int) and spec.get('type') != 'float')
+    return ('range', low, high, log, is_int)
+
+
+def _sample(parameter, rng):
+    if parameter[0] == 'choice':
+        return rng.choice(parameter[1])
+    _, low, high, log, is_int = parameter
+    if log:
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return min(high, max(low, round(value))) if is_int else value
+
+
+def expand(spec):
+    """
+    Validate a sweep spec and return ``(method, [(params, config)], options)``.
+    Parameters named ``model_type`` set the config's model type; all others
+    set hyperparameters.
+    """
+    if not isinstance(spec, dict):
+        raise SweepError("Expected a JSON object")
+    base = spec.get('base')
+    if not isinstance(base, dict) or not isinstance(base.get('hyperparameters', {}), dict):
+        raise SweepError("'base' must be a model config with a hyperparameters dictionary")
+    method = spec.get('method', 'grid')
+    if method not in METHODS:
+        raise SweepError(f"method must be one of {', '.join(METHODS)}")
+    raw = spec.get('parameters')
+    if not isinstance(raw, dict) or not raw:
+        raise SweepError("'parameters' must be a non-empty object")
+    parameters = {name: _parse_parameter(name, value) for name, value in raw.items()}
+    if 'model_type' not in base and 'model_type' not in parameters:
+        raise SweepError("'base' needs a model_type unless model_type is swept")
+    metric = spec.get('metric', 'val_loss')
+    if not isinstance(metric, str):
+        raise SweepError("metric must be a string")
+
+    if method == 'grid':
+        ranges = [name for name, parameter in parameters.items() if parameter[0] != 'choice']
+        if ranges:
+            raise SweepError(f"Grid sweeps need explicit values for: {', '.join(ranges)}")
+        size = math.prod(len(parameter[1]) for parameter in parameters.values())
+        if size > MAX_SWEEP_TRIALS:
+            raise SweepError(f"Grid has {size} trials; the limit is {MAX_SWEEP_TRIALS}")
+        points = [dict(zip(parameters, values)) for values in itertools.product(*(p[1] for p in parameters.values()))]
+    else:
+        num_trials = spec.get('num_trials', DEFAULT_NUM_TRIALS)
+        if not isinstance(num_trials, int) or isinstance(num_trials, bool) or not 1 <= num_trials <= MAX_SWEEP_TRIALS:
+            raise SweepError(f"num_trials must be an integer from 1 to {MAX_SWEEP_TRIALS}")
+        rng = random.Random(spec.get('seed'))
+        points = [{name: _sample(p, rng) for name, p in parameters.items()} for _ in range(num_trials)]
+
+    trials = []
+    for params in points:
+        config = copy.deepcopy(base)
+        config.setdefault('hyperparameters', {})
+        for name, value in params.items():
+            if name == 'model_type':
+                config['model_type'] = value
+            else:
+                config['hyperparameters'][name] = value
+        # The same schema as /api/modelconfig/batch, so every trial is a storable config
+        errors = validate_config(config)
+        if errors:
+            raise SweepError("Invalid trial config: " + "; ".join(f"{e['field']} {e['message']}" for e in errors))
+        trials.append((params, config))
+
+    max_parallel = spec.get('max_parallel', DEFAULT_MAX_PARALLEL)
+    if not isinstance(max_parallel, int) or isinstance(max_parallel, bool) or max_parallel < 1:
+        raise SweepError("max_parallel must be a positive integer")
+    options = {'max_parallel': max_parallel, 'pruner': None, 'metric': metric}
+    early_stopping = spec.get('early_stopping', {} if method == 'halving' else None)
+    if early_stopping is not None:
+        if not isinstance(early_stopping, dict):
+            raise SweepError("early_stopping must be an object")
+        min_epochs = early_stopping.get('min_epochs', 1)
+        factor = early_stopping.get('reduction_factor', 3)
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in (min_epochs, factor)) \
+                or min_epochs < 1 or factor < 2:
+            raise SweepError("early_stopping needs integer min_epochs >= 1 and reduction_factor >= 2")
+        options['pruner'] = SuccessiveHalvingPruner(min_epochs, factor)
+    return method, trials, options
+
+
+class Sweep:
+    def __init__(self, method, trials, configs, max_parallel, metric, pruner):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.configs = configs
+        self.max_parallel = max_parallel
+        self.metric = metric
+        self.pruner = pruner
+        self.state = RUNNING
+        self.created_at = time.time()
+        self.finished_at = None
+        self.trials = trials
+        self.lock = threading.Lock()
+        self._version = 0
+
+    def best_trial(self):
+        finished = [t for t in self.trials if t['state'] == SUCCEEDED and t['metric'] is not None]
+        return min(finished, key=lambda t: t['metric'], default=None)
+
+    def to_dict(self):
+        with self.lock:
+            return self._as_dict()
+
+    def snapshot(self):
+        with self.lock:
+            self._version += 1
+            return self._version, self._as_dict()
+
+    def _as_dict(self):
+        best = self.best_trial()
+        return {
+            'id': self.id,
+            'method': self.method,
+            'state': self.state,
+            'metric': self.metric,
+            'max_parallel': self.max_parallel,
+            'early_stopping': self.pruner is not None,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'best_trial': best['index'] if best else None,
+            'trials': [dict(t) for t in self.trials],
+        }
+
+
+class RemoteSweep:
+    """Read-only view of a sweep scheduled by another worker process."""
+
+    def __init__(self, record):
+        self._data = dict(record['data'])
+        if self._data['state'] == RUNNING and not owner_alive(record['owner']):
+            self._data['state'] = CANCELLED
+        self.id = self._data['id']
+        self.state = self._data['state']
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class SweepManager:
+    RETRY_DELAY = 1.0
+
+    def __init__(self, store, jobs, shared=None, retention=SWEEP_RETENTION, retention_seconds=SWEEP_RETENTION_SECONDS):
+        self.store = store
+        self.jobs = jobs
+        self.shared = shared if shared is not None else jobs.shared
+        self.shared.on_request('sweep', self._on_request)
+        self.retention = retention
+        self.retention_seconds = retention_seconds
+        self._sweeps = {}
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, spec):
+        if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+        method, expanded, options = expand(spec)
+        config_ids = self.store.add_many([config for _, config in expanded])
+        if config_ids is None:
+            raise OSError("Unable to save sweep configurations")
+        trials = [
+            {'index': i, 'config_id': config_id, 'params': params, 'state': PENDING,
+             'job_id': None, 'epoch': None, 'metric': None}
+            for i, (config_id, (params, _)) in enumerate(zip(config_ids, expanded))
+        ]
+        configs = {config_id: config for config_id, (_, config) in zip(config_ids, expanded)}
+        sweep = Sweep(method, trials, configs, options['max_parallel'], options['metric'], options['pruner'])
+        with self._lock:
+            self._sweeps[sweep.id] = sweep
+        self._launch(sweep)
+        self.shared.put('sweep', sweep.id, *sweep.snapshot())
+        return sweep
+
+    def get(self, sweep_id):
+        """A sweep of this process, a ``RemoteSweep`` of another worker's, or None."""
+        with self._lock:
+            sweep = self._sweeps.get(sweep_id)
+        if sweep is None:
+            record = self.shared.get('sweep', sweep_id)
+            if record is not None:
+                sweep = RemoteSweep(record)
+        return sweep
+
+    def cancel(self, sweep_id):
+        sweep = self.get(sweep_id)
+        if sweep is None or sweep.state != RUNNING:
+            return False
+        if isinstance(sweep, RemoteSweep):
+            return self.shared.request('sweep', sweep_id, 'cancel')
+        with sweep.lock:
+            if sweep.state != RUNNING:
+                return False
+            sweep.state = CANCELLED
+            sweep.finished_at = time.time()
+            running = []
+            for trial in sweep.trials:
+                if trial['state'] == PENDING:
+                    trial['state'] = CANCELLED
+                elif trial['state'] not in TRIAL_FINISHED:
+                    running.append(trial['job_id'])
+        for job_id in running:
+            self.jobs.cancel(job_id)
+        self._share(sweep)
+        return True
+
+    def prune(self):
+        """
+        Forget finished sweeps beyond the newest ``retention`` or that finished
+        more than ``retention_seconds`` ago, as ``JobManager.prune`` does for jobs.
+        """
+        self._pruned_at = time.monotonic()
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            finished = sorted((sweep for sweep in self._sweeps.values() if sweep.state != RUNNING),
+                              key=lambda sweep: sweep.finished_at or 0, reverse=True)
+            expired = [sweep.id for i, sweep in enumerate(finished)
+                       if i >= self.retention or (sweep.finished_at or 0) < cutoff]
+            for sweep_id in expired:
+                del self._sweeps[sweep_id]
+        for record in self.shared.list('sweep'):
+            data = record['data']
+            if (data.get('finished_at') or data.get('created_at') or 0) < cutoff and not owner_alive(record['owner']):
+                expired.append(record['id'])
+        if expired:
+            self.shared.remove('sweep', expired)
+        return len(expired)
+
+    def _on_request(self, sweep_id, action):
+        if action == 'cancel':
+            self.cancel(sweep_id)
+
+    def _share(self, sweep):
+        self.shared.mark_dirty('sweep', sweep.id, sweep.snapshot)
+
+    def _launch(self, sweep):
+        """Start pending trials up to the sweep's parallelism limit."""
+        started = []
+        with sweep.lock:
+            if sweep.state != RUNNING:
+                return
+            active = sum(1 for t in sweep.trials if t['job_id'] and t['state'] not in TRIAL_FINISHED)
+            for trial in sweep.trials:
+                if active >= sweep.max_parallel:
+                    break
+                if trial['state'] != PENDING:
+                    continue
+                try:
+                    job = self.jobs.submit(
+                        trial['config_id'], sweep.configs[trial['config_id']],
+                        on_progress=lambda job, update, trial=trial: self._on_progress(sweep, trial, job, update),
+                    )
+                except JobQueueFull:
+                    if not active and not self.jobs.draining:
+                        # Nothing of ours will finish to trigger the next launch, so retry later
+                        timer = threading.Timer(self.RETRY_DELAY, self._launch, args=(sweep,))
+                        timer.daemon = True
+                        timer.start()
+                    break
+                trial['job_id'] = job.id
+                trial['state'] = job.state
+                active += 1
+                started.append((trial, job))
+            self._check_finished(sweep)
+        # Outside the lock: the callback runs immediately if the job already finished
+        for trial, job in started:
+            job.future.add_done_callback(lambda _, trial=trial, job=job: self._on_done(sweep, trial, job))
+        self._share(sweep)
+
+    def _on_progress(self, sweep, trial, job, update):
+        if 'epoch' not in update:
+            return
+        value = update.get(sweep.metric, update.get('loss'))
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        with sweep.lock:
+            if trial['state'] in TRIAL_FINISHED:
+                # Reports still in flight after the trial was pruned
+                return
+            trial['state'] = job.state
+            trial['epoch'] = update['epoch']
+            trial['metric'] = value
+            prune = sweep.pruner is not None and not sweep.pruner.should_continue(update['epoch'], value)
+            if prune:
+                trial['state'] = PRUNED
+        self._share(sweep)
+        if prune:
+            # Cancelling waits for the process to exit; don't block the job's supervisor thread on it
+            threading.Thread(target=self.jobs.cancel, args=(job.id,), daemon=True).start()
+
+    def _on_done(self, sweep, trial, job):
+        with sweep.lock:
+            if trial['state'] != PRUNED:
+                trial['state'] = job.state
+            if trial['metric'] is None and job.cached_from:
+                # Runs served from the result cache report only their final progress
+                value = job.progress.get(sweep.metric, job.progress.get('loss'))
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    trial['metric'] = value
+                    trial['epoch'] = job.progress.get('current_epoch')
+        self._launch(sweep)
+
+    def _check_finished(self, sweep):
+        if sweep.state == RUNNING and all(t['state'] in TRIAL_FINISHED for t in sweep.trials):
+            sweep.state = COMPLETED
+            sweep.finished_at = time.time()
+
+
+# Singleton instance for app use
+sweep_manager = SweepManager(model_config_store, job_manager)
@@ -0,0 +1,27 @@
+import pytest
+import backend.app
+import backend.jobs
+import backend.lifecycle
+import backend.model_config_store
+import backend.routes
+import backend.sweeps
+from backend.jobs import JobManager
+from backend.model_config_store import ModelConfigStore, config_key
+from backend.sweeps import SweepManager
+
+@pytest.fixture(autouse=True)
+def isolated_stores(tmp_path, monkeypatch):
+    """Give the app's config store, job manager and sweep manager a temporary directory, so tests leave the tree clean."""
+    store = ModelConfigStore(file_path=str(tmp_path / 'model_configs.jsonl'), dedupe_key=config_key)
+    jobs = JobManager(jobs_dir=str(tmp_path / 'jobs'))
+    sweeps = SweepManager(store, jobs)
+    for module in (backend.app, backend.model_config_store, backend.routes):
+        monkeypatch.setattr(module, 'model_config_store', store)
+    for module in (backend.jobs, backend.routes):
+        monkeypatch.setattr(module, 'job_manager', jobs)
+    for module in (backend.sweeps, backend.routes):
+        monkeypatch.setattr(module, 'sweep_manager', sweeps)
+    monkeypatch.setattr(backend.lifecycle.lifecycle, 'jobs', jobs)
+    yield
+    jobs.shutdown()
+    store.close()
@@ -0,0 +1,41 @@
+import json
+from backend.benchmarks import HIGHER, LOWER, compare, run
+from backend.benchmarks.__main__ import main
+from backend.benchmarks.uploads import PatternStream
+
+def results(**values):
+    return {'meta': {}, 'results': {
+        name: {'value': value, 'unit': 'x', 'better': LOWER if name.endswith('seconds') else HIGHER, 'min_delta': 0}
+        for name, value in values.items()
+    }}
+
+def test_compare_flags_changes_beyond_the_threshold():
+    baseline = results(ops=100, slow_seconds=1.0, steady=50, dropped=1)
+    current = results(ops=80, slow_seconds=0.5, steady=55, added=1)
+    rows = {name: (change, status) for name, _, _, change, status in compare(current, baseline, threshold=0.1)}
+    assert rows['ops'] == (-0.2, 'regressed')
+    assert rows['slow_seconds'] == (0.5, 'improved')
+    assert rows['steady'][1] == 'ok'
+    assert rows['added'] == (None, 'new')
+    assert rows['dropped'] == (None, 'missing')
+
+def test_pattern_stream_is_seekable():
+    stream = PatternStream(3000, b'<', b'>')
+    assert stream.seek(0, 2) == stream.length == 3002
+    stream.seek(0)
+    data = b''.join(iter(lambda: stream.read(1000), b''))
+    assert len(data) == 3002 and data[:1] == b'<' and data[-1:] == b'>'
+    assert data[1:257] == bytes(range(256))
+
+def test_run_and_compare_against_baseline(tmp_path, capsys):
+    run_results = run(['explanation_hot'], scale='quick')
+    assert list(run_results['results']) == ['explanation_hot']
+    assert run_results['results']['explanation_hot']['unit'] == 'lookups/s'
+
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(results(explanation_hot=10 ** 12)))
+    output = tmp_path / 'results.json'
+    assert main(['--scale', 'quick', '--only', 'explanation_hot', '--output', str(output),
+                 '--baseline', str(baseline)]) == 1
+    assert 'regressed' in capsys.readouterr().err
+    assert 'explanation_hot' in json.loads(output.read_text())['results']
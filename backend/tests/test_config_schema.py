@@ -0,0 +1,42 @@
+import unittest
+from backend.config_schema import SCHEMA, compile_schema, validate_config
+
+def fields(errors):
+    return [error["field"] for error in errors]
+
+class TestConfigSchema(unittest.TestCase):
+    def test_valid_config(self):
+        self.assertEqual(validate_config({
+            "model_type": "ResNet",
+            "hyperparameters": {"optimizer": "SGD", "loss_function": "Dice", "lr": 0.1, "epochs": 5.0,
+                                "momentum": 0.5, "dataset_cache": "disk", "tag": "free-form"},
+            "dataset": {"images": "a.npy", "labels": "b.npy"},
+        }), [])
+
+    def test_allowed_values_types_and_ranges(self):
+        errors = validate_config({
+            "model_type": "cnn",
+            "hyperparameters": {"optimizer": 3, "loss_function": "Hinge", "epochs": 2.5, "momentum": 1.5,
+                                "learning_rate": True, "prefetch_factor": 0},
+        })
+        self.assertEqual(fields(errors), [
+            "model_type", "hyperparameters.optimizer", "hyperparameters.loss_function",
+            "hyperparameters.epochs", "hyperparameters.learning_rate", "hyperparameters.momentum",
+            "hyperparameters",
+        ])
+        messages = {error["field"]: error["message"] for error in errors}
+        self.assertEqual(messages["hyperparameters.momentum"], "must be from 0.0 to 1.0")
+        self.assertEqual(messages["hyperparameters.epochs"], "must be an integer")
+        self.assertIn("prefetch_factor", messages["hyperparameters"])
+
+    def test_dataset_preprocessing_is_checked(self):
+        errors = validate_config({
+            "model_type": "CNN", "hyperparameters": {},
+            "dataset": {"images": "a.npy", "labels": "b.npy", "preprocess": {"normalize": "l2"}},
+        })
+        self.assertEqual(fields(errors), ["dataset"])
+
+    def test_compiled_from_a_custom_schema(self):
+        validate = compile_schema({**SCHEMA, "model_type": {"type": str, "required": True, "enum": ["Tiny"]}})
+        self.assertEqual(validate({"model_type": "Tiny", "hyperparameters": {}}), [])
+        self.assertEqual(fields(validate({"model_type": "CNN", "hyperparameters": {}})), ["model_type"])
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from backend.dataset_store import DatasetStore
+
+class TestDatasetStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = DatasetStore(root=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def add(self, name, content):
+        path = os.path.join(self.root, 'incoming.part')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return self.store.add_file(path, name, len(content), hashlib.sha256(content).hexdigest())
+
+    def test_identical_content_is_stored_once(self):
+        first = self.add('a.npy', b'same')
+        second = self.add('b.npy', b'same')
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        blobs = [name for _, _, files in os.walk(self.store.blob_dir) for name in files]
+        self.assertEqual(len(blobs), 1)
+        with open(os.path.join(self.root, 'b.npy'), 'rb') as f:
+            self.assertEqual(f.read(), b'same')
+
+    def test_reupload_under_same_name_keeps_old_content(self):
+        old = self.add('scan.dcm', b'v1')
+        new = self.add('scan.dcm', b'v2')
+        self.assertEqual(new['previous_sha256'], old['sha256'])
+        self.assertTrue(self.store.has_blob(old['sha256']))
+        with open(os.path.join(self.root, 'scan.dcm'), 'rb') as f:
+            self.assertEqual(f.read(), b'v2')
+
+    def test_link_existing_skips_transfer(self):
+        saved = self.add('a.npy', b'data')
+        linked = self.store.link_existing('copy.npy', saved['sha256'])
+        self.assertTrue(linked['deduplicated'])
+        self.assertIsNone(self.store.link_existing('other.npy', '0' * 64))
+        self.assertIsNone(self.store.link_existing('other.npy', 'not-a-hash'))
+
+    def test_manifest_survives_restart(self):
+        saved = self.add('a.npy', b'data')
+        reopened = DatasetStore(root=self.root)
+        self.assertEqual(reopened.get('a.npy')['sha256'], saved['sha256'])
+        self.assertEqual(len(reopened.get_all()), 1)
+
+    def test_reserved_names_are_rejected(self):
+        saved = self.add('a.npy', b'data')
+        path = os.path.join(self.root, 'incoming.part')
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        for name in ('manifest.jsonl', 'blobs', '.partial', 'a.npy.123.link', '../a.npy'):
+            with self.assertRaises(ValueError):
+                self.store.add_file(path, name, 1, hashlib.sha256(b'x').hexdigest())
+            with self.assertRaises(ValueError):
+                self.store.link_existing(name, saved['sha256'])
+        # The caller keeps the rejected file and the manifest is untouched
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(DatasetStore(root=self.root).get('a.npy')['sha256'], saved['sha256'])
+
+if __name__ == '__main__':
+    unittest.main()
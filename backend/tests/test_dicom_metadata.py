@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from backend.dicom_metadata import read_dicom_header, InvalidDicomError
+
+def make_dicom(path, modality='CT', series_uid=None, rows=4, columns=4, instance_number=1):
+    """Write a small DICOM slice with pixel data to ``path``."""
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.PatientID = 'P001'
+    ds.StudyInstanceUID = '1.2.3'
+    ds.SeriesInstanceUID = series_uid or generate_uid()
+    ds.Modality = modality
+    ds.InstanceNumber = instance_number
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.PixelSpacing = [0.5, 0.75]
+    ds.SliceThickness = 2.5
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.PixelRepresentation = 0
+    ds.PixelData = b'\0\1' * rows * columns
+    ds.save_as(path, enforce_file_format=True)
+    return ds
+
+class TestReadDicomHeader(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.dcm')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_extracts_metadata(self):
+        ds = make_dicom(self.path, modality='MR', series_uid='1.2.3.4')
+        metadata = read_dicom_header(self.path)
+        self.assertEqual(metadata['modality'], 'MR')
+        self.assertEqual(metadata['series_instance_uid'], '1.2.3.4')
+        self.assertEqual(metadata['sop_instance_uid'], ds.SOPInstanceUID)
+        self.assertEqual(metadata['rows'], 4)
+        self.assertEqual(metadata['pixel_spacing'], [0.5, 0.75])
+        self.assertEqual(metadata['slice_thickness'], 2.5)
+
+    def test_minimal_header_has_no_metadata(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 128 + b'DICM' + b'\0' * 4)
+        self.assertEqual(read_dicom_header(self.path), {})
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'notdicom')
+        with self.assertRaises(InvalidDicomError):
+            read_dicom_header(self.path)
+
+if __name__ == '__main__':
+    unittest.main()
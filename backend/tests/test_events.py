@@ -0,0 +1,79 @@
+import json
+import threading
+from backend.events import EventBroadcaster, HEARTBEAT, StreamLimit
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+def test_replay_and_resume_from_last_event_id():
+    events = EventBroadcaster(replay=3)
+    for epoch in range(1, 6):
+        events.publish('progress', {'epoch': epoch})
+    events.close()
+    # Only the last three events are retained
+    assert [parse(m)[2]['epoch'] for m in events.subscribe()] == [3, 4, 5]
+    assert [parse(m)[0] for m in events.subscribe(last_event_id=3)] == [4, 5]
+    assert list(events.subscribe(last_event_id=5)) == []
+
+def test_subscribers_share_live_events():
+    events = EventBroadcaster()
+    received = [[], []]
+    ready = threading.Barrier(3)
+
+    def consume(out):
+        stream = events.subscribe(heartbeat=5)
+        ready.wait()
+        out.extend(parse(m)[1:] for m in stream)
+
+    threads = [threading.Thread(target=consume, args=(out,)) for out in received]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    events.publish('progress', {'loss': 0.5})
+    events.publish('state', {'state': 'succeeded'})
+    events.close()
+    for thread in threads:
+        thread.join(5)
+    assert received[0] == received[1] == [('progress', {'loss': 0.5}), ('state', {'state': 'succeeded'})]
+
+def test_heartbeat_while_idle():
+    events = EventBroadcaster()
+    stream = events.subscribe(heartbeat=0.01)
+    assert next(stream) == HEARTBEAT
+    events.close()
+    assert list(stream) == []
+
+def test_stream_limit_caps_and_releases_slots():
+    streams = StreamLimit(limit=2)
+    events = EventBroadcaster()
+    first = streams.open(lambda stop: events.subscribe(heartbeat=0.01, stop=stop))
+    second = streams.open(lambda stop: events.subscribe(heartbeat=0.01, stop=stop))
+    assert streams.open(lambda stop: events.subscribe(stop=stop)) is None
+    # A response closed before it was ever iterated still gives its slot back
+    second.close()
+    second.close()
+    assert streams.active == 1
+    assert next(first) == HEARTBEAT
+    streams.close()
+    assert list(first) == []
+    first.close()
+    assert streams.active == 0
+    assert streams.open(lambda stop: events.subscribe(stop=stop)) is None
+
+def test_closing_streams_wakes_waiting_subscribers():
+    import threading, time
+    streams = StreamLimit(limit=1)
+    events = EventBroadcaster()
+    stream = streams.open(lambda stop: events.subscribe(heartbeat=60, stop=stop))
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(stream))
+    reader.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    streams.close()
+    reader.join(5)
+    assert not reader.is_alive()
+    assert time.monotonic() - started < 1
+    assert received == []
+    stream.close()
@@ -1,5 +1,7 @@
 import unittest
+from unittest import mock
 from backend.app import app
+from backend.explanations import explanation_service, ERROR, MISSING
 import json
 
 class TestExplanationAPI(unittest.TestCase):
@@ -20,9 +22,19 @@ class TestExplanationAPI(unittest.TestCase):
         self.assertTrue(len(data['summary']) > 0)
 
     def test_invalid_term(self):
-        resp = self.client.get('/api/explanation?term=ThisTermDoesNotExist1234567890')
+        # The summary API is stubbed, so an unknown term is a 404 with or without network
+        missing = ("No summary found for 'ThisTermDoesNotExist1234567890'.", MISSING)
+        with mock.patch.object(explanation_service, '_fetch', return_value=missing):
+            resp = self.client.get('/api/explanation?term=ThisTermDoesNotExist1234567890')
         self.assertEqual(resp.status_code, 404)
         self.assertIn('No summary found', resp.get_json().get('error', ''))
 
+    def test_unreachable_summary_api(self):
+        error = ("An error occurred while fetching the summary.", ERROR)
+        with mock.patch.object(explanation_service, '_fetch', return_value=error):
+            resp = self.client.get('/api/explanation?term=UnreachableTerm1234567890')
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('try again later', resp.get_json().get('error', ''))
+
 if __name__ == '__main__':
     unittest.main()
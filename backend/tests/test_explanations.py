@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend.explanations import ExplanationService, FOUND, MISSING, ERROR
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the summary API: /summary/<term>."""
+    summaries = {'Adam': 'Adam is an optimizer.'}
+    calls = []
+    delay = 0
+
+    def do_GET(self):
+        term = self.path.rsplit('/', 1)[-1]
+        self.calls.append(term)
+        time.sleep(self.delay)
+        if term in self.summaries:
+            body = json.dumps({'extract': self.summaries[term]}).encode()
+            self.send_response(200)
+        else:
+            body = b'{}'
+            self.send_response(404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestExplanationService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/summary/{{term}}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StandInHandler.calls.clear()
+        StandInHandler.delay = 0
+        self.service = ExplanationService(url=self.url, timeout=2, glossary_path=None, cache_db=None,
+                                          use_bundled_glossary=False)
+
+    def test_found_summary_is_cached(self):
+        self.assertEqual(self.service.lookup('Adam'), ('Adam is an optimizer.', FOUND))
+        self.assertEqual(self.service.lookup('Adam'), ('Adam is an optimizer.', FOUND))
+        self.assertEqual(StandInHandler.calls, ['Adam'])
+
+    def test_misses_are_negatively_cached(self):
+        self.assertEqual(self.service.lookup('Nope')[1], MISSING)
+        self.assertEqual(self.service.lookup('Nope')[1], MISSING)
+        self.assertEqual(StandInHandler.calls, ['Nope'])
+
+    def test_concurrent_lookups_are_coalesced(self):
+        StandInHandler.delay = 0.3
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.service.lookup('Adam'))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(result == ('Adam is an optimizer.', FOUND) for result in results))
+        self.assertEqual(StandInHandler.calls, ['Adam'])
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        self.service.lookup('Adam')
+        entry = self.service.memory_cache.get('Adam')
+        entry['fetched_at'] = time.time() - 25 * 3600
+        self.assertEqual(self.service.lookup('Adam'), ('Adam is an optimizer.', FOUND))
+        self.service._refresher.shutdown(wait=True)
+        self.assertEqual(StandInHandler.calls, ['Adam', 'Adam'])
+
+    def test_failed_refresh_keeps_found_entry(self):
+        self.service.lookup('Adam')
+        self.service.memory_cache.get('Adam')['fetched_at'] = time.time() - 25 * 3600
+        self.service.url = 'http://127.0.0.1:9/{term}'
+        self.service.timeout = 0.5
+        self.assertEqual(self.service.lookup('Adam'), ('Adam is an optimizer.', FOUND))
+        self.service._refresher.shutdown(wait=True)
+        entry = self.service.memory_cache.get('Adam')
+        self.assertEqual((entry['summary'], entry['status']), ('Adam is an optimizer.', FOUND))
+
+    def test_stale_key_is_refreshed_once_at_a_time(self):
+        self.service.lookup('Adam')
+        self.service.memory_cache.get('Adam')['fetched_at'] = time.time() - 25 * 3600
+        StandInHandler.delay = 0.3
+        for _ in range(5):
+            self.assertEqual(self.service.lookup('Adam')[1], FOUND)
+        self.service._refresher.shutdown(wait=True)
+        self.assertEqual(StandInHandler.calls, ['Adam', 'Adam'])
+        self.assertEqual(self.service._refreshing, set())
+
+    def test_unreachable_upstream_is_an_error(self):
+        service = ExplanationService(url='http://127.0.0.1:9/{term}', timeout=0.5, glossary_path=None,
+                                     cache_db=None, use_bundled_glossary=False)
+        self.assertEqual(service.lookup('Adam')[1], ERROR)
+
+    def test_glossary_answers_offline(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'Dice': 'Dice loss measures overlap.'}, f)
+        try:
+            service = ExplanationService(url='http://127.0.0.1:9/{term}', glossary_path=f.name, cache_db=None,
+                                         use_bundled_glossary=False)
+            self.assertEqual(service.lookup('dice'), ('Dice loss measures overlap.', FOUND))
+        finally:
+            os.remove(f.name)
+
+    def test_disk_cache_survives_restart(self):
+        fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            service = ExplanationService(url=self.url, glossary_path=None, cache_db=db_path,
+                                         use_bundled_glossary=False)
+            service.lookup('Adam')
+            restarted = ExplanationService(url='http://127.0.0.1:9/{term}', glossary_path=None, cache_db=db_path,
+                                           use_bundled_glossary=False)
+            self.assertEqual(restarted.lookup('Adam'), ('Adam is an optimizer.', FOUND))
+            self.assertEqual(StandInHandler.calls, ['Adam'])
+        finally:
+            os.remove(db_path)
+
+class TestGlossary(unittest.TestCase):
+    def setUp(self):
+        self.service = ExplanationService(url='http://127.0.0.1:9/{term}', timeout=0.5, glossary_path=None,
+                                          cache_db=None)
+
+    def test_spelling_variants_resolve(self):
+        summaries = {self.service.lookup(term) for term in ('adamw', 'AdamW', 'Adam W', 'adam_w')}
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries.pop()[1], FOUND)
+
+    def test_prefix_and_fuzzy_lookup(self):
+        self.assertEqual(self.service.glossary.lookup('Convolutional'), self.service.glossary.lookup('CNN'))
+        self.assertEqual(self.service.glossary.lookup('RMSprp'), self.service.glossary.lookup('RMSprop'))
+        # Ambiguous prefixes are not guessed
+        self.assertIsNone(self.service.glossary.lookup('Ada'))
+        self.assertIsNone(self.service.glossary.lookup('ThisTermDoesNotExist1234567890'))
+
+    def test_every_parameter_option_is_covered(self):
+        from backend.app import app
+        options = app.test_client().get('/api/parameter-options').get_json()
+        for terms in options.values():
+            for term in terms:
+                self.assertIsNotNone(self.service.glossary.lookup(term), term)
+
+    def test_bulk_endpoint(self):
+        from backend.app import app
+        rv = app.test_client().get('/api/explanation?terms=Adam,Dice, UNet,Adam')
+        self.assertEqual(rv.status_code, 200)
+        explanations = rv.get_json()['explanations']
+        self.assertEqual(sorted(explanations), ['Adam', 'Dice', 'UNet'])
+        self.assertTrue(all('summary' in value for value in explanations.values()))
+
+if __name__ == '__main__':
+    unittest.main()
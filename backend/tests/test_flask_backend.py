@@ -9,6 +9,7 @@ from flask import Flask
 from backend.app import app  # absolute import now works
 from dotenv import load_dotenv
 import io
+import uuid
 
 # --- FIX: Define /api/error route before tests run ---
 @app.route('/api/error')
@@ -77,11 +78,117 @@ class TestFlaskBackend(unittest.TestCase):
         self.assertEqual(response.status_code, 422)
         self.assertIn("error", response.json)
 
+    def test_post_modelconfig_invalid_throughput_option(self):
+        payload = {"model_type": "CNN", "hyperparameters": {"num_workers": "many", "mixed_precision": True}}
+        response = self.app.post("/api/modelconfig", json=payload)
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("num_workers", response.json["error"])
+        self.assertNotIn("mixed_precision", response.json["error"])
+
     def test_post_modelconfig_invalid_json(self):
         response = self.app.post("/api/modelconfig", data="not_a_json", content_type="text/plain")
         self.assertEqual(response.status_code, 400)
         self.assertIn("error", response.json)
 
+    def test_post_modelconfig_ids_are_unique(self):
+        first = self.app.post("/api/modelconfig", json=self.unique_payload()).json["id"]
+        second = self.app.post("/api/modelconfig", json=self.unique_payload()).json["id"]
+        self.assertEqual(second, first + 1)
+
+    def test_post_modelconfig_deduplicates_equal_configs(self):
+        payload = self.unique_payload()
+        first = self.app.post("/api/modelconfig", json=payload).json
+        self.assertFalse(first["duplicate"])
+        # Same config with reordered keys, an alias and explicit defaults
+        equal = {
+            "hyperparameters": {"lr": 0.001, "epochs": 10.0, "tag": payload["hyperparameters"]["tag"]},
+            "model_type": "neural_network",
+        }
+        second = self.app.post("/api/modelconfig", json=equal)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json["id"], first["id"])
+        self.assertTrue(second.json["duplicate"])
+
+    def test_post_modelconfig_batch(self):
+        tag = uuid.uuid4().hex
+        existing = self.app.post("/api/modelconfig", json={"model_type": "CNN", "hyperparameters": {"tag": tag}}).json["id"]
+        configs = [
+            {"model_type": "CNN", "hyperparameters": {"tag": tag}},
+            {"model_type": "UNet", "hyperparameters": {"tag": tag, "optimizer": "AdamW", "lr": 0.01}},
+            {"model_type": "Perceptron", "hyperparameters": {"epochs": 0, "num_workers": -1}},
+            {"hyperparameters": []},
+            "not a config",
+        ]
+        response = self.app.post("/api/modelconfig/batch", json={"configs": configs})
+        self.assertEqual(response.status_code, 201)
+        body = response.json
+        self.assertEqual((body["created"], body["duplicates"], body["invalid"]), (1, 1, 3))
+        results = body["results"]
+        self.assertEqual(results[0], {"index": 0, "id": existing, "duplicate": True})
+        self.assertFalse(results[1]["duplicate"])
+        self.assertEqual(self.app.get(f"/api/modelconfig/{results[1]['id']}").json["config"], configs[1])
+        self.assertEqual(
+            {error["field"] for error in results[2]["errors"]},
+            {"model_type", "hyperparameters.epochs", "hyperparameters"},
+        )
+        self.assertEqual(results[3]["errors"], [
+            {"field": "model_type", "message": "is required"},
+            {"field": "hyperparameters", "message": "must be an object"},
+        ])
+        self.assertEqual(results[4]["errors"], [{"field": "", "message": "must be an object"}])
+
+        again = self.app.post("/api/modelconfig/batch", json=configs[:2])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json["duplicates"], 2)
+        self.assertEqual(self.app.post("/api/modelconfig/batch", json={"configs": {}}).status_code, 400)
+
+    @staticmethod
+    def unique_payload(**hyperparameters):
+        return {"model_type": "neural_network", "hyperparameters": {"tag": uuid.uuid4().hex, **hyperparameters}}
+
+    def test_get_modelconfig_by_id(self):
+        payload = {"model_type": "lookup_test", "hyperparameters": {"epochs": 3}}
+        saved_id = self.app.post("/api/modelconfig", json=payload).json["id"]
+        response = self.app.get(f"/api/modelconfig/{saved_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"id": saved_id, "config": payload})
+        self.assertEqual(self.app.get("/api/modelconfig/999999999").status_code, 404)
+
+    def test_get_modelconfig_script_with_etag(self):
+        payload = {"model_type": "CNN", "hyperparameters": {"epochs": 2, "optimizer": "SGD"}}
+        saved_id = self.app.post("/api/modelconfig", json=payload).json["id"]
+        response = self.app.get(f"/api/modelconfig/{saved_id}/script")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/x-python")
+        self.assertTrue(response.get_data(as_text=True).startswith("import torch"))
+        etag = response.headers["ETag"]
+        cached = self.app.get(f"/api/modelconfig/{saved_id}/script", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.app.get("/api/modelconfig/999999999/script").status_code, 404)
+
+    def test_list_modelconfigs_filtered_and_paginated(self):
+        ids = [
+            self.app.post("/api/modelconfig", json=dict(self.unique_payload(optimizer="Adam"), model_type="listing_test")).json["id"]
+            for _ in range(3)
+        ]
+        response = self.app.get("/api/modelconfig?model_type=listing_test&optimizer=Adam&limit=2")
+        self.assertEqual(response.status_code, 200)
+        page = response.json
+        self.assertEqual(len(page["items"]), 2)
+        self.assertIsNotNone(page["next_cursor"])
+        seen = [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        while cursor is not None:
+            page = self.app.get(f"/api/modelconfig?model_type=listing_test&optimizer=Adam&limit=2&cursor={cursor}").json
+            seen.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+        self.assertEqual(seen[-3:], ids)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_list_modelconfigs_bad_cursor(self):
+        response = self.app.get("/api/modelconfig?cursor=abc")
+        self.assertEqual(response.status_code, 400)
+
     def test_upload_file_success(self):
         data = {
             'file': (io.BytesIO(b"test file content"), 'test.txt')
@@ -91,6 +198,14 @@ class TestFlaskBackend(unittest.TestCase):
         self.assertIn('File uploaded', response.json['message'])
         self.assertTrue(response.json['path'].endswith('test.txt'))
 
+    def test_upload_file_reserved_name(self):
+        for name in ('manifest.jsonl', 'blobs'):
+            data = {'file': (io.BytesIO(b"not a manifest"), name)}
+            response = self.app.post('/api/upload', data=data, content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 400)
+        response = self.app.post('/api/uploads', json={'filename': 'manifest.jsonl', 'size': 1})
+        self.assertEqual(response.status_code, 400)
+
     def test_upload_file_no_file(self):
         response = self.app.post('/api/upload', data={}, content_type='multipart/form-data')
         self.assertEqual(response.status_code, 400)
@@ -0,0 +1,125 @@
+import io
+import os
+import tarfile
+import uuid
+import zipfile
+import pytest
+import backend.ingest as ingest_module
+from backend.app import app, UPLOAD_FOLDER
+from backend.dataset_store import DatasetStore
+from backend.tests.test_dicom_metadata import make_dicom
+from backend.uploads import IncomingFile
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def series(tmp_path):
+    """Three slices of one series and one of another, as (member name, bytes) pairs."""
+    series_uid = '1.2.826.0.1.3680043.99.' + str(uuid.uuid4().int)[:20]
+    other_uid = series_uid + '.2'
+    members = []
+    for i, uid in enumerate([series_uid, series_uid, series_uid, other_uid]):
+        path = tmp_path / f'slice{i}.dcm'
+        make_dicom(str(path), series_uid=uid, instance_number=i)
+        members.append((f'{uid}/IM{i:04d}.dcm', path.read_bytes()))
+    return series_uid, other_uid, members
+
+def cleanup(report):
+    for result in report['results']:
+        if result['status'] == 'ok':
+            os.remove(os.path.join(UPLOAD_FOLDER, result['name']))
+
+def test_bulk_zip_upload_groups_series(client, series):
+    series_uid, other_uid, members = series
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+        archive.writestr('broken.dcm', b'notdicom')
+        archive.writestr('notes.txt', b'hello')
+    buffer.seek(0)
+    rv = client.post('/api/upload-dataset/bulk', data={'files': (buffer, 'series.zip')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200
+    report = rv.json
+    assert report['summary'] == {'ok': 4, 'invalid': 1, 'skipped': 1}
+    assert len(report['series'][series_uid]) == 3
+    assert len(report['series'][other_uid]) == 1
+    statuses = {result['name']: result['status'] for result in report['results']}
+    assert statuses['broken.dcm'] == 'invalid'
+    assert statuses['notes.txt'] == 'skipped'
+    # Slices land in the dataset index under their flattened archive paths
+    listed = client.get(f'/api/datasets?series_instance_uid={series_uid}').json['items']
+    assert len(listed) == 3
+    cleanup(report)
+
+def test_bulk_tar_upload(client, series):
+    series_uid, _, members = series
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, content in members[:3]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    rv = client.post('/api/upload-dataset/bulk', data={'files': (buffer, 'series.tar.gz')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200
+    assert rv.json['summary']['ok'] == 3
+    assert list(rv.json['series']) == [series_uid]
+    cleanup(rv.json)
+
+def test_bulk_multifile_upload(client, series):
+    _, _, members = series
+    files = [(io.BytesIO(content), name.split('/')[-1]) for name, content in members[:2]]
+    rv = client.post('/api/upload-dataset/bulk', data={'files': files}, content_type='multipart/form-data')
+    assert rv.status_code == 200
+    assert [result['status'] for result in rv.json['results']] == ['ok', 'ok']
+    cleanup(rv.json)
+
+def test_bulk_invalid_archive(client):
+    rv = client.post('/api/upload-dataset/bulk', data={'files': (io.BytesIO(b'not a zip'), 'bad.zip')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 400
+
+def test_bulk_no_files(client):
+    rv = client.post('/api/upload-dataset/bulk', data={}, content_type='multipart/form-data')
+    assert rv.status_code == 400
+
+def staged(tmp_path, content):
+    incoming = IncomingFile(str(tmp_path / 'partial'))
+    incoming.write(content)
+    return incoming
+
+def test_entries_are_stored_as_they_are_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module, 'INGEST_WORKERS', 0)
+    store = DatasetStore(root=str(tmp_path / 'uploads'))
+
+    def entries():
+        for i in range(3):
+            if i:
+                # The previous entry is already stored and out of staging
+                assert store.get(f'dir_f{i - 1}.npy') is not None
+                assert os.listdir(tmp_path / 'partial') == []
+            yield f'dir/f{i}.npy', staged(tmp_path, b'%d' % i)
+        yield '../', staged(tmp_path, b'x')
+    report = ingest_module.ingest(entries(), store, lambda name: True)
+    assert report['summary'] == {'ok': 3, 'invalid': 0, 'skipped': 1}
+    assert [(r['name'], r['member']) for r in report['results'][:2]] == [('dir_f0.npy', 'dir/f0.npy'),
+                                                                          ('dir_f1.npy', 'dir/f1.npy')]
+
+def test_staged_files_are_removed_when_storing_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module, 'INGEST_WORKERS', 0)
+    monkeypatch.setattr(ingest_module, 'MAX_PENDING_INGEST', 2)
+    store = DatasetStore(root=str(tmp_path / 'uploads'))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(store, 'add_file', fail)
+    with pytest.raises(OSError):
+        ingest_module.ingest(((f'f{i}.npy', staged(tmp_path, b'x')) for i in range(3)), store, lambda name: True)
+    assert os.listdir(tmp_path / 'partial') == []
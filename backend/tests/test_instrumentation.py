@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+from flask import Flask
+from backend.app import create_app
+from backend.instrumentation import Counter, Gauge, Histogram, Registry, TimedLock, init_app, lock_contended
+
+def test_render_prometheus_text():
+    registry = Registry(multiproc_dir=None)
+    hits = registry.register(Counter('hits_total', 'Hits', ('cache',)))
+    latency = registry.register(Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1)))
+    hits.inc(cache='a')
+    hits.inc(2, cache='a')
+    latency.observe(0.05, route='/x')
+    latency.observe(0.5, route='/x')
+    latency.observe(5, route='/x')
+    text = registry.render()
+    assert '# TYPE hits_total counter\nhits_total{cache="a"} 3\n' in text
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{route="/x",le="1"} 2\n' in text
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 3\n' in text
+    assert 'latency_seconds_sum{route="/x"} 5.55\n' in text
+    assert 'latency_seconds_count{route="/x"} 3\n' in text
+
+def test_workers_are_merged(tmp_path):
+    registry = Registry(multiproc_dir=str(tmp_path))
+    registry.register(Counter('hits_total', 'Hits')).inc(2)
+    registry.register(Gauge('in_flight', 'In flight')).inc(1)
+    # A worker that has exited: its counters still count, its gauges don't
+    exited = {
+        'hits_total': {'kind': 'counter', 'help': 'Hits', 'labels': [], 'buckets': [], 'samples': [[[], 5]]},
+        'in_flight': {'kind': 'gauge', 'help': 'In flight', 'labels': [], 'buckets': [], 'samples': [[[], 7]]},
+    }
+    (tmp_path / '999999999.json').write_text(json.dumps(exited))
+    text = registry.render()
+    assert 'hits_total 7\n' in text
+    assert 'in_flight 1\n' in text
+
+def test_snapshots_of_a_reused_pid_are_kept_apart(tmp_path):
+    # Two registries in one process stand in for a dead worker and a new one given its pid
+    old, new = Registry(multiproc_dir=str(tmp_path)), Registry(multiproc_dir=str(tmp_path))
+    old.register(Counter('hits_total', 'Hits')).inc(3)
+    old.flush()
+    new.register(Counter('hits_total', 'Hits')).inc(2)
+    assert old.owner != new.owner
+    assert old.owner.startswith(f'{os.getpid()}-')
+    assert 'hits_total 5\n' in new.render()
+
+def test_timed_lock_counts_contention():
+    lock = TimedLock('test_lock')
+    held = threading.Event()
+
+    def hold():
+        with lock:
+            held.set()
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+    with lock:
+        pass
+    thread.join()
+    assert [['test_lock'], 1] in lock_contended.samples()
+
+def test_metrics_endpoint_reports_requests():
+    app = create_app({'TESTING': True})
+    with app.test_client() as client:
+        client.get('/api/hello')
+        response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert 'deepbuilder_request_duration_seconds_count{method="GET",route="/api/hello",status="200"}' in text
+    assert 'deepbuilder_requests_in_flight{method="GET"} 1\n' in text
+    assert '# TYPE deepbuilder_lock_wait_seconds histogram' in text
+
+def test_profiler_collects_stacks():
+    app = Flask(__name__)
+    init_app(app, profiler=True)
+    done = threading.Event()
+    worker = threading.Thread(target=done.wait, args=(5,))
+    worker.start()
+    time.sleep(0.1)
+    with app.test_client() as client:
+        folded = client.get('/metrics/profile?reset=1').get_data(as_text=True)
+    done.set()
+    worker.join()
+    assert 'wait (threading.py' in folded
+    assert folded.strip().split('\n')[0].rsplit(' ', 1)[1].isdigit()
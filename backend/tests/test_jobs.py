@@ -0,0 +1,223 @@
+import json
+import time
+import pytest
+from backend.app import app
+from backend.jobs import JobManager, JobQueueFull, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, FINISHED_STATES
+
+def script_for(body):
+    return lambda config: "import json, sys, time\n" + body
+
+PROGRESS_SCRIPT = script_for(
+    "for epoch in range(1, 4):\n"
+    "    print('DEEPBUILDER_PROGRESS ' + json.dumps({'epoch': epoch, 'total_epochs': 3, 'loss': 1.0 / epoch}))\n"
+    "print('done')\n"
+)
+SLEEP_SCRIPT = script_for("time.sleep(30)\n")
+CHECKPOINT_SCRIPT = script_for(
+    "import os\n"
+    "os.makedirs('checkpoints', exist_ok=True)\n"
+    "open('checkpoints/last.pt', 'w').write('weights')\n"
+    "print('DEEPBUILDER_PROGRESS ' + json.dumps({'epoch': 1, 'total_epochs': 1, 'val_loss': 0.5}))\n"
+)
+
+def wait_for(job, states, timeout=20):
+    deadline = time.time() + timeout
+    while job.state not in states:
+        assert time.time() < deadline, f"job stuck in {job.state}"
+        time.sleep(0.02)
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(jobs_dir=str(tmp_path), max_concurrent=1, max_queued=2, script_generator=PROGRESS_SCRIPT)
+    yield manager
+    manager.shutdown()
+
+def test_job_reports_progress(manager, tmp_path):
+    job = manager.submit(1, {'model_type': 'CNN'})
+    wait_for(job, FINISHED_STATES)
+    info = job.to_dict()
+    assert info['state'] == SUCCEEDED
+    assert info['returncode'] == 0
+    assert info['progress'] == {'current_epoch': 3, 'total_epochs': 3, 'loss': pytest.approx(1 / 3)}
+    assert (tmp_path / job.id / 'train.log').read_text() == 'done\n'
+
+def test_failing_script_records_error(manager):
+    manager.script_generator = script_for("sys.exit('boom')\n")
+    job = manager.submit(1, {})
+    wait_for(job, FINISHED_STATES)
+    assert job.state == FAILED
+    assert job.returncode == 1
+    assert job.error == 'boom'
+
+def test_concurrency_limit_queue_and_cancel(manager):
+    manager.script_generator = SLEEP_SCRIPT
+    running = manager.submit(1, {})
+    wait_for(running, (RUNNING,))
+    queued = [manager.submit(1, {}), manager.submit(1, {})]
+    assert [job.state for job in queued] == [QUEUED, QUEUED]
+    with pytest.raises(JobQueueFull):
+        manager.submit(1, {})
+
+    assert manager.cancel(queued[0].id)
+    assert queued[0].state == CANCELLED
+    assert manager.cancel(running.id)
+    wait_for(running, FINISHED_STATES)
+    assert running.state == CANCELLED
+    # The freed slot goes to the remaining queued job, skipping the cancelled one
+    wait_for(queued[1], (RUNNING,))
+    assert queued[0].state == CANCELLED
+    manager.cancel(queued[1].id)
+    wait_for(queued[1], FINISHED_STATES)
+    assert not manager.cancel(queued[1].id)
+
+def test_result_cache_reuses_checkpointed_runs(manager, tmp_path):
+    manager.script_generator = CHECKPOINT_SCRIPT
+    config = {'model_type': 'CNN', 'hyperparameters': {}}
+    first = manager.submit(1, config)
+    wait_for(first, FINISHED_STATES)
+    assert first.cached_from is None
+
+    cached = manager.submit(2, {'model_type': 'CNN', 'hyperparameters': {}})
+    assert cached.state == SUCCEEDED
+    assert cached.cached_from == first.id
+    assert cached.future.done()
+    assert cached.progress['val_loss'] == 0.5
+    assert (tmp_path / cached.id / 'checkpoints' / 'last.pt').read_text() == 'weights'
+    assert manager.metrics.query(cached.id, 'val_loss', axis='epoch')['values'] == [0.5]
+
+    # Opting out, benchmarks and other data run again
+    manager.max_queued = 10
+    assert manager.submit(1, config, use_cache=False).cached_from is None
+    assert manager.submit(1, config, mode='benchmark').cached_from is None
+    manager.datasets = {'x.npy': {'sha256': 'a' * 64}, 'y.npy': {'sha256': 'b' * 64}}
+    assert manager.submit(1, dict(config, dataset={'images': 'x.npy', 'labels': 'y.npy'})).cached_from is None
+
+def test_runs_without_checkpoints_are_not_cached(manager):
+    first = manager.submit(1, {'model_type': 'CNN'})
+    wait_for(first, FINISHED_STATES)
+    assert manager.submit(1, {'model_type': 'CNN'}).cached_from is None
+
+def test_supervisor_failure_stops_the_script(manager, monkeypatch):
+    manager.script_generator = script_for(
+        "print('DEEPBUILDER_PROGRESS ' + json.dumps({'epoch': 1}))\n"
+        "time.sleep(30)\n"
+    )
+    processes = []
+
+    def broken_report(job, payload):
+        processes.append(job.process)
+        raise RuntimeError("listener broke")
+    monkeypatch.setattr(manager, '_report', broken_report)
+    job = manager.submit(1, {})
+    wait_for(job, FINISHED_STATES, timeout=10)
+    assert job.state == FAILED
+    assert job.error == 'listener broke'
+    assert processes[0].returncode is not None
+
+def test_finished_jobs_are_pruned(manager):
+    manager.retention = 2
+    jobs = []
+    for _ in range(3):
+        jobs.append(manager.submit(1, {}))
+        wait_for(jobs[-1], FINISHED_STATES)
+    assert manager.prune() == 1
+    assert manager.get(jobs[0].id) is None
+    assert manager.shared.get('job', jobs[0].id) is None
+    assert [job.id for job in manager.list()] == [job.id for job in jobs[1:]]
+    manager.retention_seconds = 0
+    assert manager.prune() == 2
+    assert manager.list() == []
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def model_config_store():
+    # The temporary store the conftest puts in place of the app's
+    from backend.model_config_store import model_config_store
+    return model_config_store
+
+def test_job_api(client, monkeypatch, model_config_store):
+    from backend.jobs import job_manager
+    monkeypatch.setattr(job_manager, 'script_generator', PROGRESS_SCRIPT)
+    config_id = model_config_store.add({'model_type': 'CNN', 'hyperparameters': {}})
+
+    response = client.post('/api/jobs', json={'config_id': config_id})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    wait_for(job_manager.get(job_id), FINISHED_STATES)
+
+    progress = client.get(f'/api/training_progress?job_id={job_id}').get_json()
+    assert progress['state'] == SUCCEEDED
+    assert progress['current_epoch'] == 3
+    assert progress['total_epochs'] == 3
+    assert client.get(f'/api/jobs/{job_id}').get_json()['config_id'] == config_id
+    assert job_id in [job['id'] for job in client.get('/api/jobs?state=succeeded').get_json()['items']]
+    assert client.post(f'/api/jobs/{job_id}/cancel').status_code == 409
+
+def test_benchmark_mode_passes_flag(client, monkeypatch, model_config_store):
+    from backend.jobs import job_manager
+    monkeypatch.setattr(job_manager, 'script_generator', script_for(
+        "print('DEEPBUILDER_PROGRESS ' + json.dumps({'argv': sys.argv[1:], 'samples_per_sec': 123.0}))\n"
+    ))
+    config_id = model_config_store.add({'model_type': 'CNN', 'hyperparameters': {}})
+    response = client.post('/api/jobs', json={'config_id': config_id, 'mode': 'benchmark'})
+    assert response.get_json()['mode'] == 'benchmark'
+    job = job_manager.get(response.get_json()['id'])
+    wait_for(job, FINISHED_STATES)
+    assert job.progress['argv'] == ['--benchmark-data']
+    assert job.progress['samples_per_sec'] == 123.0
+    assert client.post('/api/jobs', json={'config_id': config_id, 'mode': ['x']}).status_code == 400
+
+def test_job_api_errors(client, model_config_store):
+    assert client.post('/api/jobs', json={}).status_code == 400
+    assert client.post('/api/jobs', json={'config_id': 10 ** 9}).status_code == 404
+    config_id = model_config_store.add({'model_type': 'CNN', 'hyperparameters': {}})
+    assert client.post('/api/jobs', json={'config_id': config_id, 'cache': 'no'}).status_code == 400
+    assert client.get('/api/jobs/missing').status_code == 404
+    assert client.post('/api/jobs/missing/cancel').status_code == 404
+    assert client.get('/api/training_progress?job_id=missing').status_code == 404
+
+def test_job_event_stream(client, monkeypatch, model_config_store):
+    from backend.jobs import job_manager
+    monkeypatch.setattr(job_manager, 'script_generator', PROGRESS_SCRIPT)
+    config_id = model_config_store.add({'model_type': 'CNN', 'hyperparameters': {}})
+    job_id = client.post('/api/jobs', json={'config_id': config_id}).get_json()['id']
+
+    response = client.get(f'/api/jobs/{job_id}/events')
+    assert response.mimetype == 'text/event-stream'
+    messages = response.get_data(as_text=True).strip().split('\n\n')
+    events = [(m.split('\n')[1][len('event: '):], json.loads(m.split('\n')[2][len('data: '):])) for m in messages]
+    assert [data['current_epoch'] for kind, data in events if kind == 'progress'] == [1, 2, 3]
+    assert [data['state'] for kind, data in events if kind == 'state'] == [RUNNING, SUCCEEDED]
+
+    # Reconnecting after the second event only replays what came later
+    replay = client.get(f'/api/jobs/{job_id}/events', headers={'Last-Event-ID': '2'}).get_data(as_text=True)
+    assert replay.startswith('id: 3\n')
+    assert client.get('/api/jobs/missing/events').status_code == 404
+
+def test_job_metrics_api(client, monkeypatch, model_config_store):
+    from backend.jobs import job_manager
+    monkeypatch.setattr(job_manager, 'script_generator', script_for(
+        "for step in range(2000):\n"
+        "    print('DEEPBUILDER_PROGRESS ' + json.dumps({'step': step, 'loss': 1.0 / (step + 1)}))\n"
+        "print('DEEPBUILDER_PROGRESS ' + json.dumps({'epoch': 1, 'total_epochs': 1, 'val_loss': 0.25}))\n"
+    ))
+    config_id = model_config_store.add({'model_type': 'CNN', 'hyperparameters': {}})
+    job_id = client.post('/api/jobs', json={'config_id': config_id}).get_json()['id']
+    wait_for(job_manager.get(job_id), FINISHED_STATES)
+
+    assert client.get(f'/api/jobs/{job_id}/metrics').get_json() == {'step': ['loss'], 'epoch': ['val_loss']}
+    data = client.get(f'/api/jobs/{job_id}/metrics/loss?points=100&start=1000').get_json()
+    assert data['total'] == 1000
+    assert len(data['steps']) == 100
+    assert data['steps'][0] == 1000 and data['steps'][-1] == 1999
+    epoch = client.get(f'/api/jobs/{job_id}/metrics/val_loss?axis=epoch').get_json()
+    assert epoch['steps'] == [1] and epoch['values'] == [0.25]
+    assert client.get(f'/api/jobs/{job_id}/metrics/loss?method=mean').status_code == 400
+    assert client.get(f'/api/jobs/{job_id}/metrics/loss?points=x').status_code == 400
+    assert client.get(f'/api/jobs/{job_id}/metrics/nope').status_code == 404
+    assert client.get('/api/jobs/missing/metrics').status_code == 404
@@ -0,0 +1,85 @@
+import threading
+import pytest
+from flask import Flask
+from backend.app import create_app
+from backend.jobs import JobManager, JobsDraining, RUNNING, CANCELLED, FINISHED_STATES
+from backend.events import StreamLimit
+from backend.lifecycle import Lifecycle
+from backend.tests.test_jobs import SLEEP_SCRIPT, wait_for
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(jobs_dir=str(tmp_path), max_concurrent=1, script_generator=SLEEP_SCRIPT)
+    yield manager
+    manager.shutdown()
+
+def test_create_app_registers_routes():
+    app = create_app({'TESTING': True})
+    assert isinstance(app, Flask)
+    assert app.config['TESTING']
+    with app.test_client() as client:
+        assert client.get('/api/hello').status_code == 200
+
+def test_drain_refuses_writes_and_waits_for_requests(manager):
+    lifecycle = Lifecycle(manager)
+    app = Flask(__name__)
+    lifecycle.init_app(app)
+    entered, release = threading.Event(), threading.Event()
+
+    @app.post('/api/jobs')
+    def slow_write():
+        entered.set()
+        release.wait(10)
+        return {}, 201
+
+    @app.get('/api/jobs')
+    def read():
+        return {}
+
+    client = app.test_client()
+    writer = threading.Thread(target=client.post, args=('/api/jobs',))
+    writer.start()
+    entered.wait(10)
+    assert lifecycle.active_requests == 1
+
+    drained = []
+    drainer = threading.Thread(target=lambda: drained.append(lifecycle.drain(10)))
+    drainer.start()
+    while not lifecycle.draining:
+        pass
+    response = client.post('/api/jobs')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert client.get('/api/jobs').status_code == 200
+    assert drainer.is_alive()
+    release.set()
+    writer.join()
+    drainer.join()
+    assert drained == [True]
+
+def test_drain_cancels_jobs_that_outlive_the_timeout(manager):
+    running = manager.submit(1, {})
+    wait_for(running, (RUNNING,))
+    queued = manager.submit(1, {})
+    assert not Lifecycle(manager).drain(0.2)
+    assert queued.state == CANCELLED
+    wait_for(running, FINISHED_STATES)
+    assert running.state == CANCELLED
+    with pytest.raises(JobsDraining):
+        manager.submit(1, {})
+
+def test_drain_ends_streams_and_runs_once(manager):
+    running = manager.submit(1, {})
+    wait_for(running, (RUNNING,))
+    streams = StreamLimit()
+    lifecycle = Lifecycle(manager, streams)
+    stream = streams.open(lambda stop: running.events.subscribe(stop=stop))
+    assert b'event: state' in next(stream)
+    done = threading.Event()
+    lifecycle.drain_in_background(0.2, then=done.set)
+    # The stream ends instead of holding its thread until the worker is killed
+    list(stream)
+    assert done.wait(10)
+    assert streams.open(lambda stop: running.events.subscribe(stop=stop)) is None
+    # Later calls (e.g. gunicorn's worker_exit) return the first drain's result
+    assert lifecycle.drain(10) is False
@@ -0,0 +1,51 @@
+import math
+import numpy as np
+from backend import metrics_store
+from backend.metrics_store import MetricsStore, lttb, minmax
+
+def test_record_query_and_reopen(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_store, 'METRICS_CHUNK_POINTS', 100)
+    store = MetricsStore(str(tmp_path))
+    for step in range(250):
+        store.record('run1', 'step', step, {'loss': 1.0 / (step + 1), 'note': 'text', 'bad/name': 1.0})
+    store.record('run1', 'epoch', 1, {'val_loss': 0.5, 'flag': True})
+    # Steps that go backwards are dropped
+    store.record('run1', 'step', 10, {'loss': 99.0})
+
+    assert store.list('run1') == {'step': ['loss'], 'epoch': ['val_loss']}
+    result = store.query('run1', 'loss', start=10, end=19, points=1000)
+    assert result['total'] == 10
+    assert result['steps'] == list(range(10, 20))
+    assert result['values'][0] == np.float32(1.0 / 11)
+
+    store.close_run('run1')
+    reopened = MetricsStore(str(tmp_path))
+    assert reopened.query('run1', 'loss')['total'] == 250
+    assert reopened.query('run1', 'val_loss', axis='epoch')['values'] == [0.5]
+    assert reopened.query('run1', 'missing') is None
+    assert reopened.query('..', 'loss') is None
+    assert reopened.list('other') is None
+
+def test_downsampling_keeps_extremes(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    steps = np.arange(100000)
+    values = np.sin(steps / 1000.0)
+    values[54321] = 50.0
+    values[777] = float('nan')
+    for step, value in zip(steps.tolist(), values.tolist()):
+        store.record('run', 'step', step, {'loss': value})
+
+    for method in ('lttb', 'minmax'):
+        result = store.query('run', 'loss', points=500, method=method)
+        assert result['total'] == 100000
+        assert len(result['steps']) <= 500
+        assert result['steps'] == sorted(result['steps'])
+        assert 54321 in result['steps']
+        assert result['steps'][0] == 0
+        assert all(v is None or math.isfinite(v) for v in result['values'])
+
+def test_lttb_and_minmax_short_series():
+    assert lttb(np.arange(5), np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+    assert minmax(np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+    index = lttb(np.arange(10), np.array([0, 0, 0, 9, 0, 0, 0, 0, 0, 0.0]), 4)
+    assert index[0] == 0 and index[-1] == 9 and 3 in index
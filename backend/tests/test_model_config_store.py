@@ -2,7 +2,8 @@ import unittest
 import os
 import tempfile
 import json
-from backend.model_config_store import ModelConfigStore
+from backend.model_config_store import ModelConfigStore, JsonLinesEngine
+from backend.script_generator import config_key
 
 class TestModelConfigStore(unittest.TestCase):
     def setUp(self):
@@ -11,10 +12,12 @@ class TestModelConfigStore(unittest.TestCase):
         self.store = ModelConfigStore(file_path=self.temp_file.name)
 
     def tearDown(self):
-        try:
-            os.unlink(self.temp_file.name)
-        except Exception:
-            pass
+        self.store.close()
+        for path in (self.temp_file.name, *(self.temp_file.name + suffix for suffix in (".idx", ".lock", ".keys"))):
+            try:
+                os.unlink(path)
+            except Exception:
+                pass
 
     def test_add_and_get_all(self):
         config1 = {"model_type": "A", "hyperparameters": {"lr": 0.1}}
@@ -51,5 +54,199 @@ class TestModelConfigStore(unittest.TestCase):
         self.store.load_from_file()
         self.assertEqual(self.store.get_all(), [])
 
+    def test_add_returns_stable_ids(self):
+        first = self.store.add({"model_type": "A", "hyperparameters": {}})
+        second = self.store.add({"model_type": "B", "hyperparameters": {}})
+        self.assertEqual((first, second), (1, 2))
+        self.assertEqual(self.store.get(2)["model_type"], "B")
+        self.assertIsNone(self.store.get(3))
+
+    def test_reopen_uses_index(self):
+        for i in range(5):
+            self.store.add({"model_type": "A", "hyperparameters": {"i": i}})
+        new_store = ModelConfigStore(file_path=self.temp_file.name)
+        new_store.load_from_file()
+        self.assertEqual(new_store.get(4)["hyperparameters"], {"i": 3})
+        self.assertEqual(new_store.add({"model_type": "B"}), 6)
+
+    def test_recovers_records_missing_from_index(self):
+        self.store.add({"model_type": "A"})
+        self.store.close()
+        # Simulate a crash between the log append and the index update.
+        with open(self.temp_file.name, "a") as f:
+            f.write(json.dumps({"id": 2, "config": {"model_type": "B"}}) + "\n")
+        new_store = ModelConfigStore(file_path=self.temp_file.name)
+        new_store.load_from_file()
+        self.assertEqual(new_store.get(2), {"model_type": "B"})
+        self.assertEqual(new_store.add({"model_type": "C"}), 3)
+
+    def test_converts_legacy_json_array(self):
+        legacy = [{"model_type": "A"}, {"model_type": "B"}]
+        with open(self.temp_file.name, "w") as f:
+            json.dump(legacy, f, indent=2)
+        self.store.load_from_file()
+        self.assertEqual(self.store.get_all(), legacy)
+        self.assertEqual(self.store.add({"model_type": "C"}), 3)
+
+    def test_delete_and_compact_keep_ids(self):
+        engine = JsonLinesEngine(self.temp_file.name, compact_min_garbage=2)
+        store = ModelConfigStore(engine=engine)
+        for name in "ABC":
+            store.add({"model_type": name})
+        self.assertTrue(store.delete(1))
+        self.assertFalse(store.delete(1))
+        self.assertEqual(store.get_all(), [{"model_type": "B"}, {"model_type": "C"}])
+        self.assertEqual(store.get(3), {"model_type": "C"})
+        # Deleting triggered compaction; IDs are never reused.
+        self.assertEqual(store.add({"model_type": "D"}), 4)
+        reopened = ModelConfigStore(file_path=self.temp_file.name)
+        self.assertEqual(reopened.count(), 3)
+
+    def test_query_filters_and_paginates(self):
+        for i in range(6):
+            self.store.add({
+                "model_type": "UNet" if i % 2 else "CNN",
+                "hyperparameters": {"optimizer": "Adam" if i < 3 else "SGD"},
+            })
+        items, cursor = self.store.query(limit=4)
+        self.assertEqual([config_id for config_id, _ in items], [1, 2, 3, 4])
+        self.assertEqual(cursor, 4)
+        items, cursor = self.store.query(cursor=cursor, limit=4)
+        self.assertEqual([config_id for config_id, _ in items], [5, 6])
+        self.assertIsNone(cursor)
+        items, _ = self.store.query(model_type="UNet", optimizer="SGD")
+        self.assertEqual([config_id for config_id, _ in items], [4, 6])
+        # Configs added after the index is built are indexed too.
+        self.store.add({"model_type": "UNet", "hyperparameters": {"optimizer": "SGD"}})
+        items, _ = self.store.query(model_type="UNet", optimizer="SGD", cursor=4)
+        self.assertEqual([config_id for config_id, _ in items], [6, 7])
+        with self.assertRaises(ValueError):
+            self.store.query(batch_size=32)
+
+    def test_add_many(self):
+        self.store.add({"model_type": "A"})
+        ids = self.store.add_many([{"model_type": "B"}, {"model_type": "C"}])
+        self.assertEqual(ids, [2, 3])
+        reopened = ModelConfigStore(file_path=self.temp_file.name)
+        self.assertEqual(reopened.get(3), {"model_type": "C"})
+        reopened.close()
+
+    def test_dedupe_key_returns_existing_ids(self):
+        self.store.add({"model_type": "A", "hyperparameters": {"lr": 0.1}})
+        self.store.add({"model_type": "A", "hyperparameters": {"lr": 0.1}})
+        store = ModelConfigStore(file_path=self.temp_file.name, dedupe_key=config_key)
+        try:
+            # Duplicates stored before deduplication map to the first copy
+            self.assertEqual(store.add_or_get({"hyperparameters": {"learning_rate": 0.1}, "model_type": "A"}), (1, False))
+            self.assertEqual(store.add_or_get({"model_type": "B", "hyperparameters": {}}), (3, True))
+            self.assertEqual(store.add_many([{"model_type": "C"}, {"model_type": "B", "hyperparameters": {}}, {"model_type": "C"}]), [4, 3, 4])
+            self.assertEqual(store.count(), 4)
+            self.assertTrue(store.delete(3))
+            self.assertEqual(store.add({"model_type": "B", "hyperparameters": {}}), 5)
+        finally:
+            store.close()
+
+    def test_add_or_get_many_writes_once(self):
+        store = ModelConfigStore(file_path=self.temp_file.name, dedupe_key=config_key)
+        try:
+            store.add({"model_type": "A"})
+            size = os.path.getsize(self.temp_file.name)
+            writes = []
+            original = store._engine.append_many
+            store._engine.append_many = lambda configs: writes.append(len(configs)) or original(configs)
+            results = store.add_or_get_many([{"model_type": "B"}, {"model_type": "A"}, {"model_type": "C"}, {"model_type": "B"}])
+            self.assertEqual(results, [(2, True), (1, False), (3, True), (2, False)])
+            self.assertEqual(writes, [2])
+            self.assertGreater(os.path.getsize(self.temp_file.name), size)
+        finally:
+            store.close()
+
+    def test_dedupe_keys_load_from_snapshot(self):
+        store = ModelConfigStore(file_path=self.temp_file.name, dedupe_key=config_key)
+        store.add_many([{"model_type": "A", "hyperparameters": {"seed": i}} for i in range(20)])
+        store.close()
+        self.assertTrue(os.path.exists(self.temp_file.name + ".keys"))
+        self.store.add({"model_type": "A", "hyperparameters": {"seed": 20}})
+
+        keyed = []
+        def counting_key(config):
+            keyed.append(config)
+            return config_key(config)
+        reopened = ModelConfigStore(file_path=self.temp_file.name, dedupe_key=counting_key)
+        try:
+            self.assertEqual(reopened.add_or_get({"model_type": "A", "hyperparameters": {"seed": 3}}), (4, False))
+            # The snapshot's sample, the config added after it, the new config and its stored match
+            self.assertEqual(len(keyed), 4)
+            self.assertEqual(reopened.add_or_get({"model_type": "A", "hyperparameters": {"seed": 20}}), (21, False))
+        finally:
+            reopened.close()
+
+        # A snapshot made with another key function is not used
+        other = ModelConfigStore(file_path=self.temp_file.name, dedupe_key=lambda config: json.dumps(config, sort_keys=True))
+        try:
+            self.assertEqual(other.add_or_get({"model_type": "A", "hyperparameters": {"seed": 5}}), (6, False))
+        finally:
+            other.close()
+
+    def test_stores_sharing_a_log_see_each_others_writes(self):
+        # As with server worker processes, each store has its own offsets and handles
+        other = ModelConfigStore(file_path=self.temp_file.name)
+        try:
+            self.assertEqual(self.store.add({"model_type": "A"}), 1)
+            self.assertEqual(other.add({"model_type": "B"}), 2)
+            self.assertEqual(self.store.get(2), {"model_type": "B"})
+            self.assertEqual(self.store.query(model_type="B")[0], [(2, {"model_type": "B"})])
+            other.add({"model_type": "B"})
+            self.assertEqual([i for i, _ in self.store.query(model_type="B")[0]], [2, 3])
+            self.assertTrue(self.store.delete(2))
+            self.assertIsNone(other.get(2))
+            self.store.compact()
+            self.assertEqual(other.add({"model_type": "C"}), 4)
+            self.assertEqual(self.store.count(), 3)
+            self.assertEqual(other.get(3), {"model_type": "B"})
+        finally:
+            other.close()
+
+    def test_concurrent_stores_add_each_config_once(self):
+        import threading
+        # Separate lock handles contend like separate worker processes
+        stores = [ModelConfigStore(file_path=self.temp_file.name, dedupe_key=config_key) for _ in range(2)]
+        configs = [{"model_type": "CNN", "hyperparameters": {"seed": i}} for i in range(100)]
+        ids = [[], []]
+        barrier = threading.Barrier(2)
+
+        def add_all(i):
+            barrier.wait()
+            ids[i].extend(stores[i].add(config) for config in configs)
+        threads = [threading.Thread(target=add_all, args=(i,)) for i in range(2)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(ids[0], ids[1])
+            self.assertEqual(stores[0].count(), len(configs))
+        finally:
+            for store in stores:
+                store.close()
+
+    def test_sqlite_engine(self):
+        db_path = self.temp_file.name + ".sqlite3"
+        store = ModelConfigStore(file_path=db_path, engine="sqlite")
+        try:
+            self.assertEqual(store.add({"model_type": "A", "hyperparameters": {}}), 1)
+            self.assertEqual(store.add({"model_type": "B", "hyperparameters": {}}), 2)
+            self.assertEqual(store.get(2)["model_type"], "B")
+            self.assertEqual(len(store.get_all()), 2)
+            items, cursor = store.query(model_type="B")
+            self.assertEqual(items, [(2, {"model_type": "B", "hyperparameters": {}})])
+            self.assertIsNone(cursor)
+            self.assertTrue(store.delete(2))
+            self.assertEqual(store.add({"model_type": "C"}), 3)
+            self.assertEqual(store.add_many([{"model_type": "D"}, {"model_type": "E"}]), [4, 5])
+        finally:
+            store.close()
+            os.unlink(db_path)
+
 if __name__ == "__main__":
     unittest.main()
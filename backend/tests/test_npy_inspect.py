@@ -0,0 +1,123 @@
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+from backend.app import app, UPLOAD_FOLDER
+from backend.npy_inspect import channel_stats, cached_inspect, inspect_npy, InspectError
+
+class TestNpyInspect(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        rng = np.random.default_rng(0)
+        self.array = rng.normal(size=(20, 3, 16, 16)).astype(np.float32)
+        np.save(self.path, self.array)
+
+    def tearDown(self):
+        for path in (self.path, self.path + '.inspect.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_blockwise_stats_match_numpy(self):
+        array = np.load(self.path, mmap_mode='r')
+        # Tiny blocks force many merge steps
+        stats = channel_stats(array, channel_axis=1, block_bytes=4096)
+        expected = np.moveaxis(self.array.astype(np.float64), 1, -1).reshape(-1, 3)
+        np.testing.assert_allclose(stats['mean'], expected.mean(axis=0))
+        np.testing.assert_allclose(stats['std'], expected.std(axis=0))
+        np.testing.assert_allclose(stats['min'], expected.min(axis=0))
+        np.testing.assert_allclose(stats['max'], expected.max(axis=0))
+
+    def test_blocks_stay_within_budget_for_single_row_volumes(self):
+        from unittest import mock
+        from backend import npy_inspect
+        array = np.arange(2 * 8 * 8 * 6, dtype=np.float32).reshape(1, 2, 8, 48)
+        sizes = []
+        asarray = np.asarray
+        def record(value, *args, **kwargs):
+            result = asarray(value, *args, **kwargs)
+            sizes.append(result.nbytes)
+            return result
+        with mock.patch.object(npy_inspect.np, 'asarray', side_effect=record):
+            stats = channel_stats(array, block_bytes=1024)
+        self.assertLessEqual(max(sizes), 1024)
+        self.assertEqual(stats['min'], [0.0])
+        np.testing.assert_allclose(stats['mean'], [array.astype(np.float64).mean()])
+
+    def test_non_finite_values_are_null(self):
+        import json
+        np.save(self.path, np.array([[1.0, np.nan], [np.inf, 2.0]]))
+        result = inspect_npy(self.path, channel_axis=1)
+        self.assertEqual(result['stats']['min'], [1.0, None])
+        self.assertEqual(result['preview']['data'], [[1.0, None], [None, 2.0]])
+        json.loads(json.dumps(result, allow_nan=False))
+
+    def test_preview_is_downsampled(self):
+        result = inspect_npy(self.path, slice_axis=0, slice_index=5, preview_size=8)
+        self.assertEqual(result['shape'], [20, 3, 16, 16])
+        self.assertEqual(result['dtype'], 'float32')
+        self.assertEqual(result['preview']['shape'], [8, 8])
+        expected = self.array[5, 1, ::2, ::2]
+        np.testing.assert_allclose(result['preview']['data'], expected, rtol=1e-6)
+        self.assertEqual(len(result['stats']['mean']), 1)
+
+    def test_cache_is_invalidated_when_file_changes(self):
+        first = cached_inspect(self.path, channel_axis=None)
+        self.assertTrue(os.path.exists(self.path + '.inspect.json'))
+        self.assertEqual(cached_inspect(self.path, channel_axis=None), first)
+        np.save(self.path, np.ones((4, 4), dtype=np.uint8))
+        os.utime(self.path, ns=(0, 0))
+        second = cached_inspect(self.path, channel_axis=None)
+        self.assertEqual(second['shape'], [4, 4])
+        self.assertEqual(second['stats']['mean'], [1.0])
+
+    def test_stats_are_cached_per_channel_axis(self):
+        import json
+        from unittest import mock
+        from backend import npy_inspect
+        expected = [inspect_npy(self.path, slice_index=index, preview_size=8 + index) for index in range(5)]
+        with mock.patch.object(npy_inspect, 'channel_stats', wraps=npy_inspect.channel_stats) as stats:
+            for index in range(5):
+                result = cached_inspect(self.path, slice_index=index, preview_size=8 + index)
+                self.assertEqual(result, expected[index])
+            cached_inspect(self.path, channel_axis=1)
+            cached_inspect(self.path, channel_axis=-3)
+            self.assertEqual(stats.call_count, 2)
+        with open(self.path + '.inspect.json') as f:
+            self.assertEqual(sorted(json.load(f)['stats']), ['1', 'None'])
+        directory = os.path.dirname(self.path)
+        self.assertFalse([name for name in os.listdir(directory)
+                          if name.startswith(os.path.basename(self.path)) and name.endswith('.tmp')])
+
+    def test_invalid_file_and_axis(self):
+        with self.assertRaises(InspectError):
+            inspect_npy(self.path, channel_axis=7)
+        with open(self.path, 'wb') as f:
+            f.write(b'data')
+        with self.assertRaises(InspectError):
+            inspect_npy(self.path)
+
+class TestInspectEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_inspect_uploaded_array(self):
+        buffer = io.BytesIO()
+        np.save(buffer, np.arange(24, dtype=np.int16).reshape(2, 3, 4))
+        buffer.seek(0)
+        rv = self.client.post('/api/upload-dataset', data={'file': (buffer, 'inspect_me.npy')},
+                              content_type='multipart/form-data')
+        self.assertEqual(rv.status_code, 200)
+        rv = self.client.get('/api/datasets/inspect_me.npy/inspect?channel_axis=0')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json['shape'], [2, 3, 4])
+        self.assertEqual(rv.json['stats']['min'], [0.0, 12.0])
+        self.assertEqual(rv.json['stats']['max'], [11.0, 23.0])
+        os.remove(os.path.join(UPLOAD_FOLDER, 'inspect_me.npy'))
+
+    def test_inspect_unknown_dataset(self):
+        self.assertEqual(self.client.get('/api/datasets/nope.npy/inspect').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from backend.dataset_store import DatasetStore
+from backend.jobs import JobManager, SUCCEEDED, FAILED, CANCELLED, RUNNING, FINISHED_STATES
+from backend.preprocessing import (
+    PreprocessCache, PreprocessCancelled, PreprocessError, Preprocessor, fit, labels_path, preprocess_params,
+    resize, resize_nearest, validate_dataset,
+)
+from backend.tests.test_dicom_metadata import make_dicom
+from backend.tests.test_jobs import script_for, wait_for
+
+SERIES_UID = '1.2.826.0.1.3680043.99.42'
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(root=str(tmp_path / 'uploads'))
+
+@pytest.fixture
+def preprocessor(store, tmp_path):
+    return Preprocessor(store, PreprocessCache(str(tmp_path / 'cache'), budget=10 ** 9))
+
+def add(store, tmp_path, name, content, metadata=None):
+    path = tmp_path / 'incoming.part'
+    path.write_bytes(content)
+    return store.add_file(str(path), name, len(content), hashlib.sha256(content).hexdigest(), metadata)
+
+def add_slice(store, tmp_path, name, instance_number, value, slope=1, intercept=0):
+    path = str(tmp_path / 'slice.dcm')
+    ds = make_dicom(path, series_uid=SERIES_UID, instance_number=instance_number)
+    ds.PixelData = np.full((4, 4), value, dtype=np.uint16).tobytes()
+    ds.RescaleSlope, ds.RescaleIntercept = slope, intercept
+    ds.save_as(path, enforce_file_format=True)
+    with open(path, 'rb') as f:
+        content = f.read()
+    metadata = {'series_instance_uid': SERIES_UID, 'instance_number': instance_number}
+    return add(store, tmp_path, name, content, metadata)
+
+def add_npy(store, tmp_path, name, array):
+    path = tmp_path / 'array.npy'
+    np.save(path, array)
+    return add(store, tmp_path, name, path.read_bytes())
+
+def config(images, labels='labels.npy', **preprocess):
+    return {'dataset': {'images': images, 'labels': labels, 'preprocess': preprocess}}
+
+def test_params_are_validated_and_canonical():
+    assert preprocess_params({'size': [64, 64.0], 'spacing': [1, 1]}) == {
+        'size': [64, 64], 'spacing': [1.0, 1.0], 'normalize': 'zscore',
+    }
+    for spec in ({'size': [0, 4]}, {'size': [1.5, 4]}, {'spacing': [1, -1]}, {'clip': [5, 1]},
+                 {'normalize': 'l2'}, {'rotate': 90}, {'spacing': 'fine'}, []):
+        with pytest.raises(PreprocessError):
+            preprocess_params(spec)
+    assert validate_dataset({'dataset': {'images': 'a.npy'}}) == []
+    assert validate_dataset(config('a.npy', size=[2, 2])) == []
+    assert len(validate_dataset({'dataset': {'images': 5, 'preprocess': {'clip': [1]}}})) == 3
+
+def test_resize_and_fit():
+    image = np.arange(4, dtype=np.float32).reshape(1, 2, 2)
+    up = resize(image, 4, 4)
+    assert up.shape == (1, 4, 4)
+    assert up[0, 0, 0] == 0 and up[0, -1, -1] == 3
+    assert up.mean() == pytest.approx(image.mean())
+    assert resize(up, 2, 2).mean() == pytest.approx(image.mean())
+    padded = fit(image, 4, 4, fill=-1)
+    assert np.array_equal(padded[0, 1:3, 1:3], image[0])
+    assert (padded == -1).sum() == 12
+    assert np.array_equal(fit(padded, 2, 2, fill=0), image)
+
+def test_nearest_resize_keeps_label_values():
+    mask = np.array([[[0, 1], [2, 3]]])
+    assert resize_nearest(mask, 4, 4).tolist() == [[[0, 0, 1, 1], [0, 0, 1, 1], [2, 2, 3, 3], [2, 2, 3, 3]]]
+    assert resize_nearest(resize_nearest(mask, 4, 4), 2, 2).tolist() == mask.tolist()
+
+def test_segmentation_masks_follow_their_images(store, tmp_path, preprocessor):
+    add_npy(store, tmp_path, 'images.npy', np.ones((3, 4, 4), dtype=np.float32))
+    masks = np.zeros((3, 4, 4), dtype=np.uint8)
+    masks[:, :2, :2] = 2
+    add_npy(store, tmp_path, 'masks.npy', masks)
+    unet = dict(config('images.npy', 'masks.npy', spacing=[2, 2], size=[4, 4], normalize='none'), model_type='UNet')
+    path = preprocessor.prepare(unet)
+    images, labels = np.load(path), np.load(labels_path(path))
+    assert images.shape == (3, 1, 4, 4)
+    assert labels.dtype == np.int64 and labels.shape == (3, 4, 4)
+    # Halved to 2 x 2 (nearest), then padded with background to 4 x 4
+    assert labels[0].tolist() == [[0, 0, 0, 0], [0, 2, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+    # Classification labels are left alone, and masks are part of the key
+    cnn = dict(unet, model_type='CNN')
+    assert not os.path.exists(labels_path(preprocessor.prepare(cnn)))
+    assert preprocessor.key(cnn) != preprocessor.key(unet)
+
+    add_npy(store, tmp_path, 'few.npy', masks[:2])
+    with pytest.raises(PreprocessError, match='expected 3 masks'):
+        preprocessor.prepare(dict(unet, dataset=dict(unet['dataset'], labels='few.npy')))
+
+def test_cancelled_build_leaves_no_entry(store, tmp_path, preprocessor):
+    add_npy(store, tmp_path, 'images.npy', np.ones((3, 4, 4), dtype=np.float32))
+    with pytest.raises(PreprocessCancelled):
+        preprocessor.prepare(config('images.npy'), cancelled=lambda: True)
+    assert preprocessor.cache.entries() == []
+
+def test_series_is_decoded_resampled_and_ordered(store, tmp_path, preprocessor):
+    add_slice(store, tmp_path, 'b.dcm', 2, 20, slope=2, intercept=-10)
+    add_slice(store, tmp_path, 'a.dcm', 3, 30)
+    add_slice(store, tmp_path, 'c.dcm', 1, 10)
+    # 0.5 x 0.75 mm pixels resampled to 1 x 1.5 mm halve both sides
+    path = preprocessor.prepare(config(f'series:{SERIES_UID}', spacing=[1, 1.5], normalize='none'))
+    images = np.load(path)
+    assert images.dtype == np.float32
+    assert images.shape == (3, 1, 2, 2)
+    assert images[:, 0, 0, 0].tolist() == [10, 30, 30]
+
+    clipped = np.load(preprocessor.prepare(config(
+        f'series:{SERIES_UID}', spacing=[1, 1.5], size=[4, 4], clip=[0, 20], normalize='none',
+    )))
+    assert clipped.shape == (3, 1, 4, 4)
+    assert clipped.max() == 20
+
+def test_zscore_uses_dataset_statistics(store, tmp_path, preprocessor):
+    data = np.random.default_rng(0).normal(5, 3, size=(10, 8, 8)).astype(np.float32)
+    add_npy(store, tmp_path, 'images.npy', data)
+    images = np.load(preprocessor.prepare(config('images.npy')))
+    assert images.shape == (10, 1, 8, 8)
+    assert images.mean() == pytest.approx(0, abs=1e-5)
+    assert images.std() == pytest.approx(1, abs=1e-4)
+    minmax = np.load(preprocessor.prepare(config('images.npy', normalize='minmax')))
+    assert minmax.min() == 0 and minmax.max() == pytest.approx(1)
+
+def test_cache_hits_and_keys(store, tmp_path, preprocessor):
+    add_npy(store, tmp_path, 'images.npy', np.ones((2, 4, 4), dtype=np.float32))
+    add_npy(store, tmp_path, 'other.npy', np.ones((2, 4, 4), dtype=np.float32))
+    add_npy(store, tmp_path, 'changed.npy', np.zeros((2, 4, 4), dtype=np.float32))
+    first = preprocessor.prepare(config('images.npy'))
+    built_at = os.stat(first).st_mtime_ns
+    assert preprocessor.prepare(config('images.npy')) == first
+    assert os.stat(first).st_mtime_ns == built_at
+    # Keyed by content, so a renamed copy hits; other content or parameters miss
+    assert preprocessor.key(config('other.npy')) == preprocessor.key(config('images.npy'))
+    assert preprocessor.key(config('changed.npy')) != preprocessor.key(config('images.npy'))
+    assert preprocessor.key(config('images.npy', size=[2, 2])) != preprocessor.key(config('images.npy'))
+
+    def fail(path):
+        raise AssertionError("rebuilt a cached entry")
+    assert preprocessor.cache.get_or_build(preprocessor.key(config('images.npy')), fail) == first
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PreprocessCache(str(tmp_path / 'cache'), budget=3000)
+
+    def builder(path):
+        np.save(path, np.zeros(256, dtype=np.float32))
+        return {}
+    paths = [cache.get_or_build(key, builder) for key in ('a', 'b')]
+    os.utime(os.path.join(cache.root, 'a', 'meta.json'), (1, 1))
+    cache.get_or_build('c', builder)
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(paths[1])
+    assert sorted(key for _, _, key in cache.entries()) == ['b', 'c']
+
+def test_errors(store, tmp_path, preprocessor):
+    with pytest.raises(PreprocessError, match='not found'):
+        preprocessor.prepare(config('missing.npy'))
+    with pytest.raises(PreprocessError, match='No stored slices'):
+        preprocessor.prepare(config('series:9.9.9'))
+    add_npy(store, tmp_path, 'small.npy', np.ones((1, 2, 2), dtype=np.float32))
+    add_npy(store, tmp_path, 'large.npy', np.ones((1, 3, 3), dtype=np.float32))
+    with pytest.raises(PreprocessError, match='set preprocess.size'):
+        preprocessor.prepare(config(['small.npy', 'large.npy']))
+    assert preprocessor.prepare(config(['small.npy', 'large.npy'], size=[2, 2]))
+
+def test_jobs_receive_preprocessed_images(store, tmp_path, preprocessor):
+    add_npy(store, tmp_path, 'images.npy', np.ones((3, 4, 4), dtype=np.float32))
+    add_npy(store, tmp_path, 'labels.npy', np.zeros(3, dtype=np.int64))
+    script = script_for(
+        "import os, numpy\n"
+        "print(numpy.load(os.environ['DEEPBUILDER_PREPROCESSED_IMAGES']).shape)\n"
+    )
+    manager = JobManager(jobs_dir=str(tmp_path / 'jobs'), max_concurrent=1, script_generator=script,
+                         datasets=store, preprocessor=preprocessor)
+    try:
+        job = manager.submit(1, config('images.npy', size=[2, 2]))
+        wait_for(job, FINISHED_STATES)
+        assert job.state == SUCCEEDED
+        assert (tmp_path / 'jobs' / job.id / 'train.log').read_text() == '(3, 1, 2, 2)\n'
+        assert manager._result_key(config('images.npy', size=[2, 2])) != manager._result_key(config('images.npy'))
+
+        failed = manager.submit(1, config('missing.npy'))
+        wait_for(failed, FINISHED_STATES)
+        assert failed.state == FAILED
+        assert 'not found' in failed.error
+
+        add_npy(store, tmp_path, 'masks.npy', np.zeros((3, 4, 4), dtype=np.int64))
+        manager.script_generator = script_for(
+            "import os, numpy\n"
+            "print(numpy.load(os.environ['DEEPBUILDER_PREPROCESSED_LABELS']).shape)\n"
+        )
+        unet = manager.submit(1, dict(config('images.npy', 'masks.npy', size=[2, 2]), model_type='UNet'))
+        wait_for(unet, FINISHED_STATES)
+        assert unet.state == SUCCEEDED
+        assert (tmp_path / 'jobs' / unet.id / 'train.log').read_text() == '(3, 2, 2)\n'
+    finally:
+        manager.shutdown()
+
+def test_jobs_can_be_cancelled_while_preprocessing(store, tmp_path, preprocessor, monkeypatch):
+    building = threading.Event()
+
+    def slow_prepare(config, cancelled):
+        building.set()
+        while not cancelled():
+            time.sleep(0.01)
+        raise PreprocessCancelled("Preprocessing was cancelled")
+    monkeypatch.setattr(preprocessor, 'prepare', slow_prepare)
+    manager = JobManager(jobs_dir=str(tmp_path / 'jobs'), max_concurrent=1, script_generator=script_for(""),
+                         datasets=store, preprocessor=preprocessor)
+    try:
+        job = manager.submit(1, config('images.npy'))
+        assert building.wait(10)
+        assert job.state == RUNNING
+        assert manager.cancel(job.id)
+        wait_for(job, FINISHED_STATES)
+        assert job.state == CANCELLED
+    finally:
+        manager.shutdown()
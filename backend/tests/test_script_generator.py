@@ -1,5 +1,10 @@
+import ast
+import itertools
 import unittest
-from backend.script_generator import generate_pytorch_script
+from backend.parameter_options import MODEL_TYPES, LOSS_FUNCTIONS, OPTIMIZERS
+from backend.script_generator import (
+    generate_pytorch_script, generate_script_artifact, validate_hyperparameters, normalize_config, config_key, _render,
+)
 
 class TestScriptGenerator(unittest.TestCase):
     def test_basic_script_generation(self):
@@ -28,5 +33,111 @@ class TestScriptGenerator(unittest.TestCase):
         script = generate_pytorch_script(config)
         self.assertIsInstance(script, str)
 
+    def test_every_option_generates_valid_python(self):
+        for model_type, loss, optimizer in itertools.product(MODEL_TYPES, LOSS_FUNCTIONS, OPTIMIZERS):
+            script = generate_pytorch_script({
+                'model_type': model_type,
+                'hyperparameters': {'loss_function': loss, 'optimizer': optimizer},
+            })
+            ast.parse(script)
+            self.assertIn(f'# Model type: {model_type}', script)
+            self.assertNotIn('Unsupported', script)
+
+    def test_hyperparameters_are_coerced(self):
+        script = generate_pytorch_script({
+            'model_type': 'CNN',
+            'hyperparameters': {'learning_rate': '0.01', 'epochs': 'many', 'batch_size': -4, 'seed': 7},
+        })
+        self.assertIn('LEARNING_RATE = 0.01\n', script)
+        self.assertIn('EPOCHS = 10\n', script)
+        self.assertIn('BATCH_SIZE = 16\n', script)
+        self.assertIn('SEED = 7\n', script)
+
+    def test_untrusted_names_stay_out_of_code(self):
+        script = generate_pytorch_script({
+            'model_type': 'CNN\nimport shutil',
+            'hyperparameters': {'optimizer': 'Adam(); evil()'},
+            'dataset': {'images': '../secret.npy', 'labels': 'labels.npy'},
+        })
+        tree = ast.parse(script)
+        imported = [alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names]
+        self.assertNotIn('shutil', imported)
+        self.assertNotIn('torch.optim.Adam();', script)
+        self.assertIn('Unsupported optimizer', script)
+        self.assertIn('IMAGES = None', script)
+
+    def test_preprocessed_images_come_from_the_job(self):
+        script = generate_pytorch_script({
+            'model_type': 'CNN',
+            'dataset': {'images': 'series:1.2.3', 'labels': 'labels.npy', 'preprocess': {'size': [64, 64]}},
+        })
+        ast.parse(script)
+        self.assertIn('IMAGES = os.environ.get("DEEPBUILDER_PREPROCESSED_IMAGES")', script)
+        self.assertIn("LABELS = 'labels.npy'", script)
+        self.assertNotIn('series:1.2.3', script)
+        segmentation = generate_pytorch_script({
+            'model_type': 'UNet',
+            'dataset': {'images': 'images.npy', 'labels': 'masks.npy', 'preprocess': {'size': [64, 64]}},
+        })
+        ast.parse(segmentation)
+        self.assertIn('LABELS = os.environ.get("DEEPBUILDER_PREPROCESSED_LABELS", \'masks.npy\')', segmentation)
+
+    def test_throughput_options_are_emitted(self):
+        script = generate_pytorch_script({
+            'model_type': 'CNN',
+            'hyperparameters': {
+                'num_workers': 3, 'pin_memory': False, 'prefetch_factor': 4, 'dataset_cache': 'memory',
+                'cache_rate': 0.5, 'mixed_precision': True, 'gradient_accumulation_steps': 8,
+            },
+        })
+        for line in ('NUM_WORKERS = 3', 'PIN_MEMORY = False and', 'PREFETCH_FACTOR = 4', 'CACHE_RATE = 0.5',
+                     'MIXED_PRECISION = True', 'GRAD_ACCUM_STEPS = 8', 'from monai.data import CacheDataset'):
+            self.assertIn(line, script)
+        self.assertIn('--benchmark-data', script)
+        default = generate_pytorch_script({'model_type': 'CNN', 'hyperparameters': {'num_workers': -1}})
+        self.assertIn('NUM_WORKERS = min(4, os.cpu_count() or 1)', default)
+        self.assertIn('return ArrayDataset(images, labels)', default)
+
+    def test_every_dataset_cache_generates_valid_python(self):
+        for cache in ('none', 'memory', 'disk'):
+            ast.parse(generate_pytorch_script({'model_type': 'UNet', 'hyperparameters': {'dataset_cache': cache}}))
+
+    def test_validate_hyperparameters(self):
+        self.assertEqual(validate_hyperparameters({'epochs': 'anything', 'num_workers': 'auto', 'cache_rate': 1}), [])
+        errors = validate_hyperparameters({
+            'num_workers': -1, 'pin_memory': 'yes', 'prefetch_factor': 0, 'dataset_cache': 'ssd',
+            'cache_rate': 0, 'mixed_precision': 1, 'gradient_accumulation_steps': 2.5, 'persistent_workers': None,
+        })
+        self.assertEqual(len(errors), 8)
+        self.assertIn("dataset_cache must be one of none, memory, disk", errors)
+
+    def test_scripts_are_cached_by_canonical_config(self):
+        config = {'model_type': 'ResNet', 'hyperparameters': {'epochs': 3, 'lr': 0.1}}
+        reordered = {'hyperparameters': {'lr': 0.1, 'epochs': 3}, 'model_type': 'ResNet'}
+        script, etag = generate_script_artifact(config)
+        hits = _render.cache_info().hits
+        self.assertEqual(generate_script_artifact(reordered), (script, etag))
+        self.assertEqual(_render.cache_info().hits, hits + 1)
+        self.assertNotEqual(generate_script_artifact({**config, 'model_type': 'CNN'})[1], etag)
+
+    def test_normalize_config(self):
+        normalized = normalize_config({'model_type': 'CNN', 'hyperparameters': {'lr': 1, 'epochs': 5.0, 'cache_rate': 1}})
+        hyperparams = normalized['hyperparameters']
+        self.assertEqual(hyperparams['learning_rate'], 1.0)
+        self.assertIsInstance(hyperparams['learning_rate'], float)
+        self.assertIsInstance(hyperparams['epochs'], int)
+        self.assertIsInstance(hyperparams['cache_rate'], float)
+        self.assertEqual(hyperparams['batch_size'], 16)
+        self.assertEqual((hyperparams['optimizer'], hyperparams['num_workers']), ('Adam', 'auto'))
+        self.assertNotIn('lr', hyperparams)
+
+    def test_config_key(self):
+        key = config_key({'model_type': 'CNN', 'hyperparameters': {}})
+        self.assertEqual(config_key({'hyperparameters': {'epochs': 10, 'optimizer': 'Adam'}, 'model_type': 'CNN'}), key)
+        self.assertNotEqual(config_key({'model_type': 'CNN', 'hyperparameters': {'epochs': 11}}), key)
+        # Invalid values are not replaced by the defaults they would fall back to
+        self.assertNotEqual(config_key({'model_type': 'CNN', 'hyperparameters': {'epochs': -1}}), key)
+        self.assertNotEqual(config_key({'model_type': 'CNN', 'hyperparameters': {'epochs': 10.5}}), key)
+
 if __name__ == '__main__':
     unittest.main()
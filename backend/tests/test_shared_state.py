@@ -0,0 +1,86 @@
+import json
+import time
+import pytest
+from backend.jobs import JobManager, RemoteJob, RUNNING, SUCCEEDED, FAILED, CANCELLED, FINISHED_STATES
+from backend.shared_state import SharedState
+from backend.tests.test_jobs import PROGRESS_SCRIPT, SLEEP_SCRIPT, wait_for
+
+@pytest.fixture
+def workers(tmp_path):
+    # Two managers on one jobs directory stand in for two server worker processes
+    db = str(tmp_path / 'state.sqlite3')
+    workers = [
+        JobManager(jobs_dir=str(tmp_path), max_concurrent=1, script_generator=PROGRESS_SCRIPT,
+                   shared=SharedState(db, interval=0.05))
+        for _ in range(2)
+    ]
+    yield workers
+    for worker in workers:
+        worker.shutdown()
+
+def wait_for_remote(manager, job_id, states, timeout=20):
+    deadline = time.time() + timeout
+    while manager.get(job_id).state not in states:
+        assert time.time() < deadline, f"job stuck in {manager.get(job_id).state}"
+        time.sleep(0.02)
+
+def test_put_keeps_newest_version(tmp_path):
+    shared = SharedState(str(tmp_path / 'state.sqlite3'))
+    shared.put('job', 'a', 2, {'n': 2})
+    shared.put('job', 'a', 1, {'n': 1})
+    assert shared.get('job', 'a')['data'] == {'n': 2}
+    assert shared.get('job', 'b') is None
+    assert not shared.request('job', 'b', 'cancel')
+    shared.close()
+
+def test_jobs_are_visible_from_other_workers(workers):
+    owner, other = workers
+    job = owner.submit(1, {'model_type': 'CNN'})
+    wait_for(job, FINISHED_STATES)
+    wait_for_remote(other, job.id, FINISHED_STATES)
+
+    remote = other.get(job.id)
+    assert isinstance(remote, RemoteJob)
+    assert remote.to_dict()['state'] == SUCCEEDED
+    assert remote.to_dict()['progress']['current_epoch'] == 3
+    assert [j.id for j in other.list(state=SUCCEEDED)] == [job.id]
+    assert not other.cancel(job.id)
+
+    messages = b''.join(remote.events.subscribe()).decode().strip().split('\n\n')
+    assert [json.loads(m.split('\n')[2][len('data: '):]) for m in messages if 'event: state' in m][-1]['state'] == SUCCEEDED
+
+def test_cancel_is_forwarded_to_the_owner(workers):
+    owner, other = workers
+    owner.script_generator = SLEEP_SCRIPT
+    job = owner.submit(1, {})
+    wait_for(job, (RUNNING,))
+    assert other.cancel(job.id)
+    wait_for(job, FINISHED_STATES)
+    assert job.state == CANCELLED
+    wait_for_remote(other, job.id, FINISHED_STATES)
+
+def test_jobs_of_exited_workers_are_failed(tmp_path):
+    shared = SharedState(str(tmp_path / 'state.sqlite3'))
+    shared.owner = '999999999-dead'
+    shared.put('job', 'a', 1, {'id': 'a', 'state': RUNNING, 'progress': {}, 'created_at': 0})
+    record = shared.get('job', 'a')
+    assert RemoteJob(shared, record).to_dict()['state'] == FAILED
+    shared.close()
+
+def test_poller_starts_with_the_first_published_record(tmp_path):
+    shared = SharedState(str(tmp_path / 'state.sqlite3'))
+    shared.on_request('job', lambda record_id, action: None)
+    assert shared._thread is None
+    shared.put('job', 'a', 1, {})
+    assert shared._thread is not None
+    shared.close()
+
+def test_reused_pid_is_not_the_owner():
+    import os
+    from backend.shared_state import new_owner, owner_alive, process_started
+    owner = new_owner()
+    assert owner_alive(owner)
+    if process_started(os.getpid()) is None:
+        pytest.skip("process start times are not available here")
+    pid, started, token = owner.split('-')
+    assert not owner_alive(f"{pid}-{int(started) - 1}-{token}")
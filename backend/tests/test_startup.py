@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import backend.app
+from backend.app import create_app
+from backend.startup import StartupReport, startup_report, warm_up
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+def test_import_defers_heavy_modules(tmp_path):
+    code = (
+        "import json, sys\n"
+        "import backend.app\n"
+        "from backend import script_generator\n"
+        "print(json.dumps({'pydicom': 'pydicom' in sys.modules, 'requests': 'requests' in sys.modules,\n"
+        "                  'template': script_generator.load_template.cache_info().currsize}))\n"
+    )
+    env = dict(os.environ, STARTUP_MODE='lazy', UPLOAD_DIR=str(tmp_path / 'uploads'), JOBS_DIR=str(tmp_path / 'jobs'))
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    assert json.loads(output) == {'pydicom': False, 'requests': False, 'template': 0}
+
+def test_first_app_is_reported():
+    names = [name for name, _ in startup_report.phases]
+    assert names[:4] == ['import', 'static_assets', 'instrumentation', 'routes']
+    assert startup_report.finished
+    assert startup_report.as_dict()['total'] >= sum(seconds for _, seconds in startup_report.phases)
+    # Later apps (tests, wsgi) get their own report
+    app = create_app({'TESTING': True})
+    assert app.extensions['startup_report'] is not startup_report
+    with app.test_client() as client:
+        metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'deepbuilder_startup_seconds{phase="import"}' in metrics
+
+def test_eager_mode_warms_up(monkeypatch):
+    monkeypatch.setattr(backend.app, 'STARTUP_MODE', 'eager')
+    report = create_app({'TESTING': True}).extensions['startup_report']
+    assert [name for name, _ in report.phases if name.startswith('warm:')] == [
+        'warm:model_config_store', 'warm:dataset_store', 'warm:script_template', 'warm:pydicom', 'warm:requests',
+    ]
+    monkeypatch.setattr(backend.app, 'STARTUP_MODE', 'fast')
+    with pytest.raises(ValueError):
+        create_app()
+
+def test_report_format():
+    report = StartupReport()
+    warm_up([('nothing', lambda: None)], report)
+    with report.phase('step'):
+        pass
+    assert [name for name, _ in report.phases] == ['warm:nothing', 'step']
+    assert report.format().splitlines()[-1].startswith('total (')
@@ -0,0 +1,54 @@
+import gzip
+import pytest
+from backend.app import create_app
+from backend.static_assets import compress, IMMUTABLE_CACHE
+
+SCRIPT = b"console.log('deepbuilder');\n" * 200
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / 'static' / 'js').mkdir(parents=True)
+    (tmp_path / 'static' / 'js' / 'main.3f2a1b9c.js').write_bytes(SCRIPT)
+    (tmp_path / 'index.html').write_text('<div id="root"></div>')
+    (tmp_path / 'robots.txt').write_text('User-agent: *\n')
+    return tmp_path
+
+@pytest.fixture
+def client(build):
+    assert compress(str(build)) >= 1
+    app = create_app({'TESTING': True, 'STATIC_FOLDER': str(build)})
+    with app.test_client() as client:
+        yield client
+
+def test_hashed_assets_are_immutable_and_revalidate(client):
+    response = client.get('/static/js/main.3f2a1b9c.js')
+    assert response.status_code == 200
+    assert response.data == SCRIPT
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    etag = response.headers['ETag']
+    revalidated = client.get('/static/js/main.3f2a1b9c.js', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+def test_precompressed_variants_are_negotiated(client):
+    response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == SCRIPT
+    plain_etag = client.get('/static/js/main.3f2a1b9c.js').headers['ETag']
+    assert response.headers['ETag'] != plain_etag
+    assert client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip;q=0'}).data == SCRIPT
+
+def test_index_and_unhashed_files_must_revalidate(client):
+    for path in ('/', '/models/3', '/index.html'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.data == b'<div id="root"></div>'
+        assert response.headers['Cache-Control'] == 'no-cache'
+    etag = client.get('/').headers['ETag']
+    assert client.get('/models', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/robots.txt').headers['Cache-Control'] == 'no-cache'
+    assert client.get('/static/js/missing.js').status_code == 404
+    # Paths outside the build fall through to index.html
+    assert client.get('/../backend/app.py').data == b'<div id="root"></div>'
@@ -0,0 +1,151 @@
+import time
+import pytest
+from backend.app import app
+from backend.jobs import JobManager, SUCCEEDED, CANCELLED
+from backend.model_config_store import ModelConfigStore
+from backend.sweeps import SweepManager, SweepError, SuccessiveHalvingPruner, expand, COMPLETED, PRUNED, MAX_SWEEP_TRIALS
+
+BASE = {'model_type': 'CNN', 'hyperparameters': {'epochs': 3}}
+
+# Each trial reports a loss derived from its learning rate over three epochs
+LR_SCRIPT = lambda config: (
+    "import json\n"
+    f"lr = {config['hyperparameters']['learning_rate']!r}\n"
+    "for epoch in range(1, 4):\n"
+    "    print('DEEPBUILDER_PROGRESS ' + json.dumps({'epoch': epoch, 'total_epochs': 3, 'val_loss': lr / epoch}))\n"
+)
+
+def wait_for(sweep, timeout=30):
+    deadline = time.time() + timeout
+    while sweep.state != COMPLETED:
+        assert time.time() < deadline, f"sweep stuck: {sweep.to_dict()['trials']}"
+        time.sleep(0.02)
+
+def test_grid_expands_every_combination():
+    method, trials, options = expand({
+        'base': BASE,
+        'parameters': {'learning_rate': [0.1, 0.01], 'batch_size': {'values': [8, 16, 32]}, 'model_type': ['CNN']},
+    })
+    assert method == 'grid'
+    assert len(trials) == 6
+    params, config = trials[0]
+    assert params == {'learning_rate': 0.1, 'batch_size': 8, 'model_type': 'CNN'}
+    assert config == {'model_type': 'CNN', 'hyperparameters': {'epochs': 3, 'learning_rate': 0.1, 'batch_size': 8}}
+    assert BASE['hyperparameters'] == {'epochs': 3}
+    assert options['pruner'] is None and options['metric'] == 'val_loss'
+
+def test_random_sampling_is_seeded_and_in_range():
+    spec = {
+        'base': BASE, 'method': 'random', 'num_trials': 20, 'seed': 7,
+        'parameters': {'learning_rate': {'min': 1e-5, 'max': 1e-1, 'log': True}, 'batch_size': {'min': 4, 'max': 64}},
+    }
+    _, trials, _ = expand(spec)
+    assert [p for p, _ in trials] == [p for p, _ in expand(spec)[1]]
+    for params, _ in trials:
+        assert 1e-5 <= params['learning_rate'] <= 1e-1
+        assert isinstance(params['batch_size'], int) and 4 <= params['batch_size'] <= 64
+
+@pytest.mark.parametrize('spec', [
+    None,
+    {'parameters': {'learning_rate': [0.1]}},
+    {'base': BASE, 'parameters': {}},
+    {'base': BASE, 'method': 'bayes', 'parameters': {'learning_rate': [0.1]}},
+    {'base': BASE, 'parameters': {'learning_rate': {'min': 0.1, 'max': 1}}},
+    {'base': BASE, 'parameters': {'learning_rate': {'min': 0, 'max': 1, 'log': True}}},
+    {'base': BASE, 'parameters': {'batch_size': list(range(MAX_SWEEP_TRIALS + 1))}},
+    {'base': BASE, 'method': 'random', 'num_trials': 0, 'parameters': {'learning_rate': [0.1]}},
+    {'base': BASE, 'parameters': {'num_workers': [2, -1]}},
+    {'base': BASE, 'max_parallel': 0, 'parameters': {'learning_rate': [0.1]}},
+    {'base': BASE, 'early_stopping': {'reduction_factor': 1}, 'parameters': {'learning_rate': [0.1]}},
+    {'base': {'hyperparameters': {}}, 'parameters': {'learning_rate': [0.1]}},
+    {'base': BASE, 'parameters': {'model_type': ['CNN', 'neural_network']}},
+    {'base': BASE, 'parameters': {'epochs': [3, 0]}},
+])
+def test_invalid_specs(spec):
+    with pytest.raises(SweepError):
+        expand(spec)
+
+def test_halving_pruner_keeps_top_fraction_at_rungs():
+    pruner = SuccessiveHalvingPruner(min_epochs=1, reduction_factor=2)
+    assert [pruner.is_rung(e) for e in range(1, 6)] == [True, True, False, True, False]
+    assert pruner.should_continue(1, 0.5)
+    assert not pruner.should_continue(1, 0.9)
+    assert pruner.should_continue(1, 0.1)
+    assert pruner.should_continue(3, 100.0)
+    assert not pruner.should_continue(2, float('nan'))
+
+@pytest.fixture
+def sweeps(tmp_path):
+    store = ModelConfigStore(file_path=str(tmp_path / 'configs.jsonl'))
+    jobs = JobManager(jobs_dir=str(tmp_path / 'jobs'), max_concurrent=2, max_queued=10, script_generator=LR_SCRIPT)
+    yield SweepManager(store, jobs)
+    jobs.shutdown()
+    store.close()
+
+def test_sweep_runs_trials_with_bounded_parallelism(sweeps):
+    sweep = sweeps.create({
+        'base': BASE, 'max_parallel': 2,
+        'parameters': {'learning_rate': [0.4, 0.1, 0.3, 0.2]},
+    })
+    assert sum(1 for t in sweep.trials if t['job_id']) == 2
+    wait_for(sweep)
+    info = sweep.to_dict()
+    assert [t['state'] for t in info['trials']] == [SUCCEEDED] * 4
+    assert info['trials'][info['best_trial']]['params'] == {'learning_rate': 0.1}
+    assert info['trials'][1]['metric'] == pytest.approx(0.1 / 3)
+    assert [sweeps.store.get(t['config_id'])['hyperparameters']['learning_rate'] for t in info['trials']] == [0.4, 0.1, 0.3, 0.2]
+
+def test_halving_sweep_prunes_worse_trials(sweeps):
+    sweep = sweeps.create({
+        'base': BASE, 'max_parallel': 1,
+        'early_stopping': {'min_epochs': 1, 'reduction_factor': 2},
+        'parameters': {'learning_rate': [0.1, 0.4, 0.2, 0.05]},
+    })
+    wait_for(sweep)
+    assert [t['state'] for t in sweep.trials] == [SUCCEEDED, PRUNED, PRUNED, SUCCEEDED]
+    # 0.4 loses its first rung; 0.2 survives epoch 1 but loses the epoch 2 rung
+    assert [t['epoch'] for t in sweep.trials] == [3, 1, 2, 3]
+    assert sweep.to_dict()['best_trial'] == 3
+
+def test_cancel_sweep(sweeps):
+    sweeps.jobs.script_generator = lambda config: "import time\ntime.sleep(30)\n"
+    sweep = sweeps.create({'base': BASE, 'max_parallel': 1, 'parameters': {'learning_rate': [0.1, 0.2]}})
+    assert sweeps.cancel(sweep.id)
+    assert sweep.state == CANCELLED
+    assert sweep.trials[1]['state'] == CANCELLED
+    assert not sweeps.cancel(sweep.id)
+
+def test_finished_sweeps_are_pruned(sweeps):
+    sweeps.retention = 1
+    spec = {'base': BASE, 'parameters': {'learning_rate': [0.1]}}
+    first = sweeps.create(spec)
+    wait_for(first)
+    second = sweeps.create(dict(spec, parameters={'learning_rate': [0.2]}))
+    wait_for(second)
+    sweeps.shared.poll()
+    assert sweeps.prune() == 1
+    assert sweeps.get(first.id) is None
+    assert sweeps.get(second.id) is second
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+def test_sweep_api(client, monkeypatch):
+    from backend.jobs import job_manager
+    monkeypatch.setattr(job_manager, 'script_generator', LR_SCRIPT)
+    response = client.post('/api/sweeps', json={'base': BASE, 'parameters': {'learning_rate': [0.2, 0.1]}})
+    assert response.status_code == 202
+    sweep_id = response.get_json()['id']
+    deadline = time.time() + 30
+    while client.get(f'/api/sweeps/{sweep_id}').get_json()['state'] != COMPLETED:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    info = client.get(f'/api/sweeps/{sweep_id}').get_json()
+    assert info['best_trial'] == 1
+    assert client.post(f'/api/sweeps/{sweep_id}/cancel').status_code == 409
+    assert client.post('/api/sweeps', json={'base': BASE}).status_code == 400
+    assert client.get('/api/sweeps/missing').status_code == 404
+    assert client.post('/api/sweeps/missing/cancel').status_code == 404
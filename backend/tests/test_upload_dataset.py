@@ -23,6 +23,12 @@ def test_upload_invalid_type(client):
     assert rv.status_code == 400
     assert b'Invalid file type' in rv.data
 
+def test_upload_checks_the_stored_name(client):
+    data = {'file': create_test_file('../.npy')}
+    rv = client.post('/api/upload-dataset', data=data, content_type='multipart/form-data')
+    assert rv.status_code == 400
+    assert not os.path.exists(os.path.join(UPLOAD_FOLDER, 'npy'))
+
 def test_upload_valid_npy(client):
     data = {'file': create_test_file('test.npy')}
     rv = client.post('/api/upload-dataset', data=data, content_type='multipart/form-data')
@@ -51,3 +57,23 @@ def test_upload_valid_dicom(client):
     assert rv.status_code == 200
     assert b'File uploaded successfully' in rv.data
     os.remove(os.path.join(UPLOAD_FOLDER, 'good.dcm'))
+
+def test_upload_dicom_indexes_metadata(client, tmp_path):
+    from backend.tests.test_dicom_metadata import make_dicom
+    series_uid = '1.2.826.0.1.3680043.99.' + str(os.getpid())
+    for i in range(2):
+        path = tmp_path / f'slice{i}.dcm'
+        make_dicom(str(path), modality='MR', series_uid=series_uid, instance_number=i)
+        with open(path, 'rb') as f:
+            data = {'file': (io.BytesIO(f.read()), f'series_slice{i}.dcm')}
+        rv = client.post('/api/upload-dataset', data=data, content_type='multipart/form-data')
+        assert rv.status_code == 200
+        assert rv.json['metadata']['series_instance_uid'] == series_uid
+    rv = client.get(f'/api/datasets?series_instance_uid={series_uid}&modality=MR&limit=1')
+    assert rv.status_code == 200
+    assert [item['name'] for item in rv.json['items']] == ['series_slice0.dcm']
+    rv = client.get(f'/api/datasets?series_instance_uid={series_uid}&cursor={rv.json["next_cursor"]}')
+    assert [item['name'] for item in rv.json['items']] == ['series_slice1.dcm']
+    assert rv.json['next_cursor'] is None
+    for i in range(2):
+        os.remove(os.path.join(UPLOAD_FOLDER, f'series_slice{i}.dcm'))
@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+import uuid
+import pytest
+from backend.app import app, UPLOAD_FOLDER
+from backend.uploads import PARTIAL_DIR
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+def test_multipart_upload_reports_digest(client):
+    content = b'x' * 300000
+    data = {'file': (io.BytesIO(content), 'stream.npy')}
+    rv = client.post('/api/upload-dataset', data=data, content_type='multipart/form-data')
+    assert rv.status_code == 200
+    assert rv.json['size'] == len(content)
+    assert rv.json['sha256'] == hashlib.sha256(content).hexdigest()
+    with open(os.path.join(UPLOAD_FOLDER, 'stream.npy'), 'rb') as f:
+        assert f.read() == content
+    os.remove(os.path.join(UPLOAD_FOLDER, 'stream.npy'))
+    # Nothing is left behind in the staging directory
+    assert not [name for name in os.listdir(PARTIAL_DIR) if name.endswith('.part')]
+
+def test_multipart_upload_too_large(client):
+    old_limit = app.config['MAX_UPLOAD_SIZE']
+    app.config['MAX_UPLOAD_SIZE'] = 10
+    try:
+        data = {'file': (io.BytesIO(b'y' * 100), 'big.npy')}
+        rv = client.post('/api/upload', data=data, content_type='multipart/form-data')
+        assert rv.status_code == 413
+    finally:
+        app.config['MAX_UPLOAD_SIZE'] = old_limit
+    assert not os.path.exists(os.path.join(UPLOAD_FOLDER, 'big.npy'))
+    assert not [name for name in os.listdir(PARTIAL_DIR) if name.endswith('.part')]
+
+def test_resumable_upload_resumes_at_offset(client):
+    # Unique content so the upload is not short-circuited by earlier runs
+    content = uuid.uuid4().bytes + b'0123456789' * 1000
+    digest = hashlib.sha256(content).hexdigest()
+    rv = client.post('/api/uploads', json={'filename': 'resumed.npy', 'size': len(content), 'sha256': digest})
+    assert rv.status_code == 201
+    upload_id = rv.json['upload_id']
+    assert rv.json['offset'] == 0
+
+    rv = client.patch(f'/api/uploads/{upload_id}', data=content[:4000], headers={'Upload-Offset': '0'})
+    assert rv.json['offset'] == 4000
+    # A retry from the wrong offset is refused and told where to resume
+    rv = client.patch(f'/api/uploads/{upload_id}', data=content, headers={'Upload-Offset': '0'})
+    assert rv.status_code == 409
+    assert rv.json['offset'] == 4000
+    assert client.get(f'/api/uploads/{upload_id}').json['offset'] == 4000
+
+    rv = client.patch(f'/api/uploads/{upload_id}', data=content[4000:], headers={'Upload-Offset': '4000'})
+    assert rv.json['offset'] == len(content)
+    rv = client.post(f'/api/uploads/{upload_id}/complete')
+    assert rv.status_code == 201
+    assert rv.json['sha256'] == digest
+    with open(rv.json['path'], 'rb') as f:
+        assert f.read() == content
+    os.remove(rv.json['path'])
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+def test_resumable_upload_rejects_bad_digest(client):
+    rv = client.post('/api/uploads', json={'filename': 'bad.npy', 'sha256': '0' * 64})
+    upload_id = rv.json['upload_id']
+    client.patch(f'/api/uploads/{upload_id}', data=b'abc', headers={'Upload-Offset': '0'})
+    rv = client.post(f'/api/uploads/{upload_id}/complete')
+    assert rv.status_code == 422
+    assert not os.path.exists(os.path.join(UPLOAD_FOLDER, 'bad.npy'))
+
+def test_resumable_upload_beyond_declared_size(client):
+    rv = client.post('/api/uploads', json={'filename': 'small.npy', 'size': 2})
+    upload_id = rv.json['upload_id']
+    rv = client.patch(f'/api/uploads/{upload_id}', data=b'abc', headers={'Upload-Offset': '0'})
+    assert rv.status_code == 413
+    assert client.delete(f'/api/uploads/{upload_id}').status_code == 204
+
+def test_resumable_upload_unknown_id(client):
+    assert client.get('/api/uploads/not-an-id').status_code == 404
+    assert client.patch('/api/uploads/zzz', data=b'a', headers={'Upload-Offset': '0'}).status_code == 404
+
+def test_unknown_upload_ids_leave_no_lock_entries(tmp_path):
+    from backend.uploads import ResumableUploads, UploadError
+    uploads = ResumableUploads(str(tmp_path))
+    for upload_id in ('zzz', uuid.uuid4().hex):
+        with pytest.raises(UploadError):
+            uploads.append(upload_id, 0, io.BytesIO(b'a'))
+    upload_id = uploads.create('a.npy')['upload_id']
+    uploads.abort(upload_id)
+    with pytest.raises(UploadError):
+        uploads.abort(upload_id)
+    assert uploads._session_locks == {}
+
+def test_duplicate_upload_is_deduplicated(client):
+    content = b'duplicate dataset'
+    first = client.post('/api/upload-dataset', data={'file': (io.BytesIO(content), 'dup_a.npy')},
+                        content_type='multipart/form-data')
+    second = client.post('/api/upload-dataset', data={'file': (io.BytesIO(content), 'dup_b.npy')},
+                         content_type='multipart/form-data')
+    assert second.json['sha256'] == first.json['sha256']
+    assert second.json['deduplicated'] is True
+    for name in ('dup_a.npy', 'dup_b.npy'):
+        os.remove(os.path.join(UPLOAD_FOLDER, name))
+
+def test_pre_upload_hash_check(client):
+    content = b'known content for hash check'
+    digest = hashlib.sha256(content).hexdigest()
+    rv = client.post('/api/datasets/by-hash', json={'filename': 'known.npy', 'sha256': '1' * 64})
+    assert rv.status_code == 404
+    client.post('/api/upload-dataset', data={'file': (io.BytesIO(content), 'known.npy')},
+                content_type='multipart/form-data')
+    rv = client.post('/api/datasets/by-hash', json={'filename': 'known_copy.npy', 'sha256': digest})
+    assert rv.status_code == 200
+    assert rv.json['deduplicated'] is True
+    # Resumable uploads short-circuit the same way
+    rv = client.post('/api/uploads', json={'filename': 'known_again.npy', 'sha256': digest})
+    assert rv.status_code == 200
+    assert 'upload_id' not in rv.json
+    for name in ('known.npy', 'known_copy.npy', 'known_again.npy'):
+        os.remove(os.path.join(UPLOAD_FOLDER, name))
@@ -0,0 +1,279 @@
+# uploads.py
+"""
+Streaming upload handling.
+
+Multipart file parts are written straight into the upload directory in
+fixed-size chunks and hashed on the fly, instead of being spooled to a
+temporary file by Werkzeug and copied again by ``FileStorage.save``.
+Large files can also be sent as resumable chunked uploads: the client opens
+an upload, appends bytes at a given offset and asks where to resume after a
+dropped connection.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process only
+    fcntl = None
+
+from flask import current_app
+from flask.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 ** 3))
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), '../uploads'))
+# In-progress files live under the upload directory so finishing an upload is a rename.
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, '.partial')
+
+
+class IncomingFile:
+    """
+    Writable, readable file that hashes and size-checks everything written to
+    it. Used as the Werkzeug stream for multipart file parts.
+    """
+
+    def __init__(self, directory=PARTIAL_DIR, max_size=MAX_UPLOAD_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b', buffering=CHUNK_SIZE)
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.discard()
+            raise RequestEntityTooLarge()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def detach(self):
+        """
+        Close the file and hand ownership of it to the caller, who must move or
+        remove it. Returns ``{'path', 'size', 'sha256'}``.
+        """
+        self._file.close()
+        self.committed = True
+        return {'path': self.path, 'size': self.size, 'sha256': self.sha256}
+
+    def discard(self):
+        self._file.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        # Werkzeug closes request files on teardown; drop anything not committed.
+        if not self.committed:
+            self.discard()
+
+
+class StreamingRequest(Request):
+    """Request class that streams multipart file parts into ``IncomingFile``."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return IncomingFile(
+            current_app.config.get('UPLOAD_PARTIAL_DIR', PARTIAL_DIR),
+            current_app.config.get('MAX_UPLOAD_SIZE', MAX_UPLOAD_SIZE),
+        )
+
+
+def as_incoming(file_storage):
+    """Return the ``IncomingFile`` behind an uploaded ``FileStorage``, copying into one if needed."""
+    stream = file_storage.stream
+    if isinstance(stream, IncomingFile):
+        return stream
+    incoming = IncomingFile(
+        current_app.config.get('UPLOAD_PARTIAL_DIR', PARTIAL_DIR),
+        current_app.config.get('MAX_UPLOAD_SIZE', MAX_UPLOAD_SIZE),
+    )
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        incoming.write(chunk)
+    incoming.flush()
+    return incoming
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256
+
+
+class UploadError(Exception):
+    """Raised for invalid resumable upload operations; carries an HTTP status."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+class ResumableUploads:
+    """
+    Resumable chunked uploads kept under ``directory``.
+
+    Each upload has ``<id>.json`` metadata and an ``<id>.data`` file whose size
+    is the resume offset. Running SHA-256 state is kept in memory and rebuilt
+    from disk if the process restarted mid-upload, or if another server
+    process took the previous chunk; operations on one upload are serialized
+    across processes with an ``flock`` on its metadata file.
+    """
+
+    def __init__(self, directory=PARTIAL_DIR, max_size=MAX_UPLOAD_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._hashers = {}
+        self._session_locks = {}
+
+    def _paths(self, upload_id):
+        # Upload IDs are hex UUIDs; reject anything else before touching the filesystem.
+        try:
+            upload_id = uuid.UUID(hex=upload_id).hex
+        except (TypeError, ValueError):
+            raise UploadError("Unknown upload", 404)
+        base = os.path.join(self.directory, upload_id)
+        return base + '.json', base + '.data'
+
+    @contextmanager
+    def _session(self, upload_id):
+        # Validated first, so unknown or malformed IDs never get a lock entry
+        meta_path, _ = self._paths(upload_id)
+        if not os.path.exists(meta_path):
+            raise UploadError("Unknown upload", 404)
+        with self._lock:
+            lock = self._session_locks.setdefault(upload_id, threading.Lock())
+        with lock:
+            try:
+                f = open(meta_path)
+            except OSError:
+                # Finished or aborted while we waited
+                with self._lock:
+                    if self._session_locks.get(upload_id) is lock:
+                        del self._session_locks[upload_id]
+                raise UploadError("Unknown upload", 404)
+            with f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def create(self, filename, size=None, sha256=None):
+        if size is not None and size > self.max_size:
+            raise UploadError("Upload exceeds maximum size", 413)
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta_path, data_path = self._paths(upload_id)
+        open(data_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'filename': filename, 'size': size, 'sha256': sha256}, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        meta_path, data_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Unknown upload", 404)
+        meta['upload_id'] = upload_id
+        meta['offset'] = os.path.getsize(data_path)
+        return meta
+
+    def append(self, upload_id, offset, stream):
+        """Append ``stream`` at ``offset``; returns the new offset."""
+        with self._session(upload_id):
+            meta = self.status(upload_id)
+            if offset != meta['offset']:
+                raise UploadError("Offset mismatch", 409, offset=meta['offset'])
+            _, data_path = self._paths(upload_id)
+            sha256 = self._hasher(upload_id, data_path, meta['offset'])
+            limit = meta['size'] if meta['size'] is not None else self.max_size
+            written = meta['offset']
+            try:
+                with open(data_path, 'ab', buffering=CHUNK_SIZE) as f:
+                    # Whatever arrives before a disconnect is kept, so the client can resume.
+                    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                        if written + len(chunk) > limit:
+                            raise UploadError("Upload exceeds declared or maximum size", 413, offset=written)
+                        f.write(chunk)
+                        sha256.update(chunk)
+                        written += len(chunk)
+            finally:
+                with self._lock:
+                    self._hashers[upload_id] = (sha256, written)
+            return written
+
+    def complete(self, upload_id, ingest):
+        """
+        Verify size and digest, then pass the finished file to
+        ``ingest(path, filename, size, sha256)``, which takes ownership of it.
+        Returns whatever ``ingest`` returns.
+        """
+        with self._session(upload_id):
+            meta = self.status(upload_id)
+            meta_path, data_path = self._paths(upload_id)
+            if meta['size'] is not None and meta['offset'] != meta['size']:
+                raise UploadError("Upload incomplete", 409, offset=meta['offset'])
+            digest = self._hasher(upload_id, data_path, meta['offset']).hexdigest()
+            if meta['sha256'] and meta['sha256'].lower() != digest:
+                self._forget(upload_id, meta_path, data_path)
+                raise UploadError("SHA-256 mismatch", 422)
+            result = ingest(data_path, meta['filename'], meta['offset'], digest)
+            self._forget(upload_id, meta_path)
+            return result
+
+    def abort(self, upload_id):
+        with self._session(upload_id):
+            self.status(upload_id)
+            self._forget(upload_id, *self._paths(upload_id))
+
+    def _hasher(self, upload_id, data_path, offset):
+        """Running SHA-256 of the first ``offset`` bytes, rehashing from disk if unknown."""
+        with self._lock:
+            sha256, hashed = self._hashers.get(upload_id, (None, None))
+        if hashed != offset:
+            sha256 = hash_file(data_path)
+        return sha256
+
+    def _forget(self, upload_id, *paths):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+            self._session_locks.pop(upload_id, None)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,12 @@
+# wsgi.py
+"""
+WSGI entry point for production servers::
+
+    gunicorn backend.wsgi:app
+
+Server settings (workers, threads, timeouts, shutdown hooks) are in
+``gunicorn.conf.py`` at the repository root.
+"""
+from backend.app import create_app
+
+app = create_app()
@@ -1,14 +1,51 @@
 import React, { useEffect, useState } from "react";
 import axios from "axios";
 
-function TrainingProgress() {
+const FINISHED_STATES = ["succeeded", "failed", "cancelled"];
+const POLL_INTERVAL_MS = 2000;
+
+function TrainingProgress({ jobId }) {
   const [progress, setProgress] = useState(null);
 
   useEffect(() => {
-    axios.get("/api/training_progress")
+    if (jobId && typeof EventSource !== "undefined") {
+      let poll = null;
+      // Pushed updates; EventSource reconnects with Last-Event-ID on its own.
+      const source = new EventSource(`/api/jobs/${jobId}/events`);
+      source.addEventListener("progress", (event) => setProgress(JSON.parse(event.data)));
+      source.addEventListener("state", (event) => {
+        const { state } = JSON.parse(event.data);
+        if (FINISHED_STATES.includes(state)) {
+          source.close();
+        }
+      });
+      source.onerror = () => {
+        // A refused stream (503 when the server is at its stream limit or shutting
+        // down) is not retried by EventSource, so poll the job instead.
+        if (source.readyState !== EventSource.CLOSED || poll) {
+          return;
+        }
+        const fetchJob = () => axios.get(`/api/jobs/${jobId}`)
+          .then(res => {
+            setProgress(res.data.progress);
+            if (FINISHED_STATES.includes(res.data.state)) {
+              clearInterval(poll);
+            }
+          })
+          .catch(() => setProgress({ error: "Could not fetch training progress" }));
+        poll = setInterval(fetchJob, POLL_INTERVAL_MS);
+        fetchJob();
+      };
+      return () => {
+        source.close();
+        clearInterval(poll);
+      };
+    }
+    const url = jobId ? `/api/training_progress?job_id=${jobId}` : "/api/training_progress";
+    axios.get(url)
       .then(res => setProgress(res.data))
       .catch(() => setProgress({ error: "Could not fetch training progress" }));
-  }, []);
+  }, [jobId]);
 
   return (
     <div style={{ marginTop: 20 }}>
@@ -26,6 +26,31 @@ describe("TrainingProgress component", () => {
     expect(await screen.findByText(/Could not fetch training progress/i)).toBeInTheDocument();
   });
 
+  it("polls the job when its event stream is refused", async () => {
+    const sources = [];
+    global.EventSource = class {
+      static CLOSED = 2;
+      constructor(url) {
+        this.url = url;
+        this.readyState = 0;
+        sources.push(this);
+      }
+      addEventListener() {}
+      close() {
+        this.readyState = 2;
+      }
+    };
+    axios.get.mockResolvedValue({
+      data: { state: "running", progress: { current_epoch: 1, total_epochs: 3, loss: 0.5 } },
+    });
+    render(<TrainingProgress jobId="abc" />);
+    sources[0].readyState = 2;
+    sources[0].onerror();
+    expect(await screen.findByText(/Current Epoch: 1/i)).toBeInTheDocument();
+    expect(axios.get).toHaveBeenCalledWith("/api/jobs/abc");
+    delete global.EventSource;
+  });
+
   it("shows loading initially", () => {
     render(<TrainingProgress />);
     expect(screen.getByText(/Loading training progress/i)).toBeInTheDocument();
@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+"""
+Production server settings, read by ``gunicorn backend.wsgi:app`` when run
+from the repository root. Everything can be overridden from the environment.
+
+Workers are separate processes sharing state through the stores on disk
+(model configs, datasets, job and sweep snapshots). Each worker runs a pool
+of threads, so slow clients, uploads and SSE streams don't tie up a process.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# gthread workers heartbeat from their main loop, so this doesn't limit long uploads or streams
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = 5
+
+# Workers drain uploads and jobs on SIGTERM (see backend.lifecycle) before they are killed
+drain_timeout = float(os.getenv("DRAIN_TIMEOUT", 30))
+graceful_timeout = int(drain_timeout) + 15
+
+# Progress streams each hold a thread; leave the rest of the pool for other requests
+os.environ.setdefault("MAX_SSE_STREAMS", str(max(1, threads // 2)))
+
+# Split the training job slots between workers instead of giving each the full count
+os.environ.setdefault(
+    "MAX_CONCURRENT_JOBS", str(max(1, (os.cpu_count() or 2) // 2 // workers))
+)
+
+# Workers write metric snapshots here so any of them can serve /metrics for all
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "deepbuilder-metrics"))
+
+
+def on_starting(server):
+    # Counters of a previous server run must not carry over
+    shutil.rmtree(os.environ["METRICS_MULTIPROC_DIR"], ignore_errors=True)
+
+
+def post_worker_init(worker):
+    import signal
+    from backend.lifecycle import lifecycle
+
+    # gunicorn's own handler closes the listeners at once; drain first while still
+    # serving (writes get 503, streams end), then let the worker stop.
+    def handle_term(signum, frame):
+        lifecycle.drain_in_background(drain_timeout, then=lambda: setattr(worker, 'alive', False))
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    from backend.instrumentation import registry
+    from backend.lifecycle import lifecycle
+    from backend.model_config_store import model_config_store
+    # Waits for the SIGTERM drain, or drains now if the worker stopped for another reason
+    lifecycle.drain(drain_timeout)
+    registry.flush()
+    # Saves the dedupe key snapshot, so the next worker starts from it
+    model_config_store.close()
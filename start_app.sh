@@ -12,6 +12,10 @@ if [ -f package.json ]; then
   npm run build
 fi
 cd ..
+if [ -d frontend/build ]; then
+  echo "Precompressing frontend build..."
+  python3 -m backend.static_assets frontend/build
+fi
 
 # 2. Ensure backend dependencies are installed
 if [ -f requirements.txt ]; then
@@ -19,9 +23,14 @@ if [ -f requirements.txt ]; then
   pip install --user -r requirements.txt
 fi
 
-# 3. Start Flask backend (in background)
-echo "Starting Flask backend..."
-FLASK_APP=backend/app.py FLASK_ENV=development python3 backend/app.py &
+# 3. Start Flask backend (in background); DEEPBUILDER_ENV=production serves it with gunicorn
+if [ "$DEEPBUILDER_ENV" = "production" ]; then
+  echo "Starting backend with gunicorn (settings in gunicorn.conf.py)..."
+  gunicorn backend.wsgi:app &
+else
+  echo "Starting Flask backend..."
+  FLASK_APP=backend/app.py FLASK_ENV=development python3 backend/app.py &
+fi
 FLASK_PID=$!
 sleep 2
 